@@ -36,6 +36,54 @@ class Settings(BaseSettings):
     CLOUDINARY_API_SECRET: str
     
     GEMINI_API_KEY : str 
+
+    # Logging
+    LOG_FILE_PATH: Optional[str] = "log.txt"
+    LOG_MAX_MB: Optional[int] = 50  # rotate the log file past this size
+    LOG_BACKUPS: Optional[int] = 5
+    ACCESS_LOG_SAMPLE_RATE: Optional[float] = 1.0  # share of request logs kept
+    LOG_QUEUE_SIZE: Optional[int] = 100_000  # waiting records; more are dropped
+    METRICS_TOKEN: Optional[str] = None  # when set, /metrics needs this bearer token
+    # Aggregations slower than this are profiled (with explain); unset = off
+    AGG_PROFILE_THRESHOLD_MS: Optional[int] = None
+    AGG_PROFILE_SIZE_MB: Optional[int] = 16  # capped AggregationProfile collection
+
+    # PDF rendering (Playwright page pool)
+    PDF_POOL_SIZE: Optional[int] = 4
+    PDF_CONTEXT_MAX_RENDERS: Optional[int] = 100
+    PDF_CACHE_DIR: Optional[str] = None  # defaults to <tmp>/vyapar-pdf-cache
+    PDF_CACHE_MAX_MB: Optional[int] = 512
+    # Seconds a resolved (company, template) pair is reused before looking for overrides
+    PDF_TEMPLATE_TTL_SECONDS: Optional[int] = 300
+
+    # Outbound mail queue
+    MAIL_WORKERS: Optional[int] = 2
+    MAIL_BATCH_SIZE: Optional[int] = 20
+    MAIL_MAX_ATTEMPTS: Optional[int] = 5
+
+    # Seconds a token_version is trusted from the in-process cache
+    TOKEN_CACHE_TTL_SECONDS: Optional[int] = 30
+    # Seconds user settings / active company are reused across requests
+    REQUEST_CONTEXT_TTL_SECONDS: Optional[int] = 10
+    # Seconds listing totals are reused by cursor paginated listings
+    LISTING_TOTALS_TTL_SECONDS: Optional[int] = 60
+
+    # Password hashing
+    BCRYPT_ROUNDS: Optional[int] = 12
+    HASH_WORKERS: Optional[int] = 4  # bcrypt hashes running at once per process
+
+    # Image / file uploads
+    UPLOAD_BACKEND: Optional[str] = "cloudinary"  # cloudinary | local
+    UPLOAD_LOCAL_DIR: Optional[str] = None  # defaults to <tmp>/vyapar-uploads
+    UPLOAD_CONCURRENCY: Optional[int] = 4
+    UPLOAD_MAX_IMAGE_DIMENSION: Optional[int] = 1600
+
+    # Company deletion (background purge jobs)
+    PURGE_BATCH_SIZE: Optional[int] = 500  # vouchers / documents deleted per round
+
+    # Bill extraction (OCR process pool)
+    EXTRACTION_WORKERS: Optional[int] = None  # defaults to the CPU count
+
     # PHONE_NUMBER_ID: str
     # WHATSAPP_TOKEN: str
 
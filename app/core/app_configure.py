@@ -12,7 +12,25 @@ from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
 
 from app.Config import ENV_PROJECT
 from app.core.events import create_start_app_handler, create_stop_app_handler
-from app.utils.logging import loguru_sink_serializer
+from app.utils import metrics
+from app.utils.logging import log_sink
+
+
+_route_paths = {}
+
+
+def route_template(request: Request) -> str:
+    """
+    Path template of the matched route (/invoices/{id}) rather than the raw path,
+    so metric label counts stay bounded.
+    """
+    endpoint = request.scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    if not _route_paths:
+        for route in request.app.routes:
+            _route_paths.setdefault(getattr(route, "endpoint", None), route.path)
+    return _route_paths.get(endpoint, "unmatched")
 
 
 def configure_middleware(app: FastAPI):
@@ -44,11 +62,20 @@ def configure_middleware(app: FastAPI):
         Every response will have total time taken in millisecond for the API.
         """
         try:
-            start_time = time.time()
+            start_time = time.perf_counter()
             response = await call_next(request)
-            process_time = round(round((time.time() - start_time) * 100, 2))
+            elapsed = time.perf_counter() - start_time
+            process_time = round(elapsed * 1000, 2)
             response.headers["X-Process-Time"] = str(process_time) + " ms"
-            logger.info("{0} took time {1} ms", request.url.path, process_time)
+            metrics.http_request_duration.observe(
+                elapsed,
+                request.method,
+                route_template(request),
+                str(response.status_code),
+            )
+            logger.bind(access=True, extra={"elapsedTimeMs": process_time}).info(
+                "{0} took time {1} ms", request.url.path, process_time
+            )
             return response
         except Exception as e:
             logger.error(traceback.print_exc())
@@ -75,11 +102,8 @@ def configure_logging(app: FastAPI):
     """
     logger.remove()
     level_name = "DEBUG" if ENV_PROJECT.DEBUG else "INFO"
-    logger.add(
-        loguru_sink_serializer,
-        level=level_name,
-        enqueue=True,
-        serialize=True,
-    )
+    # log_sink queues records and writes them from its own thread, so loguru
+    # neither needs to enqueue nor serialize them
+    logger.add(log_sink, level=level_name)
     logging.getLogger("passlib").setLevel(logging.ERROR)
     app.logger = logger
@@ -3,9 +3,15 @@ import asyncio
 from fastapi import FastAPI
 from loguru import logger
 import sys
-from playwright.async_api import async_playwright
 from app.database import mongodb
+from app.database.indexes import sync_indexes
+from app.database.profiler import aggregation_profiler
 import app.core.services as browser_module
+from app.utils.templates import environment as pdf_templates
+from app.utils.mailer_module import mail_queue, template as mail_templates
+from app.database.repositories.extraction import extraction_tools
+from app.database.repositories.companyPurge import company_purge
+from app.database.repositories.token import refresh_token_repo, token_version_cache
 
 def create_start_app_handler(app: FastAPI) -> Callable:  # type: ignore
 
@@ -15,28 +21,35 @@ def create_start_app_handler(app: FastAPI) -> Callable:  # type: ignore
             if sys.platform.startswith("win"):
                 loop = asyncio.ProactorEventLoop()
                 asyncio.set_event_loop(loop)
-            # global shared_browser
-            playwright = await async_playwright().start()
-            browser_module.browser = await playwright.chromium.launch(
-                headless=True,
-                args=[
-                    "--no-sandbox",
-                    "--disable-setuid-sandbox",
-                    "--disable-gpu",
-                    "--disable-software-rasterizer",
-                    "--disable-dev-shm-usage",
-                    # "--use-gl=swiftshader",  # keep only if needed
-                ],
-            )
+            await browser_module.page_pool.start()
             if browser_module.browser is None:
                 raise RuntimeError("Browser failed to launch")
             elif browser_module.browser.is_connected() is False:
                 raise RuntimeError("Browser is not connected")
-            elif browser_module.browser is not None and browser_module.browser.is_connected() is True:
+            else:
                 logger.info("Browser Launched")
 
+            pdf_templates.precompile()
+            mail_templates.precompile()
+            logger.info("PDF & Mail Templates Compiled")
+
             await mongodb.client.admin.command("ping")
             logger.info("MongoDB Connected.")
+
+            await sync_indexes()
+            logger.info("Indexes Synced")
+
+            token_version_cache.start(refresh_token_repo.collection)
+            await aggregation_profiler.start()
+
+            await mail_queue.start()
+            logger.info("Mail Queue Started")
+
+            await extraction_tools.start()
+            logger.info("Extraction Pool Started")
+
+            await company_purge.start()
+            logger.info("Company Purge Started")
         except Exception as e:
             print("Error during startup:", e)
             logger.error("Error during startup:", e)
@@ -50,9 +63,15 @@ def create_stop_app_handler(app: FastAPI) -> Callable:  # type: ignore
     @logger.catch
     async def stop_app() -> None:
         try:
-            if browser_module.browser is not None:
-                await browser_module.browser.close()
-                logger.info("Browser Closed")
+            await browser_module.page_pool.stop()
+            logger.info("Browser Closed")
+            await mail_queue.stop()
+            logger.info("Mail Queue Stopped")
+            await extraction_tools.stop()
+            logger.info("Extraction Pool Stopped")
+            await company_purge.stop()
+            logger.info("Company Purge Stopped")
+            await token_version_cache.stop()
             await mongodb.client.close()
             logger.info("Closed MongoDB Connection")
         except Exception as e:
@@ -1,4 +1,165 @@
 # app/services/browser.py
-from playwright.async_api import Browser
+import asyncio
+import time
+from typing import List, Optional
+
+from loguru import logger
+from playwright.async_api import Browser, BrowserContext, Page, Playwright, async_playwright
+
+from app.Config import ENV_PROJECT
+from app.utils import metrics
 
 browser: Browser | None = None
+
+BROWSER_ARGS = [
+    "--no-sandbox",
+    "--disable-setuid-sandbox",
+    "--disable-gpu",
+    "--disable-software-rasterizer",
+    "--disable-dev-shm-usage",
+    # "--use-gl=swiftshader",  # keep only if needed
+]
+
+
+class PageSlot:
+    """A browser context with one reusable page, owned by a single render at a time."""
+
+    def __init__(self, owner: Browser, context: BrowserContext, page: Page):
+        self.owner = owner
+        self.context = context
+        self.page = page
+        self.renders = 0
+
+
+class PagePool:
+    """
+    Bounded pool of reusable Chromium contexts for PDF rendering.
+
+    At most `size` renders run at once (extra requests wait on the semaphore).
+    A context is recycled after `max_renders` renders, and the browser is
+    relaunched when it is found disconnected (crash, OOM kill, ...).
+    """
+
+    def __init__(self, size: int, max_renders: int):
+        self.size = size
+        self.max_renders = max_renders
+        self._playwright: Optional[Playwright] = None
+        self._idle: List[PageSlot] = []
+        self._semaphore = asyncio.Semaphore(size)
+        self._launch_lock = asyncio.Lock()
+        self.stats = {
+            "renders": 0,
+            "failures": 0,
+            "recycled": 0,
+            "restarts": 0,
+            "waiting": 0,
+            "in_use": 0,
+        }
+
+    async def start(self) -> Browser:
+        self._playwright = await async_playwright().start()
+        return await self._launch()
+
+    async def _launch(self) -> Browser:
+        global browser
+        browser = await self._playwright.chromium.launch(headless=True, args=BROWSER_ARGS)
+        self._idle.clear()
+        return browser
+
+    async def _ensure_browser(self) -> Browser:
+        if self._playwright is None:
+            raise RuntimeError("Browser is not ready yet")
+
+        async with self._launch_lock:
+            if browser is None or not browser.is_connected():
+                logger.warning("Browser disconnected, relaunching")
+                self.stats["restarts"] += 1
+                await self._launch()
+        return browser
+
+    async def _acquire(self) -> PageSlot:
+        current = await self._ensure_browser()
+        while self._idle:
+            slot = self._idle.pop()
+            if slot.owner is current:
+                return slot
+        context = await current.new_context()
+        return PageSlot(current, context, await context.new_page())
+
+    async def _release(self, slot: PageSlot, healthy: bool):
+        reusable = (
+            healthy
+            and slot.renders < self.max_renders
+            and slot.owner is browser
+            and slot.owner.is_connected()
+        )
+        if reusable:
+            self._idle.append(slot)
+            return
+
+        if healthy:
+            self.stats["recycled"] += 1
+        try:
+            await slot.context.close()
+        except Exception:
+            # the context died with its browser
+            pass
+
+    async def render_pdf(self, html: str, **options) -> bytes:
+        """Render `html` to PDF bytes; `options` are passed to `page.pdf()`."""
+        started = time.perf_counter()
+        self.stats["waiting"] += 1
+        async with self._semaphore:
+            self.stats["waiting"] -= 1
+            self.stats["in_use"] += 1
+            slot = None
+            healthy = False
+            try:
+                slot = await self._acquire()
+                await slot.page.set_content(html, wait_until="domcontentloaded")
+                pdf_bytes = await slot.page.pdf(**options)
+                slot.renders += 1
+                self.stats["renders"] += 1
+                metrics.pdf_renders.inc("success")
+                metrics.pdf_render_duration.observe(time.perf_counter() - started)
+                healthy = True
+                return pdf_bytes
+            except Exception:
+                self.stats["failures"] += 1
+                metrics.pdf_renders.inc("failure")
+                raise
+            finally:
+                self.stats["in_use"] -= 1
+                if slot is not None:
+                    await self._release(slot, healthy)
+
+    def metrics(self) -> dict:
+        return {
+            "size": self.size,
+            "max_renders": self.max_renders,
+            "idle": len(self._idle),
+            "connected": browser is not None and browser.is_connected(),
+            **self.stats,
+        }
+
+    async def stop(self):
+        global browser
+        for slot in self._idle:
+            try:
+                await slot.context.close()
+            except Exception:
+                pass
+        self._idle.clear()
+
+        if browser is not None:
+            await browser.close()
+            browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+page_pool = PagePool(
+    size=ENV_PROJECT.PDF_POOL_SIZE,
+    max_renders=ENV_PROJECT.PDF_CONTEXT_MAX_RENDERS,
+)
@@ -1,6 +1,7 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 
 from app.database.connections.db_abs import Database
+from app.utils.metrics import MongoCommandMetrics
 
 
 class MongoDB(Database):
@@ -9,5 +10,6 @@ class MongoDB(Database):
     def init_connection(self, uri):
         self.client = AsyncIOMotorClient(
             str(uri),
+            event_listeners=[MongoCommandMetrics()],
         )
         return self.client
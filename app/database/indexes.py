@@ -0,0 +1,90 @@
+"""------------------------------------------------------------------------------------------------------------------------
+                                                     INDEX MANAGER
+------------------------------------------------------------------------------------------------------------------------
+Every repository declares its indexes (`indexes` plus the unique_attributes one).
+At startup sync_indexes() compares them with what the server has, creates the
+missing ones and reports drift: declared indexes whose keys / options differ from
+the server's, and server indexes nobody declares. Drift is only reported, never
+dropped or rebuilt automatically.
+"""
+
+from typing import Dict, List, Tuple
+
+from loguru import logger
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+from app.database.repositories.crud.base_mongo_crud import BaseMongoDbCrud
+
+# Options that make two indexes with the same keys behave differently
+COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def index_spec(document: dict) -> Tuple:
+    keys = document["key"]
+    keys = keys.items() if hasattr(keys, "items") else keys
+    normalized = tuple(
+        (field, int(order) if isinstance(order, float) else order)
+        for field, order in keys
+    )
+    options = tuple((option, document.get(option)) for option in COMPARED_OPTIONS)
+    return normalized, options
+
+
+def declared_by_collection() -> Dict[str, Tuple[object, Dict[str, IndexModel]]]:
+    """Declared indexes per collection, merged over repositories sharing one."""
+    collections = {}
+    for repository in BaseMongoDbCrud.registry:
+        collection, declared = collections.setdefault(
+            repository.collection_name, (repository.collection, {})
+        )
+        for model in repository.declared_indexes():
+            declared.setdefault(model.document["name"], model)
+    return collections
+
+
+async def sync_indexes(create: bool = True) -> Dict[str, dict]:
+    report = {}
+    for name, (collection, declared) in declared_by_collection().items():
+        existing = await collection.index_information()
+
+        missing: List[str] = []
+        changed: List[str] = []
+        for index_name, model in declared.items():
+            if index_name not in existing:
+                missing.append(index_name)
+            elif index_spec(model.document) != index_spec(existing[index_name]):
+                changed.append(index_name)
+        undeclared = [
+            index_name
+            for index_name in existing
+            if index_name != "_id_" and index_name not in declared
+        ]
+
+        created, failed = [], {}
+        if create:
+            for index_name in missing:
+                try:
+                    await collection.create_indexes([declared[index_name]])
+                    created.append(index_name)
+                except OperationFailure as e:
+                    # e.g. a unique index over data that already has duplicates
+                    failed[index_name] = str(e)
+
+        report[name] = {
+            "declared": sorted(declared),
+            "created": created,
+            "missing": [index for index in missing if index not in created],
+            "changed": changed,
+            "undeclared": undeclared,
+            "failed": failed,
+        }
+
+        if created:
+            logger.info(f"{name}: created indexes {created}")
+        if changed or undeclared or failed:
+            logger.warning(
+                f"{name}: index drift changed={changed} undeclared={undeclared} "
+                f"failed={list(failed)}"
+            )
+    return report
@@ -22,6 +22,16 @@ class AccountingDB(Accounting):
     created_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
     updated_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
 
+    # Copied from the voucher on write (VoucherRepo.create_with_entries /
+    # update_with_entries) so reports can filter child rows by date directly
+    user_id: Optional[str] = None
+    company_id: Optional[str] = None
+    date: Optional[str] = None
+    voucher_type: Optional[str] = None
+    voucher_number: Optional[str] = None
+    party_name: Optional[str] = None
+    party_name_id: Optional[str] = None
+
 
 class AccountingCreate(BaseModel):
     vouchar_id: str
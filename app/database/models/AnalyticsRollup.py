@@ -0,0 +1,32 @@
+from pydantic import BaseModel, Field
+import datetime
+from typing import List
+
+
+class SoldQuantity(BaseModel):
+    item_id: str
+    qty: float = 0.0
+
+
+class AnalyticsDaily(BaseModel):
+    """Pre-aggregated Sales / Purchase figures of one company for one day."""
+
+    user_id: str
+    company_id: str
+    date: str  # YYYY-MM-DD
+    month: str  # YYYY-MM
+
+    sales_qty: float = 0.0
+    sales_value: float = 0.0
+    purchase_qty: float = 0.0
+    purchase_value: float = 0.0
+    # Sold quantity per item; COGS and gross profit are priced when read, at the
+    # items' current weighted average purchase cost, so every day uses the same rate
+    sold: List[SoldQuantity] = []
+
+
+# Database Schema
+class AnalyticsDailyDB(AnalyticsDaily):
+    analytics_id: str = Field(..., alias="_id")  # "<company_id>:<date>"
+    created_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
+    updated_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
@@ -0,0 +1,44 @@
+from pydantic import BaseModel, Field
+import datetime
+from typing import Optional
+
+
+class BalanceSnapshot(BaseModel):
+    """Movement totals of one stock item or ledger up to the end of a month.
+
+    Reports start from the latest valid snapshot before their window and only
+    scan the days after it, instead of summing every earlier voucher. Opening
+    figures stay on the stock item / ledger and are added by the report.
+    """
+
+    user_id: str
+    company_id: str
+    kind: str  # "stock" or "ledger"
+    entity_id: str  # stock item id or ledger id
+    month: str  # YYYY-MM, totals include its last day
+
+    # stock: Purchase / Sales Inventory rows, as summed by the stock timeline
+    purchase_qty: float = 0.0
+    purchase_value: float = 0.0
+    sales_qty: float = 0.0
+    sales_value: float = 0.0
+
+    # ledger: sum of its Accounting amounts
+    amount: float = 0.0
+
+
+# Database Schema
+class BalanceSnapshotDB(BalanceSnapshot):
+    snapshot_id: str = Field(..., alias="_id")  # "<kind>:<entity_id>:<month>"
+    created_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
+
+
+class BalanceSnapshotState(BaseModel):
+    """Per company: snapshots are valid up to and including `month`."""
+
+    user_id: str
+    company_id: str
+    kind: str = "state"
+    month: Optional[str] = None
+    # Bumped by every invalidation, so a build that raced one is not trusted
+    version: int = 0
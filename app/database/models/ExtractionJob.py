@@ -0,0 +1,27 @@
+from pydantic import BaseModel, Field
+import datetime
+from uuid import uuid4
+from typing import List, Optional
+
+
+class ExtractionJob(BaseModel):
+    """One uploaded bill going through text extraction / OCR and Gemini parsing."""
+
+    user_id: str  # only the uploader can read the job
+    filename: Optional[str] = None
+
+    status: str = "queued"  # queued | extracting | parsing | done | failed
+    method: Optional[str] = None  # text | ocr
+    pages_total: int = 0
+    pages_done: int = 0
+    pages: List[str] = []  # extracted text, one entry per page
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    finished_at: Optional[datetime.datetime] = None
+
+
+# Database Schema
+class ExtractionJobDB(ExtractionJob):
+    job_id: str = Field(default_factory=lambda: str(uuid4()), alias="_id")
+    created_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
+    updated_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
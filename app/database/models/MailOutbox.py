@@ -0,0 +1,29 @@
+from pydantic import BaseModel, Field
+import datetime
+from uuid import uuid4
+from typing import Optional
+
+
+class MailOutbox(BaseModel):
+    """An outbound email waiting in (or already through) the mail queue."""
+
+    subject: str
+    email: str
+    content: str
+    dedup_key: str  # identical messages still waiting are enqueued only once
+
+    status: str = "pending"  # pending | sending | sent | failed
+    attempts: int = 0
+    next_attempt_at: datetime.datetime = Field(
+        default_factory=lambda: datetime.datetime.now()
+    )
+    locked_at: Optional[datetime.datetime] = None
+    sent_at: Optional[datetime.datetime] = None
+    last_error: Optional[str] = None
+
+
+# Database Schema
+class MailOutboxDB(MailOutbox):
+    mail_id: str = Field(default_factory=lambda: str(uuid4()), alias="_id")
+    created_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
+    updated_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
@@ -0,0 +1,25 @@
+from pydantic import BaseModel, Field
+import datetime
+from uuid import uuid4
+from typing import Dict, Optional
+
+
+class PurgeJob(BaseModel):
+    """Background deletion of everything a company owns."""
+
+    user_id: str
+    company_id: str
+
+    status: str = "queued"  # queued | running | done | failed
+    stage: Optional[str] = None  # collection being emptied
+    deleted: Dict[str, int] = {}  # documents removed so far, per collection
+    attempts: int = 0  # runs started, > 1 after a resume
+    error: Optional[str] = None
+    finished_at: Optional[datetime.datetime] = None
+
+
+# Database Schema
+class PurgeJobDB(PurgeJob):
+    job_id: str = Field(default_factory=lambda: str(uuid4()), alias="_id")
+    created_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
+    updated_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
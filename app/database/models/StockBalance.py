@@ -0,0 +1,36 @@
+from pydantic import BaseModel, Field
+import datetime
+from typing import Optional
+
+
+class StockBalance(BaseModel):
+    """Materialized running totals of a single stock item.
+
+    The document is keyed by the stock item id, so listings can join it with a
+    plain `_id` lookup instead of re-aggregating every Inventory row.
+    """
+
+    user_id: str
+    company_id: str
+    item_id: str
+
+    # opening figures copied from the stock item
+    opening_balance: float = 0.0
+    opening_value: float = 0.0
+
+    # movement totals (Sales / Purchase vouchers only)
+    purchase_qty: float = 0.0
+    purchase_value: float = 0.0
+    sales_qty: float = 0.0
+    sales_value: float = 0.0
+    current_stock: float = 0.0
+
+    last_movement_date: Optional[str] = None
+    last_restock_date: Optional[str] = None
+
+
+# Database Schema
+class StockBalanceDB(StockBalance):
+    stock_balance_id: str = Field(..., alias="_id")
+    created_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
+    updated_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
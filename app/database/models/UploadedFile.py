@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field
+import datetime
+from typing import Optional
+
+
+class UploadedFile(BaseModel):
+    """A file already stored with the upload backend, found again by content hash."""
+
+    backend: str
+    url: str
+    public_id: str
+    format: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    bytes: Optional[int] = None
+
+
+# Database Schema
+class UploadedFileDB(UploadedFile):
+    digest: str = Field(alias="_id")  # "<backend>:<sha256 of the uploaded bytes>"
+    created_at: datetime.datetime = Field(default_factory=lambda: datetime.datetime.now())
@@ -0,0 +1,265 @@
+"""------------------------------------------------------------------------------------------------------------------------
+                                                 AGGREGATION PROFILER
+------------------------------------------------------------------------------------------------------------------------
+Opt-in (AGG_PROFILE_THRESHOLD_MS) timing of every `collection.aggregate(...)` made
+through a repository. Pipelines slower than the threshold are written to the
+capped AggregationProfile collection together with their explain("executionStats")
+output, so the admin summary can show which pipeline / stage / tenant is slow.
+"""
+
+import asyncio
+import datetime
+import json
+import sys
+import time
+from typing import Dict, List, Optional
+
+from loguru import logger
+from pymongo.errors import CollectionInvalid
+
+from app.Config import ENV_PROJECT
+
+PROFILE_COLLECTION = "AggregationProfile"
+
+# Stages that write; explain("executionStats") would run the write again
+WRITE_STAGES = ("$merge", "$out")
+
+
+def pipeline_shape(pipeline: List[dict]) -> str:
+    return ">".join(next(iter(stage), "?") for stage in pipeline)
+
+
+def read_part(pipeline: List[dict]) -> List[dict]:
+    """The pipeline without a final $merge / $out, safe to explain."""
+    if pipeline and next(iter(pipeline[-1]), None) in WRITE_STAGES:
+        return pipeline[:-1]
+    return pipeline
+
+
+def pipeline_tenant(pipeline: List[dict]) -> Dict[str, str]:
+    """user_id / company_id from the leading $match, when they are plain values."""
+    if not pipeline or "$match" not in pipeline[0]:
+        return {}
+    match = pipeline[0]["$match"]
+    return {
+        key: match[key]
+        for key in ("user_id", "company_id")
+        if isinstance(match.get(key), str)
+    }
+
+
+def explain_summary(explain: dict) -> dict:
+    """Docs / keys examined and the time each pipeline stage took, from executionStats."""
+    summary = {"docs_examined": 0, "keys_examined": 0, "stages": []}
+    pushed_down = "stages" not in explain  # the whole pipeline ran as one query
+    for stage in explain.get("stages", [explain]):
+        name = "$cursor" if pushed_down else next(iter(stage), "?")
+        stats = stage.get("executionStats") or stage.get(name, {}).get("executionStats")
+        if stats:
+            summary["docs_examined"] += stats.get("totalDocsExamined", 0)
+            summary["keys_examined"] += stats.get("totalKeysExamined", 0)
+        summary["stages"].append(
+            {
+                "stage": name,
+                "returned": stage.get("nReturned", (stats or {}).get("nReturned")),
+                "time_ms": stage.get(
+                    "executionTimeMillisEstimate",
+                    (stats or {}).get("executionTimeMillis"),
+                ),
+            }
+        )
+    return summary
+
+
+class ProfiledCursor:
+    """Wraps a Motor aggregation cursor and reports when it has been drained."""
+
+    def __init__(self, cursor, on_done):
+        self._cursor = cursor
+        self._on_done = on_done
+        self._started = time.perf_counter()
+        self._returned = 0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def __aiter__(self):
+        async for document in self._cursor:
+            self._returned += 1
+            yield document
+        self._on_done(time.perf_counter() - self._started, self._returned)
+
+    async def to_list(self, length=None):
+        documents = await self._cursor.to_list(length)
+        self._on_done(time.perf_counter() - self._started, len(documents))
+        return documents
+
+
+class ProfiledCollection:
+    """Motor collection proxy timing aggregate(); everything else passes through."""
+
+    def __init__(self, collection, profiler: "AggregationProfiler"):
+        self._collection = collection
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def __getitem__(self, name):
+        return self._collection[name]
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        caller = sys._getframe(1)
+        caller_name = getattr(caller.f_code, "co_qualname", caller.f_code.co_name)
+        cursor = self._collection.aggregate(pipeline, *args, **kwargs)
+        return ProfiledCursor(
+            cursor,
+            lambda seconds, returned: self._profiler.observe(
+                self._collection, pipeline, caller_name, seconds, returned
+            ),
+        )
+
+
+class AggregationProfiler:
+    EXPLAIN_INTERVAL = 60  # seconds between two explains of the same caller
+
+    def __init__(self, threshold_ms: Optional[int], size_mb: int):
+        self.threshold_ms = threshold_ms
+        self.size_mb = size_mb
+        self._database = None
+        self._last_explain: Dict[str, float] = {}
+        self._tasks = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms is not None
+
+    def wrap(self, collection):
+        if not self.enabled or collection.name == PROFILE_COLLECTION:
+            return collection
+        if self._database is None:
+            self._database = collection.database
+        return ProfiledCollection(collection, self)
+
+    @property
+    def store(self):
+        return self._database[PROFILE_COLLECTION]
+
+    async def start(self):
+        if not self.enabled or self._database is None:
+            return
+        try:
+            await self._database.create_collection(
+                PROFILE_COLLECTION, capped=True, size=self.size_mb * 1024 * 1024
+            )
+        except CollectionInvalid:
+            pass  # already there
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    def observe(self, collection, pipeline, caller: str, seconds: float, returned: int):
+        if seconds * 1000 < self.threshold_ms:
+            return
+        task = asyncio.get_running_loop().create_task(
+            self._record(collection, pipeline, caller, seconds, returned)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _record(self, collection, pipeline, caller, seconds, returned):
+        entry = {
+            "collection": collection.name,
+            "caller": caller,
+            "shape": pipeline_shape(pipeline),
+            **pipeline_tenant(pipeline),
+            "duration_ms": round(seconds * 1000, 2),
+            "returned": returned,
+            "created_at": datetime.datetime.now(),
+        }
+
+        # Explaining re-runs the pipeline, so only once in a while per caller
+        key = f"{collection.name}:{caller}"
+        now = time.monotonic()
+        if now - self._last_explain.get(key, 0) >= self.EXPLAIN_INTERVAL:
+            self._last_explain[key] = now
+            explained = read_part(pipeline)
+            if len(explained) < len(pipeline):
+                entry["explain_without"] = next(iter(pipeline[-1]))
+            try:
+                explain = await collection.database.command(
+                    {
+                        "explain": {
+                            "aggregate": collection.name,
+                            "pipeline": explained,
+                            "cursor": {},
+                        },
+                        "verbosity": "executionStats",
+                    }
+                )
+                entry.update(explain_summary(explain))
+                # As text: explain output has "$" prefixed keys Mongo may refuse
+                entry["explain"] = json.dumps(explain, default=str)
+            except Exception as e:
+                entry["explain_error"] = str(e)
+
+        try:
+            await self.store.insert_one(entry)
+        except Exception as e:
+            logger.warning(f"Aggregation profile not stored: {e}")
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    async def summary(self, limit: int = 20) -> List[dict]:
+        """Slow pipelines grouped by collection and caller, worst total time first."""
+        return await self.store.aggregate(
+            [
+                {
+                    "$group": {
+                        "_id": {"collection": "$collection", "caller": "$caller"},
+                        "shape": {"$last": "$shape"},
+                        "count": {"$sum": 1},
+                        "total_ms": {"$sum": "$duration_ms"},
+                        "avg_ms": {"$avg": "$duration_ms"},
+                        "max_ms": {"$max": "$duration_ms"},
+                        "avg_returned": {"$avg": "$returned"},
+                        "avg_docs_examined": {"$avg": "$docs_examined"},
+                        "tenants": {"$addToSet": "$company_id"},
+                        "last_stages": {"$last": "$stages"},
+                        "last_seen": {"$max": "$created_at"},
+                    }
+                },
+                {"$sort": {"total_ms": -1}},
+                {"$limit": limit},
+                {
+                    "$project": {
+                        "_id": 0,
+                        "collection": "$_id.collection",
+                        "caller": "$_id.caller",
+                        "shape": 1,
+                        "count": 1,
+                        "total_ms": 1,
+                        "avg_ms": 1,
+                        "max_ms": 1,
+                        "avg_returned": 1,
+                        "avg_docs_examined": 1,
+                        "tenants": {"$slice": ["$tenants", 10]},
+                        "last_stages": 1,
+                        "last_seen": 1,
+                    }
+                },
+            ]
+        ).to_list(None)
+
+    async def recent(self, limit: int = 20) -> List[dict]:
+        return (
+            await self.store.find({}, {"_id": 0})
+            .sort("$natural", -1)
+            .limit(limit)
+            .to_list(None)
+        )
+
+
+aggregation_profiler = AggregationProfiler(
+    threshold_ms=ENV_PROJECT.AGG_PROFILE_THRESHOLD_MS,
+    size_mb=ENV_PROJECT.AGG_PROFILE_SIZE_MB,
+)
@@ -1,9 +1,31 @@
+from typing import Dict
+
+from pymongo import IndexModel
+
 from app.Config import ENV_PROJECT
 from app.database.models.Inventory import InventoryItem, InventoryItemDB
 from .crud.base_mongo_crud import BaseMongoDbCrud
 
+# Only these voucher types move stock in reports and snapshots
+INWARD_TYPE = "Purchase"
+OUTWARD_TYPE = "Sales"
+
+
+def _summed(voucher_type: str, value: str) -> dict:
+    matches = {"$eq": ["$voucher_type", voucher_type]}
+    return {"$sum": {"$cond": [matches, {"$ifNull": [value, 0]}, 0]}}
+
 
 class InventoryRepo(BaseMongoDbCrud[InventoryItemDB]):
+    indexes = [
+        # $lookup target: rows of a voucher
+        IndexModel([("vouchar_id", 1)]),
+        # Movements of a stock item, and of a whole company, by date (copied
+        # from the voucher)
+        IndexModel([("item_id", 1), ("date", 1)]),
+        IndexModel([("user_id", 1), ("company_id", 1), ("date", 1)]),
+    ]
+
     def __init__(self):
         super().__init__(
             ENV_PROJECT.MONGO_DATABASE,
@@ -14,5 +36,36 @@ class InventoryRepo(BaseMongoDbCrud[InventoryItemDB]):
     async def new(self, sub: InventoryItem):
         return await self.save(InventoryItemDB(**sub.model_dump()))
 
+    async def movement_totals(
+        self, user_id: str, company_id: str, date: dict
+    ) -> Dict[str, dict]:
+        """
+        Purchase and sales quantity / value per item_id over the `date` range,
+        one scan of the (user_id, company_id, date) index.
+        """
+        pipeline = [
+            {
+                "$match": {
+                    "user_id": user_id,
+                    "company_id": company_id,
+                    "date": date,
+                    "voucher_type": {"$in": [INWARD_TYPE, OUTWARD_TYPE]},
+                }
+            },
+            {
+                "$group": {
+                    "_id": "$item_id",
+                    "purchase_qty": _summed(INWARD_TYPE, "$quantity"),
+                    "purchase_value": _summed(INWARD_TYPE, "$total_amount"),
+                    "sales_qty": _summed(OUTWARD_TYPE, "$quantity"),
+                    "sales_value": _summed(OUTWARD_TYPE, "$total_amount"),
+                }
+            },
+        ]
+        return {
+            row.pop("_id"): row
+            async for row in self.collection.aggregate(pipeline, allowDiskUse=True)
+        }
+
 
 inventory_repo = InventoryRepo()
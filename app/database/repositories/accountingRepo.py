@@ -1,4 +1,5 @@
 from fastapi import Depends
+from pymongo import IndexModel
 from app.Config import ENV_PROJECT
 from app.database.models.Accounting import Accounting, AccountingDB
 from app.oauth2 import get_current_user
@@ -13,11 +14,20 @@ from app.database.repositories.crud.base import (
     Page,
 )
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List
 import re
 
 
 class AccountingRepo(BaseMongoDbCrud[AccountingDB]):
+    indexes = [
+        # $lookup target: entries of a voucher
+        IndexModel([("vouchar_id", 1)]),
+        # A ledger's postings in statement order (date copied from the voucher)
+        IndexModel([("ledger_id", 1), ("date", 1), ("voucher_number", 1)]),
+        # Month-end ledger snapshots: one company's postings by date
+        IndexModel([("user_id", 1), ("company_id", 1), ("date", 1)]),
+    ]
+
     def __init__(self):
         super().__init__(
             ENV_PROJECT.MONGO_DATABASE,
@@ -28,5 +38,46 @@ class AccountingRepo(BaseMongoDbCrud[AccountingDB]):
     async def new(self, sub: Accounting):
         return await self.save(AccountingDB(**sub.model_dump()))
 
+    def postings(self, ledger_id: str, end_date: str = None, after: str = None):
+        """
+        A ledger's Accounting rows up to `end_date` (and past `after`, when
+        given) in date order, read straight off the (ledger_id, date,
+        voucher_number) index.
+        """
+        filter = {"ledger_id": ledger_id}
+        date = {}
+        if end_date:
+            date["$lte"] = end_date
+        if after:
+            date["$gt"] = after
+        if date:
+            filter["date"] = date
+        return self.find(
+            filter,
+            {
+                "_id": 0,
+                "vouchar_id": 1,
+                "amount": 1,
+                "date": 1,
+                "voucher_number": 1,
+                "voucher_type": 1,
+                "party_name": 1,
+            },
+            sort=[("date", 1), ("voucher_number", 1)],
+        )
+
+    async def ledger_totals(
+        self, user_id: str, company_id: str, date: dict
+    ) -> Dict[str, dict]:
+        """Sum of the amounts per ledger_id over the `date` range of one company."""
+        pipeline = [
+            {"$match": {"user_id": user_id, "company_id": company_id, "date": date}},
+            {"$group": {"_id": "$ledger_id", "amount": {"$sum": "$amount"}}},
+        ]
+        return {
+            row.pop("_id"): row
+            async for row in self.collection.aggregate(pipeline, allowDiskUse=True)
+        }
+
 
 accounting_repo = AccountingRepo()
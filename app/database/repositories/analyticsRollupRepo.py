@@ -0,0 +1,338 @@
+import asyncio
+import datetime
+from typing import Dict, Iterable, List, Union
+
+from app.Config import ENV_PROJECT
+from app.database.models.AnalyticsRollup import AnalyticsDailyDB
+from app.database.repositories.stockBalanceRepo import stock_balance_repo
+from .crud.base_mongo_crud import BaseMongoDbCrud
+
+
+def _sum_if(voucher_type: str, value):
+    return {"$sum": {"$cond": [{"$eq": ["$voucher_type", voucher_type]}, value, 0]}}
+
+
+def rollup_pipeline(match: dict, refreshed_at: datetime.datetime) -> List[dict]:
+    """
+    Aggregate Sales / Purchase vouchers matching `match` into one bucket per
+    company and day, and merge the buckets into AnalyticsDaily.
+
+    Line values carry their share of the voucher's additional charge (split by
+    quantity). Sold quantity is kept per item and only priced when read (see
+    AnalyticsRollupRepo.cost_rates), so a later purchase that moves an item's
+    average cost reprices every day alike instead of only the days refreshed
+    after it.
+    """
+    return [
+        {"$match": {**match, "voucher_type": {"$in": ["Sales", "Purchase"]}}},
+        {
+            "$lookup": {
+                "from": "Inventory",
+                "localField": "_id",
+                "foreignField": "vouchar_id",
+                "as": "items",
+            }
+        },
+        {"$addFields": {"total_qty": {"$sum": "$items.quantity"}}},
+        {"$unwind": "$items"},
+        {
+            "$addFields": {
+                "day": {"$substr": ["$date", 0, 10]},
+                "quantity": {"$ifNull": ["$items.quantity", 0]},
+                "adj_total_amount": {
+                    "$add": [
+                        {"$ifNull": ["$items.total_amount", 0]},
+                        {
+                            "$cond": [
+                                {
+                                    "$and": [
+                                        {"$gt": ["$total_qty", 0]},
+                                        {"$gt": ["$additional_charge", 0]},
+                                    ]
+                                },
+                                {
+                                    "$multiply": [
+                                        {"$divide": ["$additional_charge", "$total_qty"]},
+                                        "$items.quantity",
+                                    ]
+                                },
+                                0,
+                            ]
+                        },
+                    ]
+                },
+            }
+        },
+        {
+            "$group": {
+                "_id": {
+                    "company_id": "$company_id",
+                    "date": "$day",
+                    "item_id": "$items.item_id",
+                },
+                "user_id": {"$first": "$user_id"},
+                "sales_qty": _sum_if("Sales", "$quantity"),
+                "sales_value": _sum_if("Sales", "$adj_total_amount"),
+                "purchase_qty": _sum_if("Purchase", "$quantity"),
+                "purchase_value": _sum_if("Purchase", "$adj_total_amount"),
+            }
+        },
+        {
+            "$group": {
+                "_id": {"company_id": "$_id.company_id", "date": "$_id.date"},
+                "user_id": {"$first": "$user_id"},
+                "sales_qty": {"$sum": "$sales_qty"},
+                "sales_value": {"$sum": "$sales_value"},
+                "purchase_qty": {"$sum": "$purchase_qty"},
+                "purchase_value": {"$sum": "$purchase_value"},
+                "sold": {"$push": {"item_id": "$_id.item_id", "qty": "$sales_qty"}},
+            }
+        },
+        {
+            "$project": {
+                "_id": {"$concat": ["$_id.company_id", ":", "$_id.date"]},
+                "user_id": 1,
+                "company_id": "$_id.company_id",
+                "date": "$_id.date",
+                "month": {"$substr": ["$_id.date", 0, 7]},
+                "sales_qty": 1,
+                "sales_value": 1,
+                "purchase_qty": 1,
+                "purchase_value": 1,
+                "sold": {
+                    "$filter": {
+                        "input": "$sold",
+                        "cond": {"$gt": ["$$this.qty", 0]},
+                    }
+                },
+                "updated_at": refreshed_at,
+            }
+        },
+        {
+            "$merge": {
+                "into": "AnalyticsDaily",
+                "on": "_id",
+                "whenMatched": "merge",
+                "whenNotMatched": "insert",
+            }
+        },
+    ]
+
+
+class AnalyticsRollupRepo(BaseMongoDbCrud[AnalyticsDailyDB]):
+    def __init__(self):
+        super().__init__(
+            ENV_PROJECT.MONGO_DATABASE,
+            "AnalyticsDaily",
+            unique_attributes=["company_id", "date"],
+        )
+
+    async def _merge(self, voucher_match: dict, bucket_match: dict):
+        refreshed_at = datetime.datetime.now()
+
+        await self.client[self.database_name]["Voucher"].aggregate(
+            rollup_pipeline(voucher_match, refreshed_at)
+        ).to_list(None)
+
+        # Buckets whose vouchers are all gone were not rewritten by the merge.
+        stale = await self.collection.delete_many(
+            {**bucket_match, "updated_at": {"$lt": refreshed_at}}
+        )
+        await self.collection.update_many(
+            {**bucket_match, "created_at": {"$exists": False}},
+            {"$set": {"created_at": refreshed_at}},
+        )
+        return stale.deleted_count
+
+    async def refresh_days(self, user_id: str, company_id: str, dates: Iterable[str]):
+        """
+        Recompute the buckets of the given days for one company.
+        Called after every voucher write with the old and new voucher dates.
+        """
+        days = sorted({date[:10] for date in dates if date})
+        if not days:
+            return None
+
+        voucher_match = {
+            "user_id": user_id,
+            "company_id": company_id,
+            "$or": [{"date": {"$gte": day, "$lte": day + "\uffff"}} for day in days],
+        }
+        bucket_match = {"company_id": company_id, "date": {"$in": days}}
+        return await self._merge(voucher_match, bucket_match)
+
+    async def recompute(self, company_id: str = None):
+        """
+        Rebuild every bucket of one company, or of all companies when
+        company_id is None.
+        """
+        await self.ensure_indexes()
+
+        match = {"company_id": company_id} if company_id else {}
+        removed = await self._merge(match, match)
+        # Buckets used to store COGS priced at refresh time
+        await self.collection.update_many(
+            {**match, "cogs": {"$exists": True}},
+            {"$unset": {"cogs": "", "gross_profit": ""}},
+        )
+        return {"buckets": await self.count(match), "removed": removed}
+
+    async def cost_rates(self, user_id: str, company_id: str) -> Dict[str, float]:
+        """
+        Weighted average purchase cost (opening + purchases) of each stock item,
+        from StockBalance: the rate sold quantities are priced at.
+        """
+        rates = {}
+        async for balance in stock_balance_repo.collection.find(
+            {"user_id": user_id, "company_id": company_id},
+            {
+                "opening_balance": 1,
+                "opening_value": 1,
+                "purchase_qty": 1,
+                "purchase_value": 1,
+            },
+        ):
+            qty = (balance.get("opening_balance") or 0) + (
+                balance.get("purchase_qty") or 0
+            )
+            value = (balance.get("opening_value") or 0) + (
+                balance.get("purchase_value") or 0
+            )
+            rates[balance["_id"]] = value / qty if qty > 0 else 0
+        return rates
+
+    async def cogs(
+        self, match: dict, key: Union[str, dict], rates: Dict[str, float]
+    ) -> Dict[object, float]:
+        """
+        COGS of the buckets matching `match`, per value of the `key` expression
+        (e.g. "$month"), pricing their sold quantities at `rates`.
+        """
+        pipeline = [
+            {"$match": match},
+            {"$unwind": "$sold"},
+            {
+                "$group": {
+                    "_id": {"key": key, "item_id": "$sold.item_id"},
+                    "qty": {"$sum": "$sold.qty"},
+                }
+            },
+        ]
+        cogs = {}
+        async for row in self.collection.aggregate(pipeline):
+            rate = rates.get(row["_id"]["item_id"], 0)
+            key_value = row["_id"].get("key")
+            cogs[key_value] = cogs.get(key_value, 0) + row["qty"] * rate
+        return cogs
+
+    async def period_totals(
+        self,
+        user_id: str,
+        company_id: str,
+        start_date: str,
+        end_date: str,
+        period: str = "date",
+    ):
+        """
+        Sum the daily buckets between start_date and end_date (inclusive) per
+        `period` ("date" or "month"), in the shape the dashboard helpers expect.
+        """
+        match = {
+            "user_id": user_id,
+            "company_id": company_id,
+            "date": {"$gte": start_date, "$lte": end_date},
+        }
+        pipeline = [
+            {"$match": match},
+            {
+                "$group": {
+                    "_id": f"${period}",
+                    "total_purchase_qty": {"$sum": "$purchase_qty"},
+                    "total_purchase_val": {"$sum": "$purchase_value"},
+                    "total_sales_qty": {"$sum": "$sales_qty"},
+                    "total_sales_val": {"$sum": "$sales_value"},
+                }
+            },
+            {"$sort": {"_id": 1}},
+        ]
+        rows, rates = await asyncio.gather(
+            self.collection.aggregate(pipeline).to_list(None),
+            self.cost_rates(user_id, company_id),
+        )
+        cogs = await self.cogs(match, f"${period}", rates)
+
+        return [
+            {
+                "_id": row["_id"],
+                "total_purchase_qty": round(row["total_purchase_qty"], 2),
+                "total_purchase_val": round(row["total_purchase_val"], 2),
+                "total_sales_qty": round(row["total_sales_qty"], 2),
+                "total_sales_val": round(row["total_sales_val"], 2),
+                "gross_profit": round(
+                    row["total_sales_val"] - cogs.get(row["_id"], 0), 2
+                ),
+            }
+            for row in rows
+        ]
+
+    async def year_summary(
+        self, user_id: str, company_id: str, start_date: str, end_date: str
+    ):
+        """
+        Opening / closing stock value (at cost), purchases, sales and profit of
+        a financial year, from the buckets and the items' opening values.
+        """
+
+        def sum_when(condition: dict, value: str):
+            return {"$sum": {"$cond": [condition, value, 0]}}
+
+        before = {"$lt": ["$date", start_date]}
+        within = {"$gte": ["$date", start_date]}
+        match = {"user_id": user_id, "company_id": company_id, "date": {"$lte": end_date}}
+
+        totals, openings, rates = await asyncio.gather(
+            self.collection.aggregate(
+                [
+                    {"$match": match},
+                    {
+                        "$group": {
+                            "_id": None,
+                            "purchase_before": sum_when(before, "$purchase_value"),
+                            "purchase": sum_when(within, "$purchase_value"),
+                            "sales": sum_when(within, "$sales_value"),
+                        }
+                    },
+                ]
+            ).to_list(None),
+            stock_balance_repo.collection.aggregate(
+                [
+                    {"$match": {"user_id": user_id, "company_id": company_id}},
+                    {"$group": {"_id": None, "opening_value": {"$sum": "$opening_value"}}},
+                ]
+            ).to_list(None),
+            self.cost_rates(user_id, company_id),
+        )
+        # {True: COGS before the year, False: COGS within it}
+        cogs = await self.cogs(match, before, rates)
+
+        totals = totals[0] if totals else {}
+        stock_opening = openings[0]["opening_value"] if openings else 0
+
+        opening = stock_opening + totals.get("purchase_before", 0) - cogs.get(True, 0)
+        purchase = totals.get("purchase", 0)
+        sales = totals.get("sales", 0)
+        profit = sales - cogs.get(False, 0)
+        current = opening + purchase - cogs.get(False, 0)
+        profit_percent = profit / sales * 100 if sales != 0 else 0
+
+        return {
+            "opening": round(opening, 2),
+            "purchase": round(purchase, 2),
+            "sales": round(sales, 2),
+            "current": round(current, 2),
+            "profit": round(profit, 2),
+            "profit_percent": round(profit_percent, 2),
+        }
+
+
+analytics_rollup_repo = AnalyticsRollupRepo()
@@ -0,0 +1,298 @@
+import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from pymongo import IndexModel, ReplaceOne, ReturnDocument
+
+from app.Config import ENV_PROJECT
+from app.database.models.BalanceSnapshot import (
+    BalanceSnapshotDB,
+    BalanceSnapshotState,
+)
+from app.database.repositories.InventoryRepo import inventory_repo
+from app.database.repositories.accountingRepo import accounting_repo
+from .crud.base_mongo_crud import BaseMongoDbCrud
+
+STOCK = "stock"
+LEDGER = "ledger"
+STATE = "state"
+
+STOCK_FIELDS = ("purchase_qty", "purchase_value", "sales_qty", "sales_value")
+LEDGER_FIELDS = ("amount",)
+FIELDS = {STOCK: STOCK_FIELDS, LEDGER: LEDGER_FIELDS}
+
+
+def shift_month(month: str, months: int) -> str:
+    """'2024-12' shifted by 1 is '2025-01'."""
+    year, number = map(int, month.split("-"))
+    index = year * 12 + number - 1 + months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def month_range(month: str) -> dict:
+    """Dates (YYYY-MM-DD strings) falling in `month`."""
+    return {"$gte": f"{month}-01", "$lte": f"{month}-\uffff"}
+
+
+def after_month(month: str) -> str:
+    """Lower bound ($gt) of the dates after `month`."""
+    return f"{month}-\uffff"
+
+
+def state_id(company_id: str) -> str:
+    return f"{STATE}:{company_id}"
+
+
+class BalanceSnapshotRepo(BaseMongoDbCrud[BalanceSnapshotDB]):
+    """
+    BALANCE SNAPSHOTS
+    -----------------
+    Month-end movement totals per stock item and per ledger, cumulative from the
+    company's first voucher. A state document per company records the last month
+    whose snapshots are valid; months are built in order, each from the previous
+    one plus that month's rows, the first time a report needs them. A voucher
+    written with a date in a built month moves the state back before that month
+    (invalidate), and the months from there on are rebuilt on the next read.
+
+    - totals(kind, user_id, company_id, before_date, entity_id) -> (month, totals)
+    - invalidate(company_id, dates)
+    """
+
+    indexes = [IndexModel([("company_id", 1), ("kind", 1), ("month", 1)])]
+
+    def __init__(self):
+        super().__init__(ENV_PROJECT.MONGO_DATABASE, "BalanceSnapshot")
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    async def totals(
+        self,
+        kind: str,
+        user_id: str,
+        company_id: str,
+        before_date: str,
+        entity_id: str = None,
+    ) -> Tuple[Optional[str], Dict[str, dict]]:
+        """
+        The latest valid snapshot ending before `before_date`, building missing
+        months first: (its month, {entity_id: totals}), or (None, {}) when
+        there is none and the caller has to sum from the beginning.
+        """
+        if not before_date:
+            return None, {}
+
+        projection = {"entity_id": 1, **{field: 1 for field in FIELDS[kind]}}
+        # An invalidate() between ensure_through and the find may have deleted
+        # the month read: check the state is unchanged after it, retry once,
+        # then leave it to the caller's full scan.
+        for _ in range(2):
+            month, version = await self.ensure_through(
+                user_id, company_id, shift_month(before_date[:7], -1)
+            )
+            if month is None:
+                return None, {}
+
+            filter = {"company_id": company_id, "kind": kind, "month": month}
+            if entity_id is not None:
+                filter["entity_id"] = entity_id
+            totals = {
+                doc["entity_id"]: {field: doc.get(field, 0) for field in FIELDS[kind]}
+                async for doc in self.collection.find(filter, projection)
+            }
+
+            state = await self.collection.find_one(
+                {"_id": state_id(company_id)}, {"month": 1, "version": 1}
+            )
+            if (
+                state
+                and state.get("version") == version
+                and (state.get("month") or "") >= month
+            ):
+                return month, totals
+        return None, {}
+
+    async def invalidate(self, company_id: str, dates: Iterable[str]):
+        """
+        Called after every voucher write with the old and new voucher dates:
+        snapshots from the earliest of their months on are no longer valid.
+        """
+        months = sorted({date[:7] for date in dates if date})
+        if not months:
+            return None
+
+        # Delete first, then move the state back: moved back first, a report
+        # could rebuild a month under the new version and have it deleted here
+        # after its state check passed, and the month would then read empty.
+        deleted = await self.collection.delete_many(
+            {
+                "company_id": company_id,
+                "kind": {"$in": [STOCK, LEDGER]},
+                "month": {"$gte": months[0]},
+            }
+        )
+        # $min leaves a state that was never built (month None) alone
+        await self.collection.update_one(
+            {"_id": state_id(company_id)},
+            {
+                "$min": {"month": shift_month(months[0], -1)},
+                "$inc": {"version": 1},
+                "$set": {"updated_at": datetime.datetime.now()},
+            },
+        )
+        return deleted
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    async def ensure_through(
+        self, user_id: str, company_id: str, month: str
+    ) -> Tuple[Optional[str], int]:
+        """
+        Build the closed months up to `month` that are missing: (the latest
+        valid month not after it, the state version it is valid for). The month
+        is None when there is none yet or a concurrent invalidation got in.
+        """
+        state = await self._state(user_id, company_id)
+        valid = state.get("month")
+        if valid is not None and valid >= month:
+            return month, state["version"]
+
+        # Only months that are over are snapshotted
+        last_closed = shift_month(datetime.date.today().strftime("%Y-%m"), -1)
+        target = min(month, last_closed)
+
+        if valid is not None:
+            start = shift_month(valid, 1)
+        else:
+            start = await self._first_month(user_id, company_id)
+            if start is None:
+                return None, state["version"]
+
+        while start <= target:
+            await self._build_month(user_id, company_id, start)
+            # Only advance if no invalidation (or other builder) got in between
+            advanced = await self.collection.update_one(
+                {
+                    "_id": state["_id"],
+                    "version": state["version"],
+                    "month": valid,
+                },
+                {"$set": {"month": start, "updated_at": datetime.datetime.now()}},
+            )
+            if not advanced.modified_count:
+                # `valid` may have been deleted meanwhile
+                return None, state["version"]
+            valid, start = start, shift_month(start, 1)
+
+        return valid, state["version"]
+
+    async def rebuild(self, company_id: str = None) -> Dict[str, Optional[str]]:
+        """
+        Drop and rebuild every closed month of one company, or of all companies
+        when company_id is None. Reports build missing months on demand anyway;
+        this pre-builds them for existing data.
+        """
+        await self.ensure_indexes()
+
+        match = {"company_id": company_id} if company_id else {}
+        companies = await self.client[self.database_name]["Voucher"].aggregate(
+            [
+                {"$match": match},
+                {"$group": {"_id": {"user_id": "$user_id", "company_id": "$company_id"}}},
+            ]
+        ).to_list(None)
+
+        last_closed = shift_month(datetime.date.today().strftime("%Y-%m"), -1)
+        built = {}
+        for company in companies:
+            owner = company["_id"]
+            await self.collection.delete_many({"company_id": owner["company_id"]})
+            built[owner["company_id"]], _ = await self.ensure_through(
+                owner["user_id"], owner["company_id"], last_closed
+            )
+        return built
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    async def _state(self, user_id: str, company_id: str) -> dict:
+        state = BalanceSnapshotState(user_id=user_id, company_id=company_id)
+        return await self.collection.find_one_and_update(
+            {"_id": state_id(company_id)},
+            {"$setOnInsert": state.model_dump()},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _first_month(self, user_id: str, company_id: str) -> Optional[str]:
+        first = await self.client[self.database_name]["Voucher"].find_one(
+            {"user_id": user_id, "company_id": company_id, "date": {"$gt": ""}},
+            {"date": 1},
+            sort=[("date", 1)],
+        )
+        return first["date"][:7] if first else None
+
+    async def _build_month(self, user_id: str, company_id: str, month: str):
+        """Snapshots of `month`: those of the month before plus its own rows."""
+        previous = shift_month(month, -1)
+        carried = {STOCK: {}, LEDGER: {}}
+        async for doc in self.collection.find(
+            {
+                "company_id": company_id,
+                "kind": {"$in": [STOCK, LEDGER]},
+                "month": previous,
+            }
+        ):
+            carried[doc["kind"]][doc["entity_id"]] = {
+                field: doc.get(field, 0) for field in FIELDS[doc["kind"]]
+            }
+
+        moved = {
+            STOCK: await inventory_repo.movement_totals(
+                user_id, company_id, month_range(month)
+            ),
+            LEDGER: await accounting_repo.ledger_totals(
+                user_id, company_id, month_range(month)
+            ),
+        }
+
+        now = datetime.datetime.now()
+        operations = []
+        for kind, fields in FIELDS.items():
+            for entity_id in carried[kind].keys() | moved[kind].keys():
+                if not entity_id:
+                    continue
+                before = carried[kind].get(entity_id, {})
+                during = moved[kind].get(entity_id, {})
+                snapshot = BalanceSnapshotDB(
+                    _id=f"{kind}:{entity_id}:{month}",
+                    user_id=user_id,
+                    company_id=company_id,
+                    kind=kind,
+                    entity_id=entity_id,
+                    month=month,
+                    created_at=now,
+                    **{
+                        field: (before.get(field) or 0) + (during.get(field) or 0)
+                        for field in fields
+                    },
+                )
+                operations.append(
+                    ReplaceOne(
+                        {"_id": snapshot.snapshot_id},
+                        self.serializer(snapshot),
+                        upsert=True,
+                    )
+                )
+
+        # Leftovers of an earlier build (e.g. a since deleted voucher's ledger)
+        await self.collection.delete_many(
+            {
+                "company_id": company_id,
+                "kind": {"$in": [STOCK, LEDGER]},
+                "month": month,
+                "created_at": {"$lt": now},
+            }
+        )
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+
+balance_snapshot_repo = BalanceSnapshotRepo()
@@ -0,0 +1,197 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from loguru import logger
+
+from app.Config import ENV_PROJECT
+from app.database.repositories.CompanySettingsRepo import company_settings_repo
+from app.database.repositories.InventoryRepo import inventory_repo
+from app.database.repositories.UnitOMeasureRepo import units_repo
+from app.database.repositories.VoucharTypeRepo import vouchar_type_repo
+from app.database.repositories.accountingGroupRepo import accounting_group_repo
+from app.database.repositories.accountingRepo import accounting_repo
+from app.database.repositories.analyticsRollupRepo import analytics_rollup_repo
+from app.database.repositories.balanceSnapshotRepo import balance_snapshot_repo
+from app.database.repositories.categoryRepo import category_repo
+from app.database.repositories.companyRepo import company_repo
+from app.database.repositories.crud.cursor import listing_totals
+from app.database.repositories.inventoryGroupRepo import inventory_group_repo
+from app.database.repositories.ledgerRepo import ledger_repo
+from app.database.repositories.purgeJobRepo import purge_job_repo
+from app.database.repositories.stockBalanceRepo import stock_balance_repo
+from app.database.repositories.stockItemRepo import stock_item_repo
+from app.database.repositories.voucharCounterRepo import vouchar_counter_repo
+from app.database.repositories.voucharRepo import vouchar_repo
+from app.utils.pdf_cache import pdf_cache
+
+# Emptied after the vouchers (and their Accounting / Inventory rows), in order
+OWNED_REPOSITORIES = [
+    accounting_group_repo,
+    category_repo,
+    vouchar_counter_repo,
+    vouchar_type_repo,
+    inventory_group_repo,
+    ledger_repo,
+    stock_item_repo,
+    stock_balance_repo,
+    analytics_rollup_repo,
+    balance_snapshot_repo,
+    units_repo,
+    company_settings_repo,
+]
+
+OnBatch = Optional[Callable[[str, int], Awaitable]]
+
+
+async def delete_in_batches(
+    repository, match: dict, batch_size: int, on_batch: OnBatch = None
+) -> int:
+    """
+    Delete everything matching `match` a batch of ids at a time. Deleted rows
+    leave the match, so every round simply reads the first ids again.
+    """
+    deleted = 0
+    while True:
+        ids = (
+            await repository.collection.find(match, {"_id": 1})
+            .limit(batch_size)
+            .to_list(None)
+        )
+        if not ids:
+            return deleted
+        result = await repository.collection.delete_many(
+            {"_id": {"$in": [doc["_id"] for doc in ids]}}
+        )
+        deleted += result.deleted_count
+        if on_batch is not None:
+            await on_batch(repository.collection_name, result.deleted_count)
+
+
+async def delete_vouchers(match: dict, batch_size: int, on_batch: OnBatch = None) -> int:
+    """
+    Delete the vouchers matching `match` with their Accounting and Inventory
+    rows, children first: a batch interrupted half way is found again next time.
+    """
+    deleted = 0
+    while True:
+        ids = (
+            await vouchar_repo.collection.find(match, {"_id": 1})
+            .limit(batch_size)
+            .to_list(None)
+        )
+        if not ids:
+            return deleted
+        voucher_ids = [doc["_id"] for doc in ids]
+
+        accounting, inventory = await asyncio.gather(
+            accounting_repo.collection.delete_many({"vouchar_id": {"$in": voucher_ids}}),
+            inventory_repo.collection.delete_many({"vouchar_id": {"$in": voucher_ids}}),
+        )
+        vouchers = await vouchar_repo.collection.delete_many(
+            {"_id": {"$in": voucher_ids}}
+        )
+        deleted += vouchers.deleted_count
+
+        if on_batch is not None:
+            await on_batch(accounting_repo.collection_name, accounting.deleted_count)
+            await on_batch(inventory_repo.collection_name, inventory.deleted_count)
+            await on_batch(vouchar_repo.collection_name, vouchers.deleted_count)
+
+
+class CompanyPurge:
+    """
+    COMPANY PURGE
+    -------------
+    Deleting a company only hides it and queues a PurgeJob; a background worker
+    then streams the company's voucher ids (projection only) and removes its
+    data in batches of `batch_size`, recording progress on the job. Every step
+    is idempotent, so a job whose worker died is claimed again and resumed.
+
+    - start() / stop()
+    - submit(user_id, company_id) -> job_id
+    """
+
+    POLL_INTERVAL = 60  # seconds between checks for jobs left by a dead worker
+    MAX_ATTEMPTS = 5
+    MAX_BACKOFF = 60  # seconds, longest wait after a worker error
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._work())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def submit(self, user_id: str, company_id: str) -> str:
+        job = await purge_job_repo.create(user_id, company_id)
+        self._wakeup.set()
+        return job.job_id
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    async def _work(self) -> None:
+        backoff = 1
+        try:
+            while True:
+                try:
+                    job = await purge_job_repo.claim()
+                    if job is None:
+                        self._wakeup.clear()
+                        try:
+                            await asyncio.wait_for(
+                                self._wakeup.wait(), self.POLL_INTERVAL
+                            )
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await self._run(job)
+                    backoff = 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # e.g. the database is unreachable; a job claimed but not
+                    # finished is claimed again once its lock is stale
+                    logger.error(f"Purge worker error, retrying in {backoff}s: {e}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.MAX_BACKOFF)
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self, job: dict) -> None:
+        job_id = job["_id"]
+        match = {"user_id": job["user_id"], "company_id": job["company_id"]}
+
+        async def on_batch(stage: str, deleted: int):
+            await purge_job_repo.progress(job_id, stage, deleted)
+
+        try:
+            await delete_vouchers(match, self.batch_size, on_batch)
+            for repository in OWNED_REPOSITORIES:
+                await purge_job_repo.progress(job_id, repository.collection_name)
+                await delete_in_batches(repository, match, self.batch_size, on_batch)
+
+            await company_repo.deleteOne(
+                {"_id": job["company_id"], "user_id": job["user_id"]}
+            )
+            await purge_job_repo.complete(job_id)
+            logger.info(f"Company {job['company_id']} purged (job {job_id})")
+        except Exception as e:
+            logger.error(f"Purge job {job_id} failed: {e}")
+            await purge_job_repo.fail(
+                job_id, str(e), final=job["attempts"] >= self.MAX_ATTEMPTS
+            )
+        finally:
+            listing_totals.invalidate(job["company_id"])
+            await pdf_cache.invalidate_company(job["company_id"])
+
+
+company_purge = CompanyPurge(batch_size=ENV_PROJECT.PURGE_BATCH_SIZE)
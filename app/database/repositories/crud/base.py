@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Any, Generic, List, TypeVar, Union
+from typing import Any, Generic, List, Optional, TypeVar, Union
 from uuid import UUID
 
 from pydantic import BaseModel, model_validator, validator
@@ -23,6 +23,9 @@ class Sort(BaseModel):
 class Page(BaseModel):
     page: int = 1
     limit: int = 10
+    # Keyset mode: ignore `page`, continue after the `next` token of the last page
+    cursor: bool = False
+    after: Optional[str] = None
 
     @validator("page", "limit", pre=True, always=True)
     def default_values(cls, value):
@@ -61,6 +64,7 @@ class PageRequest(BaseModel):
 class Meta(Page):
     total: int
     unique: List[Any]
+    next: Optional[str] = None  # cursor of the following page, None on the last one
 
 
 class PaginatedResponse(BaseModel):
@@ -1,10 +1,19 @@
-from typing import List
+import inspect
+from typing import ClassVar, List
 
 import pymongo
 from motor.motor_asyncio import AsyncIOMotorClient
 
 from app.database import mongodb
+from app.database.profiler import aggregation_profiler
 from app.database.exceptions import DocumentAlreadyExist
+from app.database.repositories.crud.cursor import (
+    keyset_page,
+    keyset_stages,
+    listing_totals,
+    sort_key,
+    totals_key,
+)
 from app.database.repositories.crud.base import (
     ID,
     AsyncPagingAndSortingRepository,
@@ -13,6 +22,7 @@ from app.database.repositories.crud.base import (
     PaginatedResponse,
     T,
 )
+from app.utils.metrics import timed_repository_method
 
 
 def model_serializer(entity, id):
@@ -23,6 +33,19 @@ def model_serializer(entity, id):
 
 
 class BaseMongoDbCrud(AsyncPagingAndSortingRepository[T]):
+    # Indexes the repository's queries rely on, besides the unique_attributes one.
+    # Created and checked for drift at startup (app.database.indexes).
+    indexes: ClassVar[List[pymongo.IndexModel]] = []
+
+    # Every repository instance, so startup can reach all declared indexes
+    registry: ClassVar[List["BaseMongoDbCrud"]] = []
+
+    def __init_subclass__(cls, **kwargs):
+        """Time every public coroutine a repository defines (see /metrics)."""
+        super().__init_subclass__(**kwargs)
+        for name, method in list(vars(cls).items()):
+            if not name.startswith("_") and inspect.iscoroutinefunction(method):
+                setattr(cls, name, timed_repository_method(cls.__name__, method))
 
     def __init__(
         self,
@@ -37,15 +60,27 @@ class BaseMongoDbCrud(AsyncPagingAndSortingRepository[T]):
         self.client: AsyncIOMotorClient = conn  # type: ignore
         self.database_name = database_name
         self.collection_name = collection
-        self.collection = self.client[self.database_name][self.collection_name]
+        self.collection = aggregation_profiler.wrap(
+            self.client[self.database_name][self.collection_name]
+        )
         self.id = id
         self.serializer = lambda x: model_serializer(x, self.id)
         self.unique_attributes = unique_attributes
+        BaseMongoDbCrud.registry.append(self)
+
+    def declared_indexes(self) -> List[pymongo.IndexModel]:
+        declared = list(self.indexes)
         if self.unique_attributes:
             index_list = [
-                (attribute, pymongo.ASCENDING) for attribute in unique_attributes
+                (attribute, pymongo.ASCENDING) for attribute in self.unique_attributes
             ]
-            self.collection.create_index(index_list, unique=True)
+            declared.append(pymongo.IndexModel(index_list, unique=True))
+        return declared
+
+    async def ensure_indexes(self):
+        declared = self.declared_indexes()
+        if declared:
+            await self.collection.create_indexes(declared)
 
     async def findOne(
         self, filter: dict, projection: dict = {}, sort: list = [("_id", -1)]
@@ -59,12 +94,33 @@ class BaseMongoDbCrud(AsyncPagingAndSortingRepository[T]):
         result = await self.collection.find_one({self.id: id, **self.default_filter})
         return result
 
-    async def find(self):
-        result = await self.collection.find({}, {"_id": 1}).to_list(None)
-        ids = []
-        for num in result:
-            ids.append(num.get("_id"))
-        return ids
+    def find(
+        self,
+        filter: dict = {},
+        projection: dict = None,
+        sort: list = None,
+        limit: int = 0,
+        batch_size: int = None,
+        hint=None,
+    ):
+        """
+        Plain find cursor, no joins. Iterate it with `async for` to stream the
+        documents a batch at a time, or `await ....to_list(None)` to load them.
+        """
+        cursor = self.collection.find(
+            {**filter, **self.default_filter}, projection, limit=limit
+        )
+        if sort:
+            cursor = cursor.sort(sort)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        if hint is not None:
+            cursor = cursor.hint(hint)
+        return cursor
+
+    def read_stages(self) -> List[dict]:
+        """Stages findAll / findMany add after the $match; see LastLoginMixin."""
+        return []
 
     async def findAllById(self, ids: List[ID]) -> List[T]:
         cursor = self.collection.find({self.id: {"$in": ids}, **self.default_filter})
@@ -133,47 +189,14 @@ class BaseMongoDbCrud(AsyncPagingAndSortingRepository[T]):
     async def findAll(
         self, filter: dict, pagination: PageRequest, projection: dict = {}
     ) -> PaginatedResponse:
-        agg_query = [
-            {"$match": {**filter, **self.default_filter}},
-            {
-                "$lookup": {
-                    "from": "token",
-                    "localField": "_id",
-                    "foreignField": "user_id",
-                    "as": "token_data",
-                }
-            },
-            {
-                "$addFields": {
-                    "token_data": {
-                        "$cond": {
-                            "if": {"$eq": [{"$size": "$token_data"}, 0]},
-                            "then": [{"updated_at": ""}],
-                            "else": "$token_data",
-                        }
-                    }
-                }
-            },
-            {"$unwind": "$token_data"},
-            {
-                "$group": {
-                    "_id": "$_id",
-                    "Details": {"$first": "$$ROOT"},
-                    "lastLogin": {"$max": "$token_data.updated_at"},
-                }
-            },
-            {
-                "$replaceRoot": {
-                    "newRoot": {
-                        "$mergeObjects": ["$Details", {"lastLogin": "$lastLogin"}]
-                    }
-                }
-            },
-        ]
+        agg_query = [{"$match": {**filter, **self.default_filter}}, *self.read_stages()]
 
         if projection:
             agg_query.append({"$project": projection})
 
+        if pagination.paging.cursor:
+            return await self._find_all_after(filter, agg_query, pagination)
+
         agg_query.append(
             {
                 "$facet": {
@@ -196,9 +219,46 @@ class BaseMongoDbCrud(AsyncPagingAndSortingRepository[T]):
         docs = res[0]["docs"]
         count = res[0]["count"][0]["count"] if len(res[0]["count"]) > 0 else 0
         return PaginatedResponse(
-            docs=docs, meta=Meta(**pagination.paging.model_dump(), total=count)
+            docs=docs,
+            meta=Meta(**pagination.paging.model_dump(), total=count, unique=[]),
         )
 
+    async def _find_all_after(
+        self, filter: dict, agg_query: list, pagination: PageRequest
+    ) -> PaginatedResponse:
+        """findAll in keyset mode: seek past the cursor, count separately (cached)."""
+        order = int(pagination.sorting.sort_order.value)
+        sort = sort_key(pagination.sorting.sort_field, order, ["_id"])
+        limit = pagination.paging.limit
+
+        # Seek and cut the page right after the $match, before any read_stages;
+        # those may regroup the rows, hence the second $sort
+        agg_query[1:1] = [
+            *keyset_stages(sort, pagination.paging.after),
+            {"$limit": limit + 1},
+        ]
+        agg_query.append({"$sort": dict(sort)})
+        docs = [doc async for doc in self.collection.aggregate(agg_query)]
+        docs, next_cursor = keyset_page(docs, sort, limit)
+
+        totals = await listing_totals.get_or_compute(
+            filter.get("company_id"),
+            totals_key(self.collection_name, filter),
+            lambda: self._count_totals(filter),
+        )
+        return PaginatedResponse(
+            docs=docs,
+            meta=Meta(
+                **pagination.paging.model_dump(),
+                total=totals["count"],
+                unique=[],
+                next=next_cursor,
+            ),
+        )
+
+    async def _count_totals(self, filter: dict) -> dict:
+        return {"count": await self.count(filter)}
+
     async def update_one(self, filter: dict, update: dict):
         return await self.collection.update_one(filter, update)
 
@@ -209,44 +269,11 @@ class BaseMongoDbCrud(AsyncPagingAndSortingRepository[T]):
         await self.collection.find_one({"name": {"$regex": name}})
 
     async def findMany(self, filter: dict, projection: dict = {}):
-        agg_query = [
-            {"$match": {**filter, **self.default_filter}},
-            {
-                "$lookup": {
-                    "from": "token",
-                    "localField": "_id",
-                    "foreignField": "user_id",
-                    "as": "token_data",
-                }
-            },
-            {
-                "$addFields": {
-                    "token_data": {
-                        "$cond": {
-                            "if": {"$eq": [{"$size": "$token_data"}, 0]},
-                            "then": [{"updated_at": ""}],
-                            "else": "$token_data",
-                        }
-                    }
-                }
-            },
-            {"$unwind": "$token_data"},
-            {
-                "$group": {
-                    "_id": "$_id",
-                    "Details": {"$first": "$$ROOT"},
-                    "lastLogin": {"$max": "$token_data.updated_at"},
-                }
-            },
-            {
-                "$replaceRoot": {
-                    "newRoot": {
-                        "$mergeObjects": ["$Details", {"lastLogin": "$lastLogin"}]
-                    }
-                }
-            },
-        ]
+        stages = self.read_stages()
+        if not stages:
+            return await self.find(filter, projection or None).to_list(None)
 
+        agg_query = [{"$match": {**filter, **self.default_filter}}, *stages]
         if projection:
             agg_query.append({"$project": projection})
 
@@ -0,0 +1,125 @@
+"""------------------------------------------------------------------------------------------------------------------------
+                                                  CURSOR PAGINATION
+------------------------------------------------------------------------------------------------------------------------
+Keyset pagination for the listing endpoints. Instead of `$skip` the client sends
+back the opaque `after` token of the previous page: the sort key values of its
+last row, ending in a unique field, so the next page starts with a range match
+the index can seek to. Totals are counted separately and cached per company.
+"""
+
+import base64
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from bson import json_util
+
+import app.http_exception as http_exception
+from app.Config import ENV_PROJECT
+
+SortKey = List[Tuple[str, int]]
+
+
+def encode_cursor(values: list) -> str:
+    # Extended JSON keeps datetimes and numbers comparable after the round trip
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+
+def decode_cursor(token: str, size: int) -> list:
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(token.encode()))
+    except Exception:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise http_exception.BadRequestException(detail="Invalid pagination cursor.")
+    return values
+
+
+def keyset_filter(sort: SortKey, values: list) -> dict:
+    """
+    Rows strictly after `values` in `sort` order:
+    (a > x) or (a == x and b > y) or ... with nulls sorting lowest, as Mongo does.
+    """
+    clauses = []
+    for position, (field, direction) in enumerate(sort):
+        conditions = [{name: value} for (name, _), value in zip(sort, values[:position])]
+        value = values[position]
+        if value is None:
+            if direction < 0:
+                continue  # nothing sorts below null
+            conditions.append({field: {"$ne": None}})
+        elif direction > 0:
+            conditions.append({field: {"$gt": value}})
+        else:
+            conditions.append({"$or": [{field: {"$lt": value}}, {field: None}]})
+        clauses.append(conditions[0] if len(conditions) == 1 else {"$and": conditions})
+    return {"$or": clauses} if clauses else {"_id": {"$exists": False}}
+
+
+def keyset_stages(sort: SortKey, after: Optional[str]) -> List[dict]:
+    """$match on the cursor (when there is one) followed by the $sort."""
+    stages = []
+    if after:
+        stages.append({"$match": keyset_filter(sort, decode_cursor(after, len(sort)))})
+    stages.append({"$sort": dict(sort)})
+    return stages
+
+
+def keyset_page(
+    docs: List[dict], sort: SortKey, limit: int
+) -> Tuple[list, Optional[str]]:
+    """Split the `limit + 1` fetched rows into the page and the next cursor."""
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor([docs[-1].get(field) for field, _ in sort])
+
+
+def sort_key(field: str, order: int, tiebreakers: List[str]) -> SortKey:
+    """`field` first, then the tie breakers (the last one unique) in the same order."""
+    key = [(field, order)]
+    for tiebreaker in tiebreakers:
+        if tiebreaker != field:
+            key.append((tiebreaker, order))
+    return key
+
+
+class TotalsCache:
+    """
+    Listing totals (count, sums) per company and filter, kept for `ttl` seconds.
+    Writes that change a listing call invalidate(company_id); other workers see
+    the change once their entry expires.
+    """
+
+    def __init__(self, ttl: int, max_companies: int = 10000):
+        self.ttl = ttl
+        self.max_companies = max_companies
+        self._companies: "OrderedDict[str, dict]" = OrderedDict()
+
+    async def get_or_compute(
+        self, company_id: str, key: str, compute: Callable[[], Awaitable[dict]]
+    ) -> dict:
+        company_id = company_id or ""
+        entry = self._companies.get(company_id, {}).get(key)
+        if entry is not None and entry[0] >= time.monotonic():
+            return entry[1]
+
+        value = await compute()
+        self._companies.setdefault(company_id, {})[key] = (
+            time.monotonic() + self.ttl,
+            value,
+        )
+        self._companies.move_to_end(company_id)
+        while len(self._companies) > self.max_companies:
+            self._companies.popitem(last=False)
+        return value
+
+    def invalidate(self, company_id: str):
+        self._companies.pop(company_id or "", None)
+
+
+def totals_key(*parts) -> str:
+    return json_util.dumps(parts, sort_keys=True)
+
+
+listing_totals = TotalsCache(ttl=ENV_PROJECT.LISTING_TOTALS_TTL_SECONDS)
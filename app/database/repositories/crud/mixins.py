@@ -0,0 +1,30 @@
+from typing import List
+
+
+class LastLoginMixin:
+    """
+    Adds `lastLogin` (latest refresh token update) to the documents findAll and
+    findMany return. Only meant for the user repository, whose `_id` is the
+    token's `user_id`:
+
+        class userRepo(LastLoginMixin, BaseMongoDbCrud[UserDB]): ...
+    """
+
+    def read_stages(self) -> List[dict]:
+        return [
+            *super().read_stages(),
+            {
+                "$lookup": {
+                    "from": "token",
+                    "localField": "_id",
+                    "foreignField": "user_id",
+                    "as": "token_data",
+                }
+            },
+            {
+                "$addFields": {
+                    "lastLogin": {"$ifNull": [{"$max": "$token_data.updated_at"}, ""]}
+                }
+            },
+            {"$project": {"token_data": 0}},
+        ]
@@ -1,59 +1,34 @@
+import asyncio
 import json
-import cv2
-import fitz
-import numpy as np
-import pytesseract
+import multiprocessing
+import os
 import tempfile
-from uuid import uuid4
-from pdf2image import convert_from_path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from loguru import logger
+
 from app.Config import ENV_PROJECT
+from app.database.repositories.extractionJobRepo import extraction_job_repo
+from app.utils import metrics
+from app.utils.ocr import ocr_page, page_texts
 
 # import google
 # # from google import genai
 # from app.utils.openai import gemini
 # from google import genai
-pytesseract.pytesseract.tesseract_cmd = r"C:/Program Files/Tesseract-OCR/tesseract.exe"
-from app.Config import ENV_PROJECT
 
 import google.generativeai as genai
 
 genai.configure(api_key=ENV_PROJECT.GEMINI_API_KEY)
 model = genai.GenerativeModel("gemini-2.0-flash")
 
+# Less selectable text than this and the file is treated as a scan and OCR'd
+MIN_TEXT_LENGTH = 50
 
-class ExtractionTools:
-    async def text_extraction_for_scanned_and_selectable_file_for_json_format_through_gemini(
-        self, file
-    ):
-        input_token = 0
-        output_token = 0
-        extracted_text = ""
-
-        filename = file.filename
-        text_file_name = str(uuid4()) + filename.split("/")[-1]
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-            temp_file_content = await file.read()
-            temp_file.write(temp_file_content)
-            temp_file_path = temp_file.name
-
-        docs = fitz.open(temp_file_path)
-        for page_num in range(len(docs)):
-            data = docs[page_num].get_text("text")
-            extracted_text += data
-
-        if len(extracted_text) < 50:
-            extracted_text = ""
-            with open("./extract.txt", mode="w") as text_file:
-                images = convert_from_path(temp_file_path)
-                for i, image in enumerate(images):
-                    image = np.array(image)
-                    grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-                    text = pytesseract.image_to_string(grey)
-                    extracted_text += text
-                    text_file.write(f"{text_file_name} - Page No {i + 1}\n\n")
-                    text_file.write(text)
-                    text_file.write("\n\n")
-        prompt = f"""
+
+def build_prompt(extracted_text: str) -> str:
+    return f"""
         You are a billing parser that extracts the following information from a bill text into a JSON object. The bill can be either a sale or a purchase, but not both. If a field is not found, use "null". If the bill is a sale, fill the 'sale' object (using the Sale model fields) and set 'purchase' to null. If the bill is a purchase, fill the 'purchase' object (using the Purchase model fields) and set 'sale' to null. Use the following structure and field names:
 
         Output Format:
@@ -319,24 +294,126 @@ class ExtractionTools:
         Input Text:
         {extracted_text}
         """
-        response = model.generate_content(prompt)
-        content = response.text.strip()
-        if content.startswith("```json"):
-            content = content[len("```json") :].strip()
-        if content.endswith("```"):
-            content = content[: -len("```")].strip()
 
+
+def parse_response(content: str) -> Optional[dict]:
+    content = content.strip()
+    if content.startswith("```json"):
+        content = content[len("```json") :].strip()
+    if content.endswith("```"):
+        content = content[: -len("```")].strip()
+
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError as e:
+        logger.warning(f"[Gemini JSON Parse Error] {e}\n[Gemini Raw Content]:\n{content}")
+        return None
+
+
+class ExtractionTools:
+    """
+    EXTRACTION JOBS
+    ---------------
+    An upload is written to a temp file and answered with a job id straight away.
+    A background task then reads the text layer, OCRs scanned pages in parallel
+    on a process pool, asks Gemini for the bill JSON and stores progress and
+    result on the job document. The event loop itself only ever awaits.
+
+    - start() / stop()
+    - submit(file) -> job_id
+    """
+
+    def __init__(self, workers: Optional[int]):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks = set()
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    async def start(self) -> None:
+        await extraction_job_repo.fail_interrupted()
+        # spawn: forking a process that already runs Mongo / Playwright threads is unsafe
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    async def submit(self, file, user_id: str) -> str:
+        if self._pool is None:
+            raise RuntimeError("Extraction pool is not running")
+
+        content = await file.read()
+        path = await asyncio.to_thread(self._write_temp, content)
+        job = await extraction_job_repo.create(user_id, file.filename)
+
+        task = asyncio.create_task(self._run(job.job_id, path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job.job_id
+
+    @staticmethod
+    def _write_temp(content: bytes) -> str:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+            temp_file.write(content)
+            return temp_file.name
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    async def _run(self, job_id: str, path: str) -> None:
+        loop = asyncio.get_running_loop()
+        method = "text"
         try:
-            data = json.loads(content)
-        except json.JSONDecodeError as e:
-            print("[Gemini JSON Parse Error]", e)
-            print("[Gemini Raw Content]:\n", content)
-            # Optionally, you can raise a custom exception or return a structured error
-            data = None
+            pages = await loop.run_in_executor(self._pool, page_texts, path)
+
+            if len("".join(pages)) < MIN_TEXT_LENGTH:
+                method = "ocr"
+                await extraction_job_repo.started(job_id, method, [""] * len(pages))
+
+                async def ocr(index: int) -> str:
+                    text = await loop.run_in_executor(
+                        self._pool, ocr_page, path, index + 1
+                    )
+                    await extraction_job_repo.page_done(job_id, index, text)
+                    metrics.ocr_pages.inc()
+                    return text
+
+                pages = await asyncio.gather(*(ocr(index) for index in range(len(pages))))
+            else:
+                await extraction_job_repo.started(job_id, method, pages)
 
-        # print("Extracted Data :", data)
+            await extraction_job_repo.parsing(job_id)
+            prompt = build_prompt("".join(pages))
+            response = await asyncio.to_thread(model.generate_content, prompt)
 
-        # return data
+            data = parse_response(response.text)
+            if data is None:
+                await extraction_job_repo.fail(
+                    job_id, "Could not read the extracted bill data"
+                )
+                metrics.extraction_jobs.inc(method, "unparsed")
+            else:
+                await extraction_job_repo.complete(job_id, data)
+                metrics.extraction_jobs.inc(method, "done")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Extraction job {job_id} failed: {e}")
+            metrics.extraction_jobs.inc(method, "failed")
+            await extraction_job_repo.fail(job_id, str(e))
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
 
 
-extraction_tools = ExtractionTools()
+extraction_tools = ExtractionTools(workers=ENV_PROJECT.EXTRACTION_WORKERS)
@@ -0,0 +1,89 @@
+import datetime
+from typing import List
+
+from pymongo import IndexModel
+
+from app.Config import ENV_PROJECT
+from app.database.models.ExtractionJob import ExtractionJob, ExtractionJobDB
+from .crud.base_mongo_crud import BaseMongoDbCrud
+
+# Finished or not, a job and its extracted text are dropped after this long.
+JOB_TTL = datetime.timedelta(days=7)
+
+
+class ExtractionJobRepo(BaseMongoDbCrud[ExtractionJobDB]):
+    indexes = [
+        IndexModel([("created_at", 1)], expireAfterSeconds=int(JOB_TTL.total_seconds()))
+    ]
+
+    def __init__(self):
+        super().__init__(ENV_PROJECT.MONGO_DATABASE, "ExtractionJob")
+
+    async def _set(self, job_id: str, fields: dict):
+        fields["updated_at"] = datetime.datetime.now()
+        return await self.collection.update_one({"_id": job_id}, {"$set": fields})
+
+    async def create(self, user_id: str, filename: str) -> ExtractionJobDB:
+        job = ExtractionJobDB(
+            **ExtractionJob(user_id=user_id, filename=filename).model_dump()
+        )
+        await self.collection.insert_one(self.serializer(job))
+        return job
+
+    async def started(self, job_id: str, method: str, pages: List[str]):
+        """
+        Record the page count. For text PDFs `pages` already holds the text; for
+        scans it is a list of blanks filled in by page_done as OCR finishes.
+        """
+        return await self._set(
+            job_id,
+            {
+                "status": "extracting",
+                "method": method,
+                "pages_total": len(pages),
+                "pages_done": len(pages) if method == "text" else 0,
+                "pages": pages,
+            },
+        )
+
+    async def page_done(self, job_id: str, index: int, text: str):
+        return await self.collection.update_one(
+            {"_id": job_id},
+            {
+                "$set": {f"pages.{index}": text, "updated_at": datetime.datetime.now()},
+                "$inc": {"pages_done": 1},
+            },
+        )
+
+    async def parsing(self, job_id: str):
+        return await self._set(job_id, {"status": "parsing"})
+
+    async def complete(self, job_id: str, result: dict):
+        now = datetime.datetime.now()
+        return await self._set(
+            job_id, {"status": "done", "result": result, "finished_at": now}
+        )
+
+    async def fail(self, job_id: str, error: str):
+        now = datetime.datetime.now()
+        return await self._set(
+            job_id, {"status": "failed", "error": error, "finished_at": now}
+        )
+
+    async def fail_interrupted(self):
+        """Jobs still open at startup lost their worker when the process stopped."""
+        now = datetime.datetime.now()
+        return await self.collection.update_many(
+            {"status": {"$in": ["queued", "extracting", "parsing"]}},
+            {
+                "$set": {
+                    "status": "failed",
+                    "error": "Interrupted by a server restart, please upload again",
+                    "finished_at": now,
+                    "updated_at": now,
+                }
+            },
+        )
+
+
+extraction_job_repo = ExtractionJobRepo()
@@ -23,8 +23,22 @@ from app.database.repositories.crud.base import (
     Sort,
     Page,
 )
+import asyncio
 import re
 from datetime import datetime
+from .accountingRepo import accounting_repo
+from .balanceSnapshotRepo import LEDGER, after_month, balance_snapshot_repo
+from .crud.cursor import keyset_page, keyset_stages, listing_totals, sort_key, totals_key
+
+# Ledger fields the cursor listing can sort on before balances are joined
+CURSOR_SORT_FIELDS = {
+    "ledger_name",
+    "parent",
+    "mailing_pincode",
+    "mailing_state",
+    "opening_balance",
+    "created_at",
+}
 
 SUFFIXES = [
     "Traders",
@@ -221,6 +235,15 @@ class ledgerRepo(BaseMongoDbCrud[LedgerDB]):
             {"$project": {"state": "$_id", "_id": 0}},
         ]
 
+        if pagination.paging.cursor:
+            return await self._ledgers_after(
+                pipeline,
+                unique_states_pipeline,
+                sort_field_mapped,
+                sort_order_value,
+                pagination,
+            )
+
         res = [doc async for doc in self.collection.aggregate(pipeline)]
         states_res = [
             doc async for doc in self.collection.aggregate(unique_states_pipeline)
@@ -236,6 +259,56 @@ class ledgerRepo(BaseMongoDbCrud[LedgerDB]):
             ),
         )
 
+    async def _ledgers_after(
+        self,
+        pipeline: list,
+        unique_states_pipeline: list,
+        sort_field: str,
+        sort_order: int,
+        pagination: PageRequest,
+    ):
+        """
+        viewAllledgers in keyset mode, reusing the stages of its offset pipeline
+        (two $match, balance joins, $sort, $facet). Only the rows of the page get
+        their balances joined; count and states come from the totals cache.
+        """
+        matches, joins = pipeline[:2], pipeline[2:-2]
+        if sort_field not in CURSOR_SORT_FIELDS:
+            sort_field = "ledger_name"
+        key = sort_key(sort_field, sort_order, ["_id"])
+        limit = pagination.paging.limit
+
+        stages = [*matches, *keyset_stages(key, pagination.paging.after)]
+        stages += [{"$limit": limit + 1}, *joins]
+        docs = [doc async for doc in self.collection.aggregate(stages)]
+        docs, next_cursor = keyset_page(docs, key, limit)
+
+        async def compute_totals():
+            count, states = await asyncio.gather(
+                self.collection.aggregate([*matches, {"$count": "count"}]).to_list(None),
+                self.collection.aggregate(unique_states_pipeline).to_list(None),
+            )
+            return {
+                "count": count[0]["count"] if count else 0,
+                "unique": [entry["state"] for entry in states],
+            }
+
+        tenant = matches[0]["$match"]
+        totals = await listing_totals.get_or_compute(
+            tenant["company_id"],
+            totals_key(self.collection_name, tenant, matches[1]["$match"]),
+            compute_totals,
+        )
+        return PaginatedResponse(
+            docs=docs,
+            meta=Meta(
+                **pagination.paging.model_dump(),
+                total=totals["count"],
+                unique=totals["unique"],
+                next=next_cursor,
+            ),
+        )
+
     def generate_name_suggestions(
         self, name: str, existing_names: set = None, count: int = 10
     ) -> list:
@@ -277,259 +350,134 @@ class ledgerRepo(BaseMongoDbCrud[LedgerDB]):
     ):
         start_date = start_date[:10]
         end_date = end_date[:10]
+        # Accounting rows carry their voucher's user, company, date, type and
+        # number, so the ledger's postings are filtered and sorted directly
         filter_params = {
-            "_id": ledger_id,
+            "ledger_id": ledger_id,
             "company_id": company_id,
             "user_id": current_user.user_id,
         }
+        if type not in ["", None]:
+            filter_params["voucher_type"] = type
+        if start_date and end_date:
+            filter_params["date"] = {"$gte": start_date, "$lte": end_date}
 
         sort_options = {
-            "voucher_number_asc": [("accounts.voucher_number", 1)],
-            "voucher_number_desc": [("accounts.voucher_number", -1)],
-            "date_asc": [("accounts.date", 1)],
-            "date_desc": [("accounts.date", -1)],
+            "voucher_number_asc": [("voucher_number", 1)],
+            "voucher_number_desc": [("voucher_number", -1)],
+            "date_asc": [("date", 1)],
+            "date_desc": [("date", -1)],
         }
 
         sort_key = f"{sort.sort_field}_{'asc' if sort.sort_order == SortingOrder.ASC else 'desc'}"
 
-        primary_sort = sort_options.get(sort_key, [("accounts.date", -1)])
+        primary_sort = sort_options.get(sort_key, [("date", -1)])
 
-        if primary_sort[0][0] != "accounts.voucher_number":
-            sort_stage = dict(primary_sort + [("accounts.voucher_number", -1)])
+        if primary_sort[0][0] != "voucher_number":
+            sort_stage = dict(primary_sort + [("voucher_number", -1)])
         else:
             sort_stage = dict(primary_sort)
 
-        pipeline = [
-            {"$match": filter_params},
+        # The counter ledger of each posting: the first row of the same voucher
+        # booked to another ledger
+        customer_stages = [
             {
                 "$lookup": {
                     "from": "Accounting",
-                    "localField": "_id",
-                    "foreignField": "ledger_id",
-                    "as": "accounts",
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "Voucher",
-                    "localField": "accounts.vouchar_id",
-                    "foreignField": "_id",
-                    "as": "vouchars",
+                    "let": {"vouchar_id": "$vouchar_id"},
+                    "pipeline": [
+                        {
+                            "$match": {
+                                "$expr": {
+                                    "$and": [
+                                        {"$eq": ["$vouchar_id", "$$vouchar_id"]},
+                                        {"$ne": ["$ledger_id", ledger_id]},
+                                    ]
+                                }
+                            }
+                        },
+                        {"$limit": 1},
+                        {"$project": {"_id": 0, "ledger": 1}},
+                    ],
+                    "as": "other_account",
                 }
             },
-            {
-                "$lookup": {
-                    "from": "Accounting",
-                    "localField": "vouchars._id",
-                    "foreignField": "vouchar_id",
-                    "as": "account_details",
-                },
-            },
             {
                 "$addFields": {
-                    "accounts": {
-                        "$map": {
-                            "input": "$accounts",
-                            "as": "account",
-                            "in": {
-                                "amount": "$$account.amount",
-                                "is_deemed_positive": {
-                                    "$cond": [
-                                        {"$lt": ["$$account.amount", 0]},
-                                        True,
-                                        False,
-                                    ]
-                                },
-                                "vouchar_id": "$$account.vouchar_id",
-                                "date": {
-                                    "$arrayElemAt": [
-                                        "$vouchars.date",
-                                        {
-                                            "$indexOfArray": [
-                                                "$vouchars._id",
-                                                "$$account.vouchar_id",
-                                            ]
-                                        },
-                                    ]
-                                },
-                                "status": {
-                                    "$arrayElemAt": [
-                                        "$vouchars.status",
-                                        {
-                                            "$indexOfArray": [
-                                                "$vouchars._id",
-                                                "$$account.vouchar_id",
-                                            ]
-                                        },
-                                    ]
-                                },
-                                "voucher_number": {
-                                    "$arrayElemAt": [
-                                        "$vouchars.voucher_number",
-                                        {
-                                            "$indexOfArray": [
-                                                "$vouchars._id",
-                                                "$$account.vouchar_id",
-                                            ]
-                                        },
-                                    ]
-                                },
-                                "voucher_type": {
-                                    "$arrayElemAt": [
-                                        "$vouchars.voucher_type",
-                                        {
-                                            "$indexOfArray": [
-                                                "$vouchars._id",
-                                                "$$account.vouchar_id",
-                                            ]
-                                        },
-                                    ]
-                                },
-                                "narration": {
-                                    "$arrayElemAt": [
-                                        "$vouchars.narration",
-                                        {
-                                            "$indexOfArray": [
-                                                "$vouchars._id",
-                                                "$$account.vouchar_id",
-                                            ]
-                                        },
-                                    ]
-                                },
-                                "reference_date": {
-                                    "$arrayElemAt": [
-                                        "$vouchars.reference_date",
-                                        {
-                                            "$indexOfArray": [
-                                                "$vouchars._id",
-                                                "$$account.vouchar_id",
-                                            ]
-                                        },
-                                    ]
-                                },
-                                "reference_number": {
-                                    "$arrayElemAt": [
-                                        "$vouchars.reference_number",
-                                        {
-                                            "$indexOfArray": [
-                                                "$vouchars._id",
-                                                "$$account.vouchar_id",
-                                            ]
-                                        },
-                                    ]
-                                },
-                                "place_of_supply": {
-                                    "$arrayElemAt": [
-                                        "$vouchars.place_of_supply",
-                                        {
-                                            "$indexOfArray": [
-                                                "$vouchars._id",
-                                                "$$account.vouchar_id",
-                                            ]
-                                        },
-                                    ]
-                                },
-                                "customer": {
-                                    "$let": {
-                                        "vars": {
-                                            "other_account": {
-                                                "$arrayElemAt": [
-                                                    {
-                                                        "$filter": {
-                                                            "input": "$account_details",
-                                                            "as": "ad",
-                                                            "cond": {
-                                                                "$and": [
-                                                                    {
-                                                                        "$eq": [
-                                                                            "$$ad.vouchar_id",
-                                                                            "$$account.vouchar_id",
-                                                                        ]
-                                                                    },
-                                                                    {
-                                                                        "$ne": [
-                                                                            "$$ad.ledger_id",
-                                                                            "$$account.ledger_id",
-                                                                        ]
-                                                                    },
-                                                                ]
-                                                            },
-                                                        }
-                                                    },
-                                                    0,
-                                                ]
-                                            }
-                                        },
-                                        "in": {"$ifNull": ["$$other_account.ledger", ""]},
-                                    }
-                                },
-                            },
-                        }
+                    "customer": {
+                        "$ifNull": [{"$arrayElemAt": ["$other_account.ledger", 0]}, ""]
                     }
                 }
             },
+        ]
+
+        # Voucher fields that are not copied onto the rows, joined for the page only
+        voucher_stages = [
             {
-                "$addFields": {
-                    "total_amount": {"$round": [{"$sum": "$accounts.amount"}, 2]}
-                },
-            },
-            {
-                "$unwind": "$accounts",
+                "$lookup": {
+                    "from": "Voucher",
+                    "localField": "vouchar_id",
+                    "foreignField": "_id",
+                    "as": "voucher",
+                }
             },
+            {"$unwind": {"path": "$voucher", "preserveNullAndEmptyArrays": True}},
             {
                 "$project": {
-                    "accounts": 1,
-                },
-            },
-            {
-                "$match": {
-                    **(
-                        {
-                            "$or": [
-                                {
-                                    "accounts.voucher_number": {
-                                        "$regex": f"{search}",
-                                        "$options": "i",
-                                    }
-                                },
-                                {
-                                    "accounts.customer": {
-                                        "$regex": f"{search}",
-                                        "$options": "i",
-                                    }
-                                },
-                            ]
-                        }
-                        if search not in ["", None]
-                        else {}
-                    ),
-                    **({"accounts.voucher_type": type} if type not in ["", None] else {}),
-                    **(
-                        {"accounts.date": {"$gte": start_date, "$lte": end_date}}
-                        if start_date and end_date
-                        else {}
-                    ),
+                    "_id": 0,
+                    "amount": 1,
+                    "is_deemed_positive": {"$lt": ["$amount", 0]},
+                    "vouchar_id": 1,
+                    "date": 1,
+                    "status": "$voucher.status",
+                    "voucher_number": 1,
+                    "voucher_type": 1,
+                    "narration": "$voucher.narration",
+                    "reference_date": "$voucher.reference_date",
+                    "reference_number": "$voucher.reference_number",
+                    "place_of_supply": "$voucher.place_of_supply",
+                    "customer": 1,
                 }
             },
+        ]
+
+        search_stages = []
+        if search not in ["", None]:
+            # Searching the counter ledger needs it on every row, not just the page
+            search_stages = [
+                *customer_stages,
+                {
+                    "$match": {
+                        "$or": [
+                            {"voucher_number": {"$regex": f"{search}", "$options": "i"}},
+                            {"customer": {"$regex": f"{search}", "$options": "i"}},
+                        ]
+                    }
+                },
+            ]
+            customer_stages = []
+
+        pipeline = [
+            {"$match": filter_params},
+            *search_stages,
             {"$sort": sort_stage},
             {
                 "$facet": {
                     "docs": [
                         {"$skip": (pagination.paging.page - 1) * pagination.paging.limit},
                         {"$limit": pagination.paging.limit},
+                        *customer_stages,
+                        *voucher_stages,
                     ],
                     "count": [{"$count": "count"}],
                 }
             },
         ]
 
-        res = [doc async for doc in self.collection.aggregate(pipeline)]
+        res = [doc async for doc in accounting_repo.collection.aggregate(pipeline)]
         docs = res[0]["docs"]
         count = res[0]["count"][0]["count"] if len(res[0]["count"]) > 0 else 0
 
-        # Transform docs to only include the 'accounts' dict for each entry
-        docs = [doc["accounts"] for doc in docs]
-
         return PaginatedResponse(
             docs=docs,
             meta=Meta(
@@ -540,5 +488,64 @@ class ledgerRepo(BaseMongoDbCrud[LedgerDB]):
             ),
         )
 
+    async def statement(
+        self,
+        ledger: dict,
+        user_id: str,
+        company_id: str,
+        start_date: str,
+        end_date: str,
+        paging: Page,
+    ) -> dict:
+        """
+        LEDGER STATEMENT
+        ----------------
+        One pass over the ledger's date-ordered postings: rows before
+        `start_date` fold into the opening balance, rows in the period add to
+        the debit / credit totals and the running balance. Only the rows of the
+        requested page are kept, so memory stays flat for long ledgers.
+        Postings up to the last month-end snapshot before `start_date` are not
+        read at all, the snapshot's amount stands in for them.
+        """
+        month, totals = await balance_snapshot_repo.totals(
+            LEDGER, user_id, company_id, start_date, entity_id=ledger["_id"]
+        )
+        carried = totals.get(ledger["_id"], {}).get("amount", 0)
+        opening = (ledger.get("opening_balance") or 0) + carried
+        debit = credit = 0
+        balance = None
+        first = (paging.page - 1) * paging.limit
+        last = first + paging.limit
+        transactions, count = [], 0
+
+        postings = accounting_repo.postings(
+            ledger["_id"],
+            end_date or None,
+            after=after_month(month) if month is not None else None,
+        )
+        async for posting in postings:
+            amount = posting.get("amount") or 0
+            if start_date and (posting.get("date") or "") < start_date:
+                opening += amount
+                continue
+
+            balance = (opening if balance is None else balance) + amount
+            if amount > 0:
+                debit += amount
+            else:
+                credit += amount
+            if first <= count < last:
+                transactions.append({**posting, "running_balance": round(balance, 2)})
+            count += 1
+
+        return {
+            "opening_balance": round(opening, 2),
+            "total_debit": round(debit, 2),
+            "total_credit": round(credit, 2),
+            "closing_balance": round(opening + debit + credit, 2),
+            "transactions": transactions,
+            "meta": Meta(**paging.model_dump(), total=count, unique=[]),
+        }
+
 
 ledger_repo = ledgerRepo()
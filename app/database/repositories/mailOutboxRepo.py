@@ -0,0 +1,119 @@
+import datetime
+import hashlib
+from typing import List
+
+from pymongo import IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.Config import ENV_PROJECT
+from app.database.models.MailOutbox import MailOutbox, MailOutboxDB
+from .crud.base_mongo_crud import BaseMongoDbCrud
+
+# A "sending" row older than this belongs to a worker that died mid batch.
+STALE_LOCK = datetime.timedelta(minutes=5)
+
+# Messages not sent (or given up on) yet: a dedup key is unique among these
+OPEN = {"status": {"$in": ["pending", "sending"]}}
+
+
+class MailOutboxRepo(BaseMongoDbCrud[MailOutboxDB]):
+    indexes = [
+        IndexModel([("status", 1), ("next_attempt_at", 1)]),
+        # Concurrent enqueues of one message can both miss in the upsert's
+        # query; this makes the second insert fail instead ($in needs MongoDB 6.0+)
+        IndexModel(
+            [("dedup_key", 1)],
+            name="dedup_key_open",
+            unique=True,
+            partialFilterExpression=OPEN,
+        ),
+    ]
+
+    def __init__(self):
+        super().__init__(ENV_PROJECT.MONGO_DATABASE, "MailOutbox")
+
+    async def enqueue(
+        self, subject: str, email: str, content: str, dedup_key: str = None
+    ):
+        """
+        Queue a message. A message with the same dedup key that has not been
+        sent yet is not queued twice.
+        """
+        if dedup_key is None:
+            dedup_key = hashlib.sha256(
+                "\0".join([email.lower(), subject, content]).encode()
+            ).hexdigest()
+
+        mail = MailOutboxDB(
+            **MailOutbox(
+                subject=subject, email=email, content=content, dedup_key=dedup_key
+            ).model_dump()
+        )
+        try:
+            return await self.collection.update_one(
+                {"dedup_key": dedup_key, **OPEN},
+                {"$setOnInsert": self.serializer(mail)},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Queued by a concurrent enqueue in the meantime
+            return None
+
+    async def claim(self, limit: int) -> List[dict]:
+        """Atomically lock up to `limit` due messages for one worker."""
+        now = datetime.datetime.now()
+        claimed = []
+        while len(claimed) < limit:
+            mail = await self.collection.find_one_and_update(
+                {
+                    "$or": [
+                        {"status": "pending", "next_attempt_at": {"$lte": now}},
+                        {"status": "sending", "locked_at": {"$lt": now - STALE_LOCK}},
+                    ]
+                },
+                {"$set": {"status": "sending", "locked_at": now, "updated_at": now}},
+                sort=[("next_attempt_at", 1)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if mail is None:
+                break
+            claimed.append(mail)
+        return claimed
+
+    async def mark_sent(self, mail_id: str):
+        now = datetime.datetime.now()
+        return await self.collection.update_one(
+            {"_id": mail_id},
+            {
+                "$set": {
+                    "status": "sent",
+                    "sent_at": now,
+                    "locked_at": None,
+                    "last_error": None,
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+        )
+
+    async def mark_failed(self, mail: dict, error: str, max_attempts: int):
+        """Schedule a retry with exponential backoff, or give up after max_attempts."""
+        now = datetime.datetime.now()
+        attempts = mail.get("attempts", 0) + 1
+        backoff = datetime.timedelta(seconds=min(30 * 2 ** (attempts - 1), 3600))
+        return await self.collection.update_one(
+            {"_id": mail["_id"]},
+            {
+                "$set": {
+                    "status": "failed" if attempts >= max_attempts else "pending",
+                    "attempts": attempts,
+                    "next_attempt_at": now + backoff,
+                    "locked_at": None,
+                    "last_error": error,
+                    "updated_at": now,
+                }
+            },
+        )
+
+
+mail_outbox_repo = MailOutboxRepo()
@@ -0,0 +1,91 @@
+import datetime
+from typing import Optional
+
+from pymongo import IndexModel, ReturnDocument
+
+from app.Config import ENV_PROJECT
+from app.database.models.PurgeJob import PurgeJob, PurgeJobDB
+from .crud.base_mongo_crud import BaseMongoDbCrud
+
+# A "running" job not heard from for this long lost its worker.
+STALE_LOCK = datetime.timedelta(minutes=5)
+
+# Finished jobs are kept this long for the progress endpoint.
+JOB_TTL = datetime.timedelta(days=7)
+
+
+class PurgeJobRepo(BaseMongoDbCrud[PurgeJobDB]):
+    indexes = [
+        IndexModel([("status", 1), ("updated_at", 1)]),
+        # Unfinished jobs have no finished_at and never expire
+        IndexModel(
+            [("finished_at", 1)], expireAfterSeconds=int(JOB_TTL.total_seconds())
+        ),
+    ]
+
+    def __init__(self):
+        super().__init__(ENV_PROJECT.MONGO_DATABASE, "PurgeJob")
+
+    async def create(self, user_id: str, company_id: str) -> PurgeJobDB:
+        job = PurgeJobDB(**PurgeJob(user_id=user_id, company_id=company_id).model_dump())
+        await self.collection.insert_one(self.serializer(job))
+        return job
+
+    async def claim(self, job_id: str = None) -> Optional[dict]:
+        """
+        Lock a queued job, or a running one whose worker went quiet, for this
+        process. With `job_id` only that job is considered.
+        """
+        now = datetime.datetime.now()
+        filter = {
+            "$or": [
+                {"status": "queued"},
+                {"status": "running", "updated_at": {"$lt": now - STALE_LOCK}},
+            ]
+        }
+        if job_id is not None:
+            filter["_id"] = job_id
+        return await self.collection.find_one_and_update(
+            filter,
+            {"$set": {"status": "running", "updated_at": now}, "$inc": {"attempts": 1}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def progress(self, job_id: str, stage: str, deleted: int = 0):
+        """Count a deleted batch; doubles as the heartbeat of the running job."""
+        return await self.collection.update_one(
+            {"_id": job_id},
+            {
+                "$set": {"stage": stage, "updated_at": datetime.datetime.now()},
+                "$inc": {f"deleted.{stage}": deleted},
+            },
+        )
+
+    async def complete(self, job_id: str):
+        now = datetime.datetime.now()
+        return await self.collection.update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "status": "done",
+                    "stage": None,
+                    "finished_at": now,
+                    "updated_at": now,
+                }
+            },
+        )
+
+    async def fail(self, job_id: str, error: str, final: bool):
+        """
+        Record the error. Unless `final` the job stays "running" and is claimed
+        again once STALE_LOCK has passed, which spaces out the retries.
+        """
+        now = datetime.datetime.now()
+        fields = {"error": error, "updated_at": now}
+        if final:
+            fields.update(status="failed", finished_at=now)
+        return await self.collection.update_one({"_id": job_id}, {"$set": fields})
+
+
+purge_job_repo = PurgeJobRepo()
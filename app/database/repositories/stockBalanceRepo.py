@@ -0,0 +1,376 @@
+import datetime
+from typing import Dict, List
+
+from pymongo import UpdateOne
+
+from app.Config import ENV_PROJECT
+from app.database.models.StockBalance import StockBalanceDB
+from .crud.base_mongo_crud import BaseMongoDbCrud
+
+# Only these voucher types move stock, same as the listing pipelines always assumed.
+STOCK_VOUCHER_TYPES = {"sales", "purchase"}
+
+MOVEMENT_FIELDS = ["purchase_qty", "purchase_value", "sales_qty", "sales_value"]
+
+CURRENT_STOCK_EXPR = {
+    "$subtract": [
+        {"$add": ["$opening_balance", "$purchase_qty"]},
+        "$sales_qty",
+    ]
+}
+
+
+def stock_balance_stages() -> List[dict]:
+    """
+    Pipeline stages that attach the materialized StockBalance of a StockItem and
+    expose its totals as top level fields (purchase_qty, sales_value, ...).
+    """
+    return [
+        {
+            "$lookup": {
+                "from": "StockBalance",
+                "localField": "_id",
+                "foreignField": "_id",
+                "as": "stock_balance",
+            }
+        },
+        {"$unwind": {"path": "$stock_balance", "preserveNullAndEmptyArrays": True}},
+        {
+            "$addFields": {
+                **{
+                    field: {"$ifNull": [f"$stock_balance.{field}", 0]}
+                    for field in MOVEMENT_FIELDS
+                },
+                "last_restock_date": "$stock_balance.last_restock_date",
+                "last_movement_date": "$stock_balance.last_movement_date",
+            }
+        },
+        {"$project": {"stock_balance": 0}},
+    ]
+
+
+def item_movements(voucher_type: str, rows: List[dict], sign: int = 1) -> Dict[str, dict]:
+    """
+    Collapse inventory rows of one voucher into per item deltas.
+    Purchases count the signed quantity, sales the absolute one.
+    """
+    kind = (voucher_type or "").lower()
+    deltas: Dict[str, dict] = {}
+    if kind not in STOCK_VOUCHER_TYPES:
+        return deltas
+
+    for row in rows:
+        item_id = row.get("item_id")
+        if not item_id:
+            continue
+        delta = deltas.setdefault(item_id, {field: 0.0 for field in MOVEMENT_FIELDS})
+        quantity = row.get("quantity") or 0
+        amount = row.get("amount") or 0
+        if kind == "purchase":
+            delta["purchase_qty"] += sign * quantity
+            delta["purchase_value"] += sign * amount
+        else:
+            delta["sales_qty"] += sign * abs(quantity)
+            delta["sales_value"] += sign * abs(amount)
+    return deltas
+
+
+class StockBalanceRepo(BaseMongoDbCrud[StockBalanceDB]):
+    def __init__(self):
+        super().__init__(
+            ENV_PROJECT.MONGO_DATABASE,
+            "StockBalance",
+            unique_attributes=["company_id", "item_id"],
+        )
+
+    async def apply_voucher_items(
+        self,
+        user_id: str,
+        company_id: str,
+        voucher_type: str,
+        date: str = None,
+        added: List[dict] = [],
+        removed: List[dict] = [],
+    ):
+        """
+        Apply the stock effect of inventory rows added to and/or removed from a
+        voucher. All touched items are updated with a single bulk write.
+
+        Call it after the voucher's Inventory rows are written: the last movement
+        / restock dates of items that lost rows (deleted or re-dated voucher) are
+        read back from Inventory, $max only covers the added ones.
+        """
+        deltas = item_movements(voucher_type, added, 1)
+        for item_id, delta in item_movements(voucher_type, removed, -1).items():
+            current = deltas.setdefault(item_id, {field: 0.0 for field in MOVEMENT_FIELDS})
+            for field in MOVEMENT_FIELDS:
+                current[field] += delta[field]
+
+        if not deltas:
+            return None
+
+        added_ids = {row.get("item_id") for row in added}
+        is_purchase = (voucher_type or "").lower() == "purchase"
+        now = datetime.datetime.now()
+
+        operations = []
+        for item_id, delta in deltas.items():
+            fields = {
+                "user_id": user_id,
+                "company_id": company_id,
+                "item_id": item_id,
+                "opening_balance": {"$ifNull": ["$opening_balance", 0]},
+                "opening_value": {"$ifNull": ["$opening_value", 0]},
+                **{
+                    field: {"$add": [{"$ifNull": [f"${field}", 0]}, delta[field]]}
+                    for field in MOVEMENT_FIELDS
+                },
+                "created_at": {"$ifNull": ["$created_at", now]},
+                "updated_at": now,
+            }
+            if date and item_id in added_ids:
+                fields["last_movement_date"] = {"$max": ["$last_movement_date", date]}
+                if is_purchase:
+                    fields["last_restock_date"] = {"$max": ["$last_restock_date", date]}
+
+            operations.append(
+                UpdateOne(
+                    {"_id": item_id},
+                    [{"$set": fields}, {"$set": {"current_stock": CURRENT_STOCK_EXPR}}],
+                    upsert=True,
+                )
+            )
+
+        result = await self.collection.bulk_write(operations, ordered=False)
+
+        # Rows created here have no opening figures yet, copy them from the items.
+        if result.upserted_ids:
+            await self.sync_openings(list(result.upserted_ids.values()))
+
+        removed_ids = [row.get("item_id") for row in removed if row.get("item_id")]
+        if removed_ids:
+            await self.refresh_movement_dates(removed_ids)
+
+        return result
+
+    async def refresh_movement_dates(self, item_ids: List[str]):
+        """
+        Recompute last_movement_date / last_restock_date of the given items from
+        their Inventory rows, as rebuild() does.
+        """
+        item_ids = list(set(item_ids))
+        dates = {
+            row["_id"]: row
+            async for row in self.client[self.database_name]["Inventory"].aggregate(
+                [
+                    {
+                        "$match": {
+                            "item_id": {"$in": item_ids},
+                            "voucher_type": {"$in": ["Sales", "Purchase"]},
+                        }
+                    },
+                    {
+                        "$group": {
+                            "_id": "$item_id",
+                            "last_movement_date": {"$max": "$date"},
+                            "last_restock_date": {
+                                "$max": {
+                                    "$cond": [
+                                        {"$eq": ["$voucher_type", "Purchase"]},
+                                        "$date",
+                                        None,
+                                    ]
+                                }
+                            },
+                        }
+                    },
+                ]
+            )
+        }
+
+        return await self.collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": item_id},
+                    {
+                        "$set": {
+                            "last_movement_date": dates.get(item_id, {}).get(
+                                "last_movement_date"
+                            ),
+                            "last_restock_date": dates.get(item_id, {}).get(
+                                "last_restock_date"
+                            ),
+                        }
+                    },
+                )
+                for item_id in item_ids
+            ],
+            ordered=False,
+        )
+
+    async def set_opening(
+        self,
+        item_id: str,
+        user_id: str,
+        company_id: str,
+        opening_balance: float = 0.0,
+        opening_value: float = 0.0,
+    ):
+        """
+        Store the opening figures of a stock item, creating its balance if needed.
+        """
+        now = datetime.datetime.now()
+        return await self.collection.update_one(
+            {"_id": item_id},
+            [
+                {
+                    "$set": {
+                        "user_id": user_id,
+                        "company_id": company_id,
+                        "item_id": item_id,
+                        "opening_balance": opening_balance or 0,
+                        "opening_value": opening_value or 0,
+                        **{
+                            field: {"$ifNull": [f"${field}", 0]}
+                            for field in MOVEMENT_FIELDS
+                        },
+                        "created_at": {"$ifNull": ["$created_at", now]},
+                        "updated_at": now,
+                    }
+                },
+                {"$set": {"current_stock": CURRENT_STOCK_EXPR}},
+            ],
+            upsert=True,
+        )
+
+    async def sync_openings(self, item_ids: List[str]):
+        items = await self.client[self.database_name]["StockItem"].find(
+            {"_id": {"$in": item_ids}},
+            {"user_id": 1, "company_id": 1, "opening_balance": 1, "opening_value": 1},
+        ).to_list(None)
+
+        for item in items:
+            await self.set_opening(
+                item_id=item["_id"],
+                user_id=item.get("user_id"),
+                company_id=item.get("company_id"),
+                opening_balance=item.get("opening_balance"),
+                opening_value=item.get("opening_value"),
+            )
+
+    async def rebuild(self, company_id: str = None):
+        """
+        Recompute balances from Inventory and Voucher for one company (or all of
+        them when company_id is None) and replace the materialized rows.
+        Meant to be run once for existing data and whenever drift is suspected.
+        """
+        await self.ensure_indexes()
+
+        rebuilt_at = datetime.datetime.now()
+        match = {"company_id": company_id} if company_id else {}
+
+        def movement_sum(kind: str, value: str):
+            return {
+                "$sum": {
+                    "$cond": [
+                        {"$eq": [{"$toLower": "$voucher.voucher_type"}, kind]},
+                        value,
+                        0,
+                    ]
+                }
+            }
+
+        def movement_date(kinds: List[str]):
+            return {
+                "$max": {
+                    "$cond": [
+                        {"$in": [{"$toLower": "$voucher.voucher_type"}, kinds]},
+                        "$voucher.date",
+                        None,
+                    ]
+                }
+            }
+
+        pipeline = [
+            {"$match": match},
+            {
+                "$lookup": {
+                    "from": "Inventory",
+                    "localField": "_id",
+                    "foreignField": "item_id",
+                    "as": "inventory_entries",
+                }
+            },
+            {
+                "$unwind": {
+                    "path": "$inventory_entries",
+                    "preserveNullAndEmptyArrays": True,
+                }
+            },
+            {
+                "$lookup": {
+                    "from": "Voucher",
+                    "localField": "inventory_entries.vouchar_id",
+                    "foreignField": "_id",
+                    "as": "voucher",
+                }
+            },
+            {"$unwind": {"path": "$voucher", "preserveNullAndEmptyArrays": True}},
+            {
+                "$group": {
+                    "_id": "$_id",
+                    "user_id": {"$first": "$user_id"},
+                    "company_id": {"$first": "$company_id"},
+                    "opening_balance": {"$first": "$opening_balance"},
+                    "opening_value": {"$first": "$opening_value"},
+                    "purchase_qty": movement_sum("purchase", "$inventory_entries.quantity"),
+                    "purchase_value": movement_sum("purchase", "$inventory_entries.amount"),
+                    "sales_qty": movement_sum(
+                        "sales", {"$abs": "$inventory_entries.quantity"}
+                    ),
+                    "sales_value": movement_sum(
+                        "sales", {"$abs": "$inventory_entries.amount"}
+                    ),
+                    "last_movement_date": movement_date(list(STOCK_VOUCHER_TYPES)),
+                    "last_restock_date": movement_date(["purchase"]),
+                }
+            },
+            {
+                "$set": {
+                    "item_id": "$_id",
+                    "opening_balance": {"$ifNull": ["$opening_balance", 0]},
+                    "opening_value": {"$ifNull": ["$opening_value", 0]},
+                    "updated_at": rebuilt_at,
+                }
+            },
+            {"$set": {"current_stock": CURRENT_STOCK_EXPR}},
+            {
+                "$merge": {
+                    "into": self.collection_name,
+                    "on": "_id",
+                    "whenMatched": "merge",
+                    "whenNotMatched": "insert",
+                }
+            },
+        ]
+
+        await self.client[self.database_name]["StockItem"].aggregate(pipeline).to_list(
+            None
+        )
+
+        # Balances of items that no longer exist were not touched by the merge.
+        stale = await self.collection.delete_many(
+            {**match, "updated_at": {"$lt": rebuilt_at}}
+        )
+        await self.collection.update_many(
+            {**match, "created_at": {"$exists": False}},
+            {"$set": {"created_at": rebuilt_at}},
+        )
+
+        return {
+            "rebuilt": await self.count(match),
+            "removed": stale.deleted_count,
+        }
+
+
+stock_balance_repo = StockBalanceRepo()
@@ -1,9 +1,12 @@
 import asyncio
 from fastapi import Depends
+from pymongo import IndexModel
 from app.Config import ENV_PROJECT
 from app.database.models.StockItem import StockItem, StockItemDB
 from app.database.repositories.categoryRepo import category_repo
 from app.database.repositories.inventoryGroupRepo import inventory_group_repo
+from app.database.repositories.stockBalanceRepo import stock_balance_stages
+from app.database.repositories.stockTimeline import ITEM_PROJECTION, StockTimeline
 from app.oauth2 import get_current_user
 from app.schema.token import TokenData
 from .crud.base_mongo_crud import BaseMongoDbCrud
@@ -15,9 +18,15 @@ from app.database.repositories.crud.base import (
     Page,
 )
 from pydantic import BaseModel
-from typing import List, Any
+from typing import List, Any, Optional
 import re
 from datetime import datetime, timedelta
+from .crud.cursor import keyset_page, keyset_stages, listing_totals, sort_key, totals_key
+
+# Stock item fields the cursor listing can seek on before the joins run, and the
+# ones that only exist after them
+CURSOR_SORT_FIELDS = {"stock_item_name", "unit", "created_at"}
+CURSOR_COMPUTED_SORT_FIELDS = {"current_stock"}
 
 
 async def fetch_all(cursor):
@@ -25,6 +34,8 @@ async def fetch_all(cursor):
 
 
 class StockItemRepo(BaseMongoDbCrud[StockItemDB]):
+    indexes = [IndexModel([("user_id", 1), ("company_id", 1), ("is_deleted", 1)])]
+
     def __init__(self):
         super().__init__(
             ENV_PROJECT.MONGO_DATABASE,
@@ -57,111 +68,7 @@ class StockItemRepo(BaseMongoDbCrud[StockItemDB]):
 
         stats_pipeline = [
             {"$match": stats_filter_params},
-            {
-                "$lookup": {
-                    "from": "Inventory",
-                    "let": {"stock_item_id": "$_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$item_id", "$$stock_item_id"]}}}
-                    ],
-                    "as": "inventory_entries",
-                }
-            },
-            {
-                "$unwind": {
-                    "path": "$inventory_entries",
-                    "preserveNullAndEmptyArrays": True,
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "Voucher",
-                    "let": {"inventory_voucher_id": "$inventory_entries.vouchar_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$_id", "$$inventory_voucher_id"]}}}
-                    ],
-                    "as": "voucher",
-                }
-            },
-            {"$unwind": {"path": "$voucher", "preserveNullAndEmptyArrays": True}},
-            {
-                "$group": {
-                    "_id": "$_id",
-                    "company_id": {"$first": "$company_id"},
-                    "stock_item_name": {"$first": "$stock_item_name"},
-                    "unit": {"$first": "$unit"},
-                    "category": {"$first": "$category"},
-                    "alias_name": {"$first": "$alias_name"},
-                    "image": {"$first": "$image"},
-                    "description": {"$first": "$description"},
-                    "hsn_code": {"$first": "$hsn_code"},
-                    "low_stock_alert": {"$first": "$low_stock_alert"},
-                    "created_at": {"$first": "$created_at"},
-                    "updated_at": {"$first": "$updated_at"},
-                    "group": {"$first": "$group"},
-                    "opening_balance": {"$first": "$opening_balance"},
-                    "purchase_qty": {
-                        "$sum": {
-                            "$cond": [
-                                {
-                                    "$eq": [
-                                        {"$toLower": "$voucher.voucher_type"},
-                                        "purchase",
-                                    ]
-                                },
-                                "$inventory_entries.quantity",
-                                0,
-                            ]
-                        }
-                    },
-                    "purchase_value": {
-                        "$sum": {
-                            "$cond": [
-                                {
-                                    "$eq": [
-                                        {"$toLower": "$voucher.voucher_type"},
-                                        "purchase",
-                                    ]
-                                },
-                                {
-                                    "$abs": {
-                                        "$multiply": [
-                                            "$inventory_entries.quantity",
-                                            "$inventory_entries.rate",
-                                        ]
-                                    },
-                                },
-                                0,
-                            ]
-                        }
-                    },
-                    "sales_qty": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": [{"$toLower": "$voucher.voucher_type"}, "sales"]},
-                                {"$abs": "$inventory_entries.quantity"},
-                                0,
-                            ]
-                        }
-                    },
-                    "sales_value": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": [{"$toLower": "$voucher.voucher_type"}, "sales"]},
-                                {
-                                    "$abs": {
-                                        "$multiply": [
-                                            "$inventory_entries.quantity",
-                                            "$inventory_entries.rate",
-                                        ]
-                                    },
-                                },
-                                0,
-                            ]
-                        }
-                    },
-                }
-            },
+            *stock_balance_stages(),
             {
                 "$project": {
                     "low_stock_alert": 1,
@@ -366,117 +273,7 @@ class StockItemRepo(BaseMongoDbCrud[StockItemDB]):
                 }
             },
             {"$unwind": {"path": "$group", "preserveNullAndEmptyArrays": True}},
-            {
-                "$lookup": {
-                    "from": "Inventory",
-                    "let": {"stock_item_id": "$_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$item_id", "$$stock_item_id"]}}}
-                    ],
-                    "as": "inventory_entries",
-                }
-            },
-            {
-                "$unwind": {
-                    "path": "$inventory_entries",
-                    "preserveNullAndEmptyArrays": True,
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "Voucher",
-                    "let": {"inventory_voucher_id": "$inventory_entries.vouchar_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$_id", "$$inventory_voucher_id"]}}}
-                    ],
-                    "as": "voucher",
-                }
-            },
-            {
-                "$unwind": {
-                    "path": "$voucher",
-                    "preserveNullAndEmptyArrays": True,
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$_id",
-                    "company_id": {"$first": "$company_id"},
-                    "stock_item_name": {"$first": "$stock_item_name"},
-                    "unit": {"$first": "$unit"},
-                    "category": {"$first": "$category"},
-                    "alias_name": {"$first": "$alias_name"},
-                    "image": {"$first": "$image"},
-                    "description": {"$first": "$description"},
-                    "hsn_code": {"$first": "$hsn_code"},
-                    "low_stock_alert": {"$first": "$low_stock_alert"},
-                    "created_at": {"$first": "$created_at"},
-                    "updated_at": {"$first": "$updated_at"},
-                    "group": {"$first": "$group"},
-                    "opening_balance": {"$first": "$opening_balance"},
-                    "opening_value": {"$first": "$opening_value"},
-                    "purchase_qty": {
-                        "$sum": {
-                            "$cond": [
-                                {
-                                    "$eq": [
-                                        {"$toLower": "$voucher.voucher_type"},
-                                        "purchase",
-                                    ]
-                                },
-                                "$inventory_entries.quantity",
-                                0,
-                            ]
-                        }
-                    },
-                    "purchase_value": {
-                        "$sum": {
-                            "$cond": [
-                                {
-                                    "$eq": [
-                                        {"$toLower": "$voucher.voucher_type"},
-                                        "purchase",
-                                    ]
-                                },
-                                "$inventory_entries.amount",
-                                0,
-                            ]
-                        }
-                    },
-                    "sales_qty": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": [{"$toLower": "$voucher.voucher_type"}, "sales"]},
-                                {"$abs": "$inventory_entries.quantity"},
-                                0,
-                            ]
-                        }
-                    },
-                    "last_restock_date": {
-                        "$max": {
-                            "$cond": [
-                                {
-                                    "$eq": [
-                                        {"$toLower": "$voucher.voucher_type"},
-                                        "purchase",
-                                    ]
-                                },
-                                "$voucher.date",
-                                None,
-                            ]
-                        }
-                    },
-                    "sales_value": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": [{"$toLower": "$voucher.voucher_type"}, "sales"]},
-                                {"$abs": "$inventory_entries.amount"},
-                                0,
-                            ]
-                        }
-                    },
-                }
-            },
+            *stock_balance_stages(),
             {
                 "$project": {
                     "_id": 1,
@@ -897,115 +694,7 @@ class StockItemRepo(BaseMongoDbCrud[StockItemDB]):
                 }
             },
             {"$unwind": {"path": "$group", "preserveNullAndEmptyArrays": True}},
-            {
-                "$lookup": {
-                    "from": "Inventory",
-                    "let": {"stock_item_id": "$_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$item_id", "$$stock_item_id"]}}}
-                    ],
-                    "as": "inventory_entries",
-                }
-            },
-            {
-                "$unwind": {
-                    "path": "$inventory_entries", "preserveNullAndEmptyArrays": True
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "Voucher",
-                    "let": {"inventory_voucher_id": "$inventory_entries.vouchar_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$_id", "$$inventory_voucher_id"]}}}
-                    ],
-                    "as": "voucher",
-                }
-            },
-            {
-                "$unwind": {
-                    "path": "$voucher", "preserveNullAndEmptyArrays": True
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$_id",
-                    "company_id": {"$first": "$company_id"},
-                    "stock_item_name": {"$first": "$stock_item_name"},
-                    "unit": {"$first": "$unit"},
-                    "category": {"$first": "$category"},
-                    "alias_name": {"$first": "$alias_name"},
-                    "image": {"$first": "$image"},
-                    "description": {"$first": "$description"},
-                    "hsn_code": {"$first": "$hsn_code"},
-                    "low_stock_alert": {"$first": "$low_stock_alert"},
-                    "created_at": {"$first": "$created_at"},
-                    "updated_at": {"$first": "$updated_at"},
-                    "group": {"$first": "$group"},
-                    "opening_balance": {"$first": "$opening_balance"},
-                    "opening_value": {"$first": "$opening_value"},
-                    "purchase_qty": {
-                        "$sum": {
-                            "$cond": [
-                                {
-                                    "$eq": [
-                                        {"$toLower": "$voucher.voucher_type"},
-                                        "purchase",
-                                    ]
-                                },
-                                "$inventory_entries.quantity",
-                                0,
-                            ]
-                        }
-                    },
-                    "purchase_value": {
-                        "$sum": {
-                            "$cond": [
-                                {
-                                    "$eq": [
-                                        {"$toLower": "$voucher.voucher_type"},
-                                        "purchase",
-                                    ]
-                                },
-                                "$inventory_entries.amount",
-                                0,
-                            ]
-                        }
-                    },
-                    "sales_qty": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": [{"$toLower": "$voucher.voucher_type"}, "sales"]},
-                                {"$abs": "$inventory_entries.quantity"},
-                                0,
-                            ]
-                        }
-                    },
-                    "last_restock_date": {
-                        "$max": {
-                            "$cond": [
-                                {
-                                    "$eq": [
-                                        {"$toLower": "$voucher.voucher_type"},
-                                        "purchase",
-                                    ]
-                                },
-                                "$voucher.date",
-                                None,
-                            ]
-                        }
-                    },
-                    "sales_value": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": [{"$toLower": "$voucher.voucher_type"}, "sales"]},
-                                {"$abs": "$inventory_entries.amount"},
-                                0,
-                            ]
-                        }
-                    },
-                }
-            },
+            *stock_balance_stages(),
             {
                 "$project": {
                     "_id": 1,
@@ -1353,114 +1042,7 @@ class StockItemRepo(BaseMongoDbCrud[StockItemDB]):
 
         stats_pipeline = [
             {"$match": stats_filter_params},
-            {
-                "$lookup": {
-                    "from": "Inventory",
-                    "let": {"stock_item_id": "$_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$item_id", "$$stock_item_id"]}}}
-                    ],
-                    "as": "inventory_entries",
-                }
-            },
-            {
-                "$unwind": {
-                    "path": "$inventory_entries",  "preserveNullAndEmptyArrays": True
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "Voucher",
-                    "let": {"inventory_voucher_id": "$inventory_entries.vouchar_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$_id", "$$inventory_voucher_id"]}}}
-                    ],
-                    "as": "voucher",
-                }
-            },
-            {
-                "$unwind": {
-                    "path": "$voucher",  "preserveNullAndEmptyArrays": True
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$_id",
-                    "company_id": {"$first": "$company_id"},
-                    "stock_item_name": {"$first": "$stock_item_name"},
-                    "unit": {"$first": "$unit"},
-                    "category": {"$first": "$category"},
-                    "alias_name": {"$first": "$alias_name"},
-                    "image": {"$first": "$image"},
-                    "description": {"$first": "$description"},
-                    "hsn_code": {"$first": "$hsn_code"},
-                    "low_stock_alert": {"$first": "$low_stock_alert"},
-                    "created_at": {"$first": "$created_at"},
-                    "updated_at": {"$first": "$updated_at"},
-                    "group": {"$first": "$group"},
-                    "opening_balance": {"$first": "$opening_balance"},
-                    "purchase_qty": {
-                        "$sum": {
-                            "$cond": [
-                                {
-                                    "$eq": [
-                                        {"$toLower": "$voucher.voucher_type"},
-                                        "purchase",
-                                    ]
-                                },
-                                "$inventory_entries.quantity",
-                                0,
-                            ]
-                        }
-                    },
-                    "purchase_value": {
-                        "$sum": {
-                            "$cond": [
-                                {
-                                    "$eq": [
-                                        {"$toLower": "$voucher.voucher_type"},
-                                        "purchase",
-                                    ]
-                                },
-                                {
-                                    "$abs": {
-                                        "$multiply": [
-                                            "$inventory_entries.quantity",
-                                            "$inventory_entries.rate",
-                                        ]
-                                    },
-                                },
-                                0,
-                            ]
-                        }
-                    },
-                    "sales_qty": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": [{"$toLower": "$voucher.voucher_type"}, "sales"]},
-                                {"$abs": "$inventory_entries.quantity"},
-                                0,
-                            ]
-                        }
-                    },
-                    "sales_value": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": [{"$toLower": "$voucher.voucher_type"}, "sales"]},
-                                {
-                                    "$abs": {
-                                        "$multiply": [
-                                            "$inventory_entries.quantity",
-                                            "$inventory_entries.rate",
-                                        ]
-                                    },
-                                },
-                                0,
-                            ]
-                        }
-                    },
-                }
-            },
+            *stock_balance_stages(),
             {
                 "$project": {
                     "low_stock_alert": 1,
@@ -1708,99 +1290,7 @@ class StockItemRepo(BaseMongoDbCrud[StockItemDB]):
                 }
             },
             {"$unwind": {"path": "$group", "preserveNullAndEmptyArrays": True}},
-            {
-                "$lookup": {
-                    "from": "Inventory",
-                    "let": {"stock_item_id": "$_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$item_id", "$$stock_item_id"]}}}
-                    ],
-                    "as": "inventory_entries",
-                }
-            },
-            {
-                "$unwind": {
-                    "path": "$inventory_entries",
-                    "preserveNullAndEmptyArrays": True,
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "Voucher",
-                    "let": {"inventory_voucher_id": "$inventory_entries.vouchar_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$_id", "$$inventory_voucher_id"]}}}
-                    ],
-                    "as": "voucher",
-                }
-            },
-            {"$unwind": {"path": "$voucher", "preserveNullAndEmptyArrays": True}},
-            {
-                "$group": {
-                    "_id": "$_id",
-                    "company_id": {"$first": "$company_id"},
-                    "stock_item_name": {"$first": "$stock_item_name"},
-                    "unit": {"$first": "$unit"},
-                    "category": {"$first": "$category"},
-                    "alias_name": {"$first": "$alias_name"},
-                    "image": {"$first": "$image"},
-                    "description": {"$first": "$description"},
-                    "hsn_code": {"$first": "$hsn_code"},
-                    "opening_balance": {"$first": "$opening_balance"},
-                    "opening_rate": {"$first": "$opening_rate"},
-                    "opening_value": {"$first": "$opening_value"},
-                    "low_stock_alert": {"$first": "$low_stock_alert"},
-                    "created_at": {"$first": "$created_at"},
-                    "updated_at": {"$first": "$updated_at"},
-                    "group": {"$first": "$group"},
-                    "purchase_qty": {
-                        "$sum": {
-                            "$cond": [
-                                {
-                                    "$eq": [
-                                        {"$toLower": "$voucher.voucher_type"},
-                                        "purchase",
-                                    ]
-                                },
-                                "$inventory_entries.quantity",
-                                0,
-                            ]
-                        }
-                    },
-                    "purchase_value": {
-                        "$sum": {
-                            "$cond": [
-                                {
-                                    "$eq": [
-                                        {"$toLower": "$voucher.voucher_type"},
-                                        "purchase",
-                                    ]
-                                },
-                                "$inventory_entries.amount",
-                                0,
-                            ]
-                        }
-                    },
-                    "sales_qty": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": [{"$toLower": "$voucher.voucher_type"}, "sales"]},
-                                {"$abs": "$inventory_entries.quantity"},
-                                0,
-                            ]
-                        }
-                    },
-                    "sales_value": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": [{"$toLower": "$voucher.voucher_type"}, "sales"]},
-                                {"$abs": "$inventory_entries.amount"},
-                                0,
-                            ]
-                        }
-                    },
-                }
-            },
+            *stock_balance_stages(),
             {
                 "$project": {
                     "_id": 1,
@@ -1929,27 +1419,43 @@ class StockItemRepo(BaseMongoDbCrud[StockItemDB]):
             {"$sort": {"group": 1}},
         ]
 
-        response = await asyncio.gather(
-            fetch_all(self.collection.aggregate(pipeline)),
-            fetch_all(category_repo.collection.aggregate(unique_categories_pipeline)),
-            fetch_all(inventory_group_repo.collection.aggregate(unique_groups_pipeline)),
-        )
-        res = response[0]
-        categories_res = response[1]
-        group_res = response[2]
-
-        docs = res[0]["docs"]
-        count = res[0]["count"][0]["count"] if len(res[0]["count"]) > 0 else 0
-
-        # Extract unique categories and groups
-        unique_categories = [entry["category"] for entry in categories_res]
-
-        unique_groups = [entry["group"] for entry in group_res]
+        next_cursor = None
+        if pagination.paging.cursor:
+            docs, next_cursor, totals = await self._stock_items_after(
+                pipeline,
+                unique_categories_pipeline,
+                unique_groups_pipeline,
+                sort_stage,
+                pagination,
+            )
+            count = totals["count"]
+            unique_categories = totals["unique_categories"]
+            unique_groups = totals["unique_groups"]
+        else:
+            response = await asyncio.gather(
+                fetch_all(self.collection.aggregate(pipeline)),
+                fetch_all(category_repo.collection.aggregate(unique_categories_pipeline)),
+                fetch_all(
+                    inventory_group_repo.collection.aggregate(unique_groups_pipeline)
+                ),
+            )
+            res = response[0]
+            categories_res = response[1]
+            group_res = response[2]
+
+            docs = res[0]["docs"]
+            count = res[0]["count"][0]["count"] if len(res[0]["count"]) > 0 else 0
+
+            # Extract unique categories and groups
+            unique_categories = [entry["category"] for entry in categories_res]
+
+            unique_groups = [entry["group"] for entry in group_res]
 
         class Meta2(Page):
             total: int
             unique_groups: List[Any]
             unique_categories: List[Any]
+            next: Optional[str] = None
 
         class PaginatedResponse2(BaseModel):
             docs: List[Any]
@@ -1963,9 +1469,61 @@ class StockItemRepo(BaseMongoDbCrud[StockItemDB]):
                 total=count,
                 unique_categories=unique_categories,
                 unique_groups=unique_groups,
+                cursor=pagination.paging.cursor,
+                after=pagination.paging.after,
+                next=next_cursor,
             ),
         )
 
+    async def _stock_items_after(
+        self,
+        pipeline: list,
+        unique_categories_pipeline: list,
+        unique_groups_pipeline: list,
+        sort_stage: dict,
+        pagination: PageRequest,
+    ):
+        """
+        view_all_stock_items in keyset mode, reusing the stages of its offset
+        pipeline ($match, joins + $project, $sort, $facet). Sorting on a stored
+        field seeks before the joins; current_stock only exists after them.
+        """
+        match, joins = pipeline[0], pipeline[1:-2]
+        field, order = next(iter(sort_stage.items()))
+        if field not in CURSOR_SORT_FIELDS | CURSOR_COMPUTED_SORT_FIELDS:
+            field, order = "created_at", 1
+        key = sort_key(field, order, ["_id"])
+        limit = pagination.paging.limit
+        seek = [*keyset_stages(key, pagination.paging.after), {"$limit": limit + 1}]
+
+        if field in CURSOR_SORT_FIELDS:
+            stages = [match, *seek, *joins]
+        else:
+            stages = [match, *joins, *seek]
+        docs = await fetch_all(self.collection.aggregate(stages))
+        docs, next_cursor = keyset_page(docs, key, limit)
+
+        async def compute_totals():
+            count, categories, groups = await asyncio.gather(
+                fetch_all(self.collection.aggregate([match, {"$count": "count"}])),
+                fetch_all(category_repo.collection.aggregate(unique_categories_pipeline)),
+                fetch_all(
+                    inventory_group_repo.collection.aggregate(unique_groups_pipeline)
+                ),
+            )
+            return {
+                "count": count[0]["count"] if count else 0,
+                "unique_categories": [entry["category"] for entry in categories],
+                "unique_groups": [entry["group"] for entry in groups],
+            }
+
+        totals = await listing_totals.get_or_compute(
+            match["$match"]["company_id"],
+            totals_key(self.collection_name, match["$match"]),
+            compute_totals,
+        )
+        return docs, next_cursor, totals
+
     async def viewProductTimeline(
         self,
         product_id: str,
@@ -1980,17 +1538,13 @@ class StockItemRepo(BaseMongoDbCrud[StockItemDB]):
                     "let": {"item_id": product_id},
                     "pipeline": [
                         {"$match": {"$expr": {"$eq": ["$item_id", "$$item_id"]}}},
+                        # Date, number, type and party are already on the row;
+                        # only the shipping details come from the voucher
                         {
                             "$lookup": {
                                 "from": "Voucher",
-                                "let": {"voucher_id": "$vouchar_id"},
-                                "pipeline": [
-                                    {
-                                        "$match": {
-                                            "$expr": {"$eq": ["$_id", "$$voucher_id"]}
-                                        }
-                                    }
-                                ],
+                                "localField": "vouchar_id",
+                                "foreignField": "_id",
                                 "as": "voucher",
                             }
                         },
@@ -2002,11 +1556,6 @@ class StockItemRepo(BaseMongoDbCrud[StockItemDB]):
                         },
                         {
                             "$addFields": {
-                                "date": "$voucher.date",
-                                "voucher_number": "$voucher.voucher_number",
-                                "voucher_type": "$voucher.voucher_type",
-                                "party_name": "$voucher.party_name",
-                                "party_name_id": "$voucher.party_name_id",
                                 "place_of_supply": "$voucher.place_of_supply",
                                 "vehicle_number": "$voucher.vehicle_number",
                                 "mode_of_transport": "$voucher.mode_of_transport",
@@ -2038,6 +1587,29 @@ class StockItemRepo(BaseMongoDbCrud[StockItemDB]):
             return {"message": "The product has no timeline data."}
         return res
 
+    def timeline_items(
+        self,
+        company_id: str,
+        user_id: str,
+        search: str = "",
+        category: str = "",
+        descending: bool = False,
+    ) -> dict:
+        """Filter and sort of the stock items listed by the timeline."""
+        filter_params = {"user_id": user_id, "company_id": company_id}
+        if search not in ["", None]:
+            filter_params["$or"] = [
+                {field: {"$regex": f"{search}", "$options": "i"}}
+                for field in ("stock_item_name", "unit", "category")
+            ]
+        if category not in ["", None]:
+            filter_params["category"] = category
+        return {
+            "filter": filter_params,
+            "projection": ITEM_PROJECTION,
+            "sort": [("stock_item_name", -1 if descending else 1), ("_id", 1)],
+        }
+
     async def viewTimeline(
         self,
         search: str,
@@ -2049,1280 +1621,41 @@ class StockItemRepo(BaseMongoDbCrud[StockItemDB]):
         start_date: datetime = None,
         end_date: datetime = None,
     ):
-        start_date = start_date[:10]
-        end_date = end_date[:10]
-        filter_params = {
-            "user_id": current_user.user_id,
-            "company_id": company_id,
-        }
-
-        pipeline = [
-            # Start from StockItem (ensures all items included)
-            {
-                "$match": filter_params,
-            },
-            # Lookup for the Stock Item in Inventory and then to the related voucher
-            {
-                "$lookup": {
-                    "from": "Inventory",
-                    "let": {"item_id": "$_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$item_id", "$$item_id"]}}},
-                        {
-                            "$lookup": {
-                                "from": "Voucher",
-                                "let": {"vouchar_id": "$vouchar_id"},
-                                "pipeline": [
-                                    {
-                                        "$match": {
-                                            "$expr": {"$eq": ["$_id", "$$vouchar_id"]}
-                                        }
-                                    },
-                                    {
-                                        "$project": {
-                                            "_id": 1,
-                                            "date": 1,
-                                            "voucher_number": 1,
-                                            "voucher_type": 1,
-                                            "additional_charge": 1,
-                                        }
-                                    },
-                                ],
-                                "as": "voucher_info",
-                            }
-                        },
-                        {
-                            "$unwind": {
-                                "path": "$voucher_info",
-                                "preserveNullAndEmptyArrays": True,
-                            }
-                        },
-                        {
-                            "$project": {
-                                "_id": 1,
-                                "item_id": 1,
-                                "vouchar_id": 1,
-                                "quantity": 1,
-                                "total_amount": 1,
-                                "voucher_info": 1,
-                            }
-                        },
-                    ],
-                    "as": "all_txns",
-                }
-            },
-            {
-                "$addFields": {
-                    # filter rows before start_date
-                    "txns_before_start": {
-                        "$filter": {
-                            "input": "$all_txns",
-                            "as": "t",
-                            "cond": {
-                                # convert voucher_info.date strings (YYYY-MM-DD) to dates for comparison
-                                "$lt": ["$$t.voucher_info.date", start_date]
-                            },
-                        }
-                    },
-                    # filter rows within [start_date, end_date]
-                    "txns_in_range": {
-                        "$filter": {
-                            "input": "$all_txns",
-                            "as": "t",
-                            "cond": {
-                                "$and": [
-                                    {"$gte": ["$$t.voucher_info.date", start_date]},
-                                    {"$lte": ["$$t.voucher_info.date", end_date]},
-                                ]
-                            },
-                        }
-                    },
-                }
-            },
-            # Calculating the purchase and sale quantity and value for the filtered transactions
-            {
-                "$addFields": {
-                    "before_summary": {
-                        "$reduce": {
-                            "input": "$txns_before_start",
-                            "initialValue": {
-                                "purchase_qty": 0,
-                                "purchase_value": 0,
-                                "sales_qty": 0,
-                                "sales_value": 0,
-                            },
-                            "in": {
-                                "$mergeObjects": [
-                                    "$$value",
-                                    {
-                                        "purchase_qty": {
-                                            "$add": [
-                                                "$$value.purchase_qty",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Purchase",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.quantity",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                        "purchase_value": {
-                                            "$add": [
-                                                "$$value.purchase_value",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Purchase",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.total_amount",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                        "sales_qty": {
-                                            "$add": [
-                                                "$$value.sales_qty",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Sales",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.quantity",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                        "sales_value": {
-                                            "$add": [
-                                                "$$value.sales_value",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Sales",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.total_amount",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                    },
-                                ]
-                            },
-                        }
-                    },
-                    # reduce txns_in_range to sums
-                    "range_summary": {
-                        "$reduce": {
-                            "input": "$txns_in_range",
-                            "initialValue": {
-                                "purchase_qty": 0,
-                                "purchase_value": 0,
-                                "sales_qty": 0,
-                                "sales_value": 0,
-                            },
-                            "in": {
-                                "$mergeObjects": [
-                                    "$$value",
-                                    {
-                                        "purchase_qty": {
-                                            "$add": [
-                                                "$$value.purchase_qty",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Purchase",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.quantity",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                        "purchase_value": {
-                                            "$add": [
-                                                "$$value.purchase_value",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Purchase",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.total_amount",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                        "sales_qty": {
-                                            "$add": [
-                                                "$$value.sales_qty",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Sales",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.quantity",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                        "sales_value": {
-                                            "$add": [
-                                                "$$value.sales_value",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Sales",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.total_amount",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                    },
-                                ]
-                            },
-                        }
-                    },
-                }
-            },
-            # Add the fields opening qty, rate, value from the stock item
-            {
-                "$addFields": {
-                    # original stored opening values (from StockItem document)
-                    "orig_opening_balance": {"$ifNull": ["$opening_balance", 0]},
-                    "orig_opening_rate": {"$ifNull": ["$opening_rate", 0]},
-                    "orig_opening_value": {
-                        "$ifNull": [
-                            "$opening_value",
-                            {
-                                "$multiply": [
-                                    {"$ifNull": ["$opening_balance", 0]},
-                                    {"$ifNull": ["$opening_rate", 0]},
-                                ]
-                            },
-                        ]
-                    },
-                    # opening adjustments from txns before start
-                    "before_purchase_qty": {
-                        "$ifNull": ["$before_summary.purchase_qty", 0]
-                    },
-                    "before_purchase_value": {
-                        "$ifNull": ["$before_summary.purchase_value", 0]
-                    },
-                    "before_sales_qty": {"$ifNull": ["$before_summary.sales_qty", 0]},
-                    "before_sales_value": {"$ifNull": ["$before_summary.sales_value", 0]},
-                    # period (start..end) sums
-                    "period_purchase_qty": {
-                        "$ifNull": ["$range_summary.purchase_qty", 0]
-                    },
-                    "period_purchase_value": {
-                        "$ifNull": ["$range_summary.purchase_value", 0]
-                    },
-                    "period_sales_qty": {"$ifNull": ["$range_summary.sales_qty", 0]},
-                    "period_sales_value": {"$ifNull": ["$range_summary.sales_value", 0]},
-                }
-            },
-            # Calculating the purchase and sale rate for the filtered transactions
-            {
-                "$addFields": {
-                    # opening adjustments from txns before start
-                    "before_purchase_rate": {
-                        "$cond": [
-                            {"$gt": [{"$ifNull": ["$before_purchase_qty", 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$ifNull": ["$before_purchase_value", 0]},
-                                    {"$ifNull": ["$before_purchase_qty", 0]},
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                    "before_sales_rate": {
-                        "$cond": [
-                            {"$gt": [{"$ifNull": ["$before_sales_qty", 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$ifNull": ["$before_sales_value", 0]},
-                                    {"$ifNull": ["$before_sales_qty", 0]},
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                    # period (start..end) sums
-                    "period_purchase_rate": {
-                        "$cond": [
-                            {"$gt": [{"$ifNull": ["$period_purchase_qty", 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$ifNull": ["$period_purchase_value", 0]},
-                                    {"$ifNull": ["$period_purchase_qty", 0]},
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                    "period_sales_rate": {
-                        "$cond": [
-                            {"$gt": [{"$ifNull": ["$period_sales_qty", 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$ifNull": ["$period_sales_value", 0]},
-                                    {"$ifNull": ["$period_sales_qty", 0]},
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                    "avg_purchase_rate": { 
-                        "$cond": [
-                            {"$gt": [{"$ifNull": [{"$sum": ["$orig_opening_balance", "$before_purchase_qty"]}, 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$sum": ["$orig_opening_value", "$before_purchase_value" ]},
-                                    {"$sum": ["$orig_opening_balance", "$before_purchase_qty"]},
-                                ]
-                            },
-                            0
-                        ]
-                    }
-                }
-            },
-            {
-                "$addFields": {
-                    # Opening quantity = stored opening_balance + purchases before start - sales before start
-                    "opening_qty": {
-                        "$add": [
-                            {"$ifNull": ["$orig_opening_balance", 0]},
-                            {"$ifNull": ["$before_purchase_qty", 0]},
-                            {"$multiply": [-1, {"$ifNull": ["$before_sales_qty", 0]}]},
-                        ]
-                    },
-                    # Opening value prefer orig_opening_value, but if missing compute from orig_opening_rate * orig_opening_balance
-                    "opening_value": {
-                        "$add": [
-                            {"$ifNull": ["$orig_opening_value", 0]},
-                            {"$ifNull": ["$before_purchase_value", 0]},
-                            {
-                                "$multiply": [
-                                    -1,
-                                    {"$ifNull": ["$before_sales_qty", 0]},
-                                    "$avg_purchase_rate",
-                                ]
-                            },
-                        ]
-                    },
-                }
-            },
-            {
-                "$addFields": {
-                    # combined_total_qty (used for avg cost calculation)
-                    "combined_qty_for_avg": {
-                        "$add": [
-                            {"$ifNull": ["$orig_opening_balance", 0]},
-                            {"$ifNull": ["$before_purchase_qty", 0]},
-                            {"$ifNull": ["$period_purchase_qty", 0]},
-                        ]
-                    },
-                    # combined_total_value for avg cost
-                    "combined_value_for_avg": {
-                        "$add": [
-                            {"$ifNull": ["$orig_opening_value", 0]},
-                            {"$ifNull": ["$before_purchase_value", 0]},
-                            {"$ifNull": ["$period_purchase_value", 0]},
-                        ]
-                    },
-                }
-            },
-            {
-                "$addFields": {
-                    # purchase rate during period
-                    "inwards_rate": {
-                        "$cond": [
-                            {"$gt": [{"$ifNull": ["$period_purchase_qty", 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$ifNull": ["$period_purchase_value", 0]},
-                                    {"$ifNull": ["$period_purchase_qty", 0]},
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                    # outwards rate during period
-                    "outwards_rate": {
-                        "$cond": [
-                            {"$gt": [{"$ifNull": ["$period_sales_qty", 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$ifNull": ["$period_sales_value", 0]},
-                                    {"$ifNull": ["$period_sales_qty", 0]},
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                    # average cost (weighted) used for COGS: if combined_qty_for_avg > 0 else fallback to opening_rate (or 0)
-                    "avg_cost_rate": {
-                        "$cond": [
-                            {"$gt": [{"$ifNull": ["$combined_qty_for_avg", 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$ifNull": ["$combined_value_for_avg", 0]},
-                                    {"$ifNull": ["$combined_qty_for_avg", 0]},
-                                ]
-                            },
-                            1,
-                        ]
-                    },
-                }
-            },
-            {
-                "$addFields": {
-                    # COGS for sales in period = period_sales_qty * avg_cost_rate
-                    "cogs": {
-                        "$multiply": [
-                            {"$ifNull": ["$period_sales_qty", 0]},
-                            {"$ifNull": ["$avg_cost_rate", 0]},
-                        ]
-                    },
-                },
-            },
-            {
-                "$addFields": {
-                    # gross profit = sales_value - cogs
-                    "gross_profit": {
-                        "$subtract": [
-                            {"$ifNull": ["$period_sales_value", 0]},
-                            {"$ifNull": ["$cogs", 0]},
-                        ]
-                    },
-                }
-            },
-            {
-                "$addFields": {
-                    # profit percent
-                    "profit_percent": {
-                        "$multiply": [
-                            {
-                                "$cond": [
-                                    {"$gt": [{"$ifNull": ["$period_sales_value", 0]}, 0]},
-                                    {
-                                        "$divide": [
-                                            {"$ifNull": ["$gross_profit", 0]},
-                                            {"$ifNull": ["$period_sales_value", 0]},
-                                        ]
-                                    },
-                                    0,
-                                ]
-                            },
-                            100,
-                        ]
-                    },
-                    # closing quantity
-                    "closing_qty": {
-                        "$subtract": [
-                            {
-                                "$add": [
-                                    {"$ifNull": ["$opening_qty", 0]},
-                                    {"$ifNull": ["$period_purchase_qty", 0]},
-                                ]
-                            },
-                            {"$ifNull": ["$period_sales_qty", 0]},
-                        ]
-                    },
-                    # closing_rate
-                    "closing_rate": {"$ifNull": ["$avg_cost_rate", 0]},
-                    # closing value = opening_value + purchase_value - cogs (value of sold items based on avg_cost)
-                    "closing_val": {
-                        "$multiply": [
-                            {
-                                "$subtract": [
-                                    {
-                                        "$add": [
-                                            {"$ifNull": ["$opening_qty", 0]},
-                                            {"$ifNull": ["$period_purchase_qty", 0]},
-                                        ]
-                                    },
-                                    {"$ifNull": ["$period_sales_qty", 0]},
-                                ]
-                            },
-                            {"$ifNull": ["$avg_cost_rate", 0]},
-                        ]
-                    },
-                },
-            },
-            # 8) final project only required fields (rename to desired keys)
-            {
-                "$project": {
-                    "item_id": "$_id",
-                    "item": "$stock_item_name",
-                    "unit": 1,
-                    "category": 1,
-                    # "unit_id": 1,
-                    # opening
-                    "opening_qty": {"$round": ["$opening_qty", 2]},
-                    "opening_rate": {"$round": ["$avg_purchase_rate", 2]},
-                    "opening_val": {"$round": ["$opening_value", 2]},
-                    # period (purchase & sales)
-                    "inwards_qty": {"$round": ["$period_purchase_qty", 2]},
-                    "inwards_val": {"$round": ["$period_purchase_value", 2]},
-                    "inwards_rate": {"$round": ["$inwards_rate", 2]},
-                    "outwards_qty": {"$round": ["$period_sales_qty", 2]},
-                    "outwards_val": {"$round": ["$period_sales_value", 2]},
-                    "outwards_rate": {"$round": ["$outwards_rate", 2]},
-                    # derived
-                    # "avg_cost_rate": 1,
-                    # "cogs": 1,
-                    "gross_profit": {"$round": ["$gross_profit", 2]},
-                    "profit_percent": {"$round": ["$profit_percent", 2]},
-                    "closing_qty": {"$round": ["$closing_qty", 2]},
-                    "closing_rate": {"$round": ["$closing_rate", 2]},
-                    "closing_val": {"$round": ["$closing_val", 2]},
-                }
-            },
-            {
-                "$match": {
-                    **(
-                        {
-                            "$or": [
-                                {
-                                    "item": {
-                                        "$regex": f"{search}",
-                                        "$options": "i",
-                                    }
-                                },
-                                {
-                                    "unit": {
-                                        "$regex": f"{search}",
-                                        "$options": "i",
-                                    }
-                                },
-                                {
-                                    "category": {
-                                        "$regex": f"{search}",
-                                        "$options": "i",
-                                    }
-                                },
-                            ]
-                        }
-                        if search not in ["", None]
-                        else {}
-                    ),
-                }
-            },
-            {"$match": {"category": category} if category not in ["", None] else {}},
-            {
-                "$sort": {"item": -1 if sort.sort_order == SortingOrder.ASC else 1},
-            },
-            {
-                "$facet": {
-                    "docs": [
-                        {"$skip": (pagination.paging.page - 1) * pagination.paging.limit},
-                        {"$limit": pagination.paging.limit},
-                    ],
-                    "count": [{"$count": "count"}],
-                }
-            },
-        ]
-
-        meta_pipeline = [
-            # Start from StockItem (ensures all items included)
-            {
-                "$match": filter_params,
-            },
-            {
-                "$lookup": {
-                    "from": "Inventory",
-                    "let": {"item_id": "$_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$item_id", "$$item_id"]}}},
-                        {
-                            "$lookup": {
-                                "from": "Voucher",
-                                "let": {"vouchar_id": "$vouchar_id"},
-                                "pipeline": [
-                                    {
-                                        "$match": {
-                                            "$expr": {"$eq": ["$_id", "$$vouchar_id"]}
-                                        }
-                                    },
-                                    {
-                                        "$project": {
-                                            "_id": 1,
-                                            "date": 1,
-                                            "voucher_number": 1,
-                                            "voucher_type": 1,
-                                            "additional_charge": 1,
-                                        }
-                                    },
-                                ],
-                                "as": "voucher_info",
-                            }
-                        },
-                        {
-                            "$unwind": {
-                                "path": "$voucher_info",
-                                "preserveNullAndEmptyArrays": True,
-                            }
-                        },
-                        {
-                            "$project": {
-                                "_id": 1,
-                                "item_id": 1,
-                                "vouchar_id": 1,
-                                "quantity": 1,
-                                "total_amount": 1,
-                                "voucher_info": 1,
-                            }
-                        },
-                    ],
-                    "as": "all_txns",
-                }
-            },
-            {
-                "$addFields": {
-                    # filter rows before start_date
-                    "txns_before_start": {
-                        "$filter": {
-                            "input": "$all_txns",
-                            "as": "t",
-                            "cond": {
-                                # convert voucher_info.date strings (YYYY-MM-DD) to dates for comparison
-                                "$lt": ["$$t.voucher_info.date", start_date]
-                            },
-                        }
-                    },
-                    # filter rows within [start_date, end_date]
-                    "txns_in_range": {
-                        "$filter": {
-                            "input": "$all_txns",
-                            "as": "t",
-                            "cond": {
-                                "$and": [
-                                    {"$gte": ["$$t.voucher_info.date", start_date]},
-                                    {"$lte": ["$$t.voucher_info.date", end_date]},
-                                ]
-                            },
-                        }
-                    },
-                }
-            },
-            {
-                "$addFields": {
-                    "before_summary": {
-                        "$reduce": {
-                            "input": "$txns_before_start",
-                            "initialValue": {
-                                "purchase_qty": 0,
-                                "purchase_value": 0,
-                                "sales_qty": 0,
-                                "sales_value": 0,
-                            },
-                            "in": {
-                                "$mergeObjects": [
-                                    "$$value",
-                                    {
-                                        "purchase_qty": {
-                                            "$add": [
-                                                "$$value.purchase_qty",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Purchase",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.quantity",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                        "purchase_value": {
-                                            "$add": [
-                                                "$$value.purchase_value",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Purchase",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.total_amount",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                        "sales_qty": {
-                                            "$add": [
-                                                "$$value.sales_qty",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Sales",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.quantity",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                        "sales_value": {
-                                            "$add": [
-                                                "$$value.sales_value",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Sales",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.total_amount",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                    },
-                                ]
-                            },
-                        }
-                    },
-                    # reduce txns_in_range to sums
-                    "range_summary": {
-                        "$reduce": {
-                            "input": "$txns_in_range",
-                            "initialValue": {
-                                "purchase_qty": 0,
-                                "purchase_value": 0,
-                                "sales_qty": 0,
-                                "sales_value": 0,
-                            },
-                            "in": {
-                                "$mergeObjects": [
-                                    "$$value",
-                                    {
-                                        "purchase_qty": {
-                                            "$add": [
-                                                "$$value.purchase_qty",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Purchase",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.quantity",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                        "purchase_value": {
-                                            "$add": [
-                                                "$$value.purchase_value",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Purchase",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.total_amount",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                        "sales_qty": {
-                                            "$add": [
-                                                "$$value.sales_qty",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Sales",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.quantity",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                        "sales_value": {
-                                            "$add": [
-                                                "$$value.sales_value",
-                                                {
-                                                    "$cond": [
-                                                        {
-                                                            "$eq": [
-                                                                "$$this.voucher_info.voucher_type",
-                                                                "Sales",
-                                                            ]
-                                                        },
-                                                        {
-                                                            "$ifNull": [
-                                                                "$$this.total_amount",
-                                                                0,
-                                                            ]
-                                                        },
-                                                        0,
-                                                    ]
-                                                },
-                                            ]
-                                        },
-                                    },
-                                ]
-                            },
-                        }
-                    },
-                }
-            },
-            # 5) compute final fields: opening, purchases, sales
-            {
-                "$addFields": {
-                    # original stored opening values (from StockItem document)
-                    "orig_opening_balance": {"$ifNull": ["$opening_balance", 0]},
-                    "orig_opening_rate": {"$ifNull": ["$opening_rate", 0]},
-                    "orig_opening_value": {
-                        "$ifNull": [
-                            "$opening_value",
-                            {
-                                "$multiply": [
-                                    {"$ifNull": ["$opening_balance", 0]},
-                                    {"$ifNull": ["$opening_rate", 0]},
-                                ]
-                            },
-                        ]
-                    },
-                    # opening adjustments from txns before start
-                    "before_purchase_qty": {
-                        "$ifNull": ["$before_summary.purchase_qty", 0]
-                    },
-                    "before_purchase_value": {
-                        "$ifNull": ["$before_summary.purchase_value", 0]
-                    },
-                    "before_sales_qty": {"$ifNull": ["$before_summary.sales_qty", 0]},
-                    "before_sales_value": {"$ifNull": ["$before_summary.sales_value", 0]},
-                    # period (start..end) sums
-                    "period_purchase_qty": {
-                        "$ifNull": ["$range_summary.purchase_qty", 0]
-                    },
-                    "period_purchase_value": {
-                        "$ifNull": ["$range_summary.purchase_value", 0]
-                    },
-                    "period_sales_qty": {"$ifNull": ["$range_summary.sales_qty", 0]},
-                    "period_sales_value": {"$ifNull": ["$range_summary.sales_value", 0]},
-                }
-            },
-            {
-                "$addFields": {
-                    # opening adjustments from txns before start
-                    "before_purchase_rate": {
-                        "$cond": [
-                            {"$gt": [{"$ifNull": ["$before_purchase_qty", 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$ifNull": ["$before_purchase_value", 0]},
-                                    {"$ifNull": ["$before_purchase_qty", 0]},
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                    "before_sales_rate": {
-                        "$cond": [
-                            {"$gt": [{"$ifNull": ["$before_sales_qty", 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$ifNull": ["$before_sales_value", 0]},
-                                    {"$ifNull": ["$before_sales_qty", 0]},
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                    # period (start..end) sums
-                    "period_purchase_rate": {
-                        "$cond": [
-                            {"$gt": [{"$ifNull": ["$period_purchase_qty", 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$ifNull": ["$period_purchase_value", 0]},
-                                    {"$ifNull": ["$period_purchase_qty", 0]},
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                    "period_sales_rate": {
-                        "$cond": [
-                            {"$gt": [{"$ifNull": ["$period_sales_qty", 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$ifNull": ["$period_sales_value", 0]},
-                                    {"$ifNull": ["$period_sales_qty", 0]},
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                    "avg_purchase_rate": { 
-                        "$cond": [
-                            {"$gt": [{"$ifNull": [{"$sum": ["$orig_opening_balance", "$before_purchase_qty"]}, 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$sum": ["$orig_opening_value", "$before_purchase_value" ]},
-                                    {"$sum": ["$orig_opening_balance", "$before_purchase_qty"]},
-                                ]
-                            },
-                            0
-                        ]
-                    }
-                }
-            },
-            # 6) compute opening_qty/value, average cost, cogs, profit, closing
-            {
-                "$addFields": {
-                    # Opening quantity = stored opening_balance + purchases before start - sales before start
-                    "opening_qty": {
-                        "$add": [
-                            {"$ifNull": ["$orig_opening_balance", 0]},
-                            {"$ifNull": ["$before_purchase_qty", 0]},
-                            {"$multiply": [-1, {"$ifNull": ["$before_sales_qty", 0]}]},
-                        ]
-                    },
-                    # Opening value prefer orig_opening_value, but if missing compute from orig_opening_rate * orig_opening_balance
-                    "opening_value": {
-                        "$add": [
-                            {"$ifNull": ["$orig_opening_value", 0]},
-                            {"$ifNull": ["$before_purchase_value", 0]},
-                            {
-                                "$multiply": [
-                                    -1,
-                                    {"$ifNull": ["$before_sales_qty", 0]},
-                                    "$avg_purchase_rate",
-                                ]
-                            },
-                        ]
-                    },
-                }
-            },
-            {
-                "$addFields": {
-                    # combined_total_qty (used for avg cost calculation)
-                    "combined_qty_for_avg": {
-                        "$add": [
-                            {"$ifNull": ["$opening_qty", 0]},
-                            {"$ifNull": ["$before_purchase_qty", 0]},
-                            {"$ifNull": ["$period_purchase_qty", 0]},
-                        ]
-                    },
-                    # combined_total_value for avg cost
-                    "combined_value_for_avg": {
-                        "$add": [
-                            {"$ifNull": ["$opening_value", 0]},
-                            {"$ifNull": ["$before_purchase_value", 0]},
-                            {"$ifNull": ["$period_purchase_value", 0]},
-                        ]
-                    },
-                }
-            },
-            # 7) calculate rates, cogs, gross profit, closing values
-            {
-                "$addFields": {
-                    # purchase rate during period
-                    "inwards_rate": {
-                        "$cond": [
-                            {"$gt": [{"$ifNull": ["$period_purchase_qty", 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$ifNull": ["$period_purchase_value", 0]},
-                                    {"$ifNull": ["$period_purchase_qty", 0]},
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                    # outwards rate during period
-                    "outwards_rate": {
-                        "$cond": [
-                            {"$gt": [{"$ifNull": ["$period_sales_qty", 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$ifNull": ["$period_sales_value", 0]},
-                                    {"$ifNull": ["$period_sales_qty", 0]},
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                    # average cost (weighted) used for COGS: if combined_qty_for_avg > 0 else fallback to opening_rate (or 0)
-                    "avg_cost_rate": {
-                        "$cond": [
-                            {"$gt": [{"$ifNull": ["$combined_qty_for_avg", 0]}, 0]},
-                            {
-                                "$divide": [
-                                    {"$ifNull": ["$combined_value_for_avg", 0]},
-                                    {"$ifNull": ["$combined_qty_for_avg", 0]},
-                                ]
-                            },
-                            {
-                                "$cond": [
-                                    {"$gt": [{"$ifNull": ["$opening_qty", 0]}, 0]},
-                                    {
-                                        "$divide": [
-                                            {"$ifNull": ["$opening_value", 0]},
-                                            {"$ifNull": ["$opening_qty", 0]},
-                                        ]
-                                    },
-                                    0,
-                                ]
-                            },
-                        ]
-                    },
-                }
-            },
-            {
-                "$addFields": {
-                    # COGS for sales in period = period_sales_qty * avg_cost_rate
-                    "cogs": {
-                        "$multiply": [
-                            {"$ifNull": ["$period_sales_qty", 0]},
-                            {"$ifNull": ["$avg_cost_rate", 0]},
-                        ]
-                    },
-                },
-            },
-            {
-                "$addFields": {
-                    # gross profit = sales_value - cogs
-                    "gross_profit": {
-                        "$subtract": [
-                            {"$ifNull": ["$period_sales_value", 0]},
-                            {"$ifNull": ["$cogs", 0]},
-                        ]
-                    },
-                }
-            },
-            {
-                "$addFields": {
-                    # profit percent
-                    "profit_percent": {
-                        "$multiply": [
-                            {
-                                "$cond": [
-                                    {"$gt": [{"$ifNull": ["$period_sales_value", 0]}, 0]},
-                                    {
-                                        "$divide": [
-                                            {"$ifNull": ["$gross_profit", 0]},
-                                            {"$ifNull": ["$period_sales_value", 0]},
-                                        ]
-                                    },
-                                    0,
-                                ]
-                            },
-                            100,
-                        ]
-                    },
-                    # closing quantity
-                    "closing_qty": {
-                        "$subtract": [
-                            {
-                                "$add": [
-                                    {"$ifNull": ["$opening_qty", 0]},
-                                    {"$ifNull": ["$period_purchase_qty", 0]},
-                                ]
-                            },
-                            {"$ifNull": ["$period_sales_qty", 0]},
-                        ]
-                    },
-                    # closing_rate
-                    "closing_rate": {"$ifNull": ["$avg_cost_rate", 0]},
-                    # closing value = opening_value + purchase_value - cogs (value of sold items based on avg_cost)
-                    "closing_val": {
-                        "$multiply": [
-                            {
-                                "$subtract": [
-                                    {
-                                        "$add": [
-                                            {"$ifNull": ["$opening_qty", 0]},
-                                            {"$ifNull": ["$period_purchase_qty", 0]},
-                                        ]
-                                    },
-                                    {"$ifNull": ["$period_sales_qty", 0]},
-                                ]
-                            },
-                            {"$ifNull": ["$avg_cost_rate", 0]},
-                        ]
-                    },
-                },
-            },
-            # 8) final project only required fields (rename to desired keys)
-            {
-                "$project": {
-                    "item_id": "$_id",
-                    "item": "$stock_item_name",
-                    "unit": 1,
-                    # "unit_id": 1,
-                    # opening
-                    "opening_qty": {"$round": ["$opening_qty", 2]},
-                    "opening_rate": {"$round": ["$avg_purchase_rate", 2]},
-                    "opening_val": {"$round": ["$opening_value", 2]},
-                    # period (purchase & sales)
-                     "inwards_qty": {"$round": ["$period_purchase_qty", 2]},
-                    "inwards_val": {"$round": ["$period_purchase_value", 2]},
-                    "inwards_rate": {"$round": ["$inwards_rate", 2]},
-                    "outwards_qty": {"$round": ["$period_sales_qty", 2]},
-                    "outwards_val": {"$round": ["$period_sales_value", 2]},
-                    "outwards_rate": {"$round": ["$outwards_rate", 2]},
-                    # derived
-                    # "avg_cost_rate": 1,
-                    # "cogs": 1,
-                    "gross_profit": {"$round": ["$gross_profit", 2]},
-                    "profit_percent": {"$round": ["$profit_percent", 2]},
-                    "closing_qty": {"$round": ["$closing_qty", 2]},
-                    "closing_rate": {"$round": ["$closing_rate", 2]},
-                    "closing_val": {"$round": ["$closing_val", 2]},
-                }
-            },
-        ]
-
-        response = await asyncio.gather(
-            fetch_all(self.collection.aggregate(pipeline)),
-            fetch_all(self.collection.aggregate(meta_pipeline)),
-        )
-        res = response[0]
-        totals_res = response[1]
-        docs = res[0]["docs"]
-        opening_val = sum((doc.get("opening_val") or 0) for doc in totals_res)
-        inwards_val = sum((doc.get("inwards_val") or 0) for doc in totals_res)
-        outwards_val = sum((doc.get("outwards_val") or 0) for doc in totals_res)
-        closing_val = sum((doc.get("closing_val") or 0) for doc in totals_res)
-        gross_profit = sum((doc.get("gross_profit") or 0) for doc in totals_res)
-        profit_percent = gross_profit / outwards_val * 100 if outwards_val != 0 else 0
-
-        count = res[0]["count"][0]["count"] if len(res[0]["count"]) > 0 else 0
+        start_date = (start_date or "")[:10]
+        end_date = (end_date or "")[:10]
+
+        timeline = await StockTimeline(
+            current_user.user_id, company_id, start_date, end_date
+        ).load()
+
+        # The listing has always sorted names descending for ASC
+        query = self.timeline_items(
+            company_id,
+            current_user.user_id,
+            search=search,
+            category=category,
+            descending=sort.sort_order == SortingOrder.ASC,
+        )
+        page = self.find(
+            **query,
+            limit=pagination.paging.limit,
+        ).skip((pagination.paging.page - 1) * pagination.paging.limit)
+        docs = [row async for row in timeline.rows(page)]
+        count = await self.count(query["filter"])
+
+        # Totals cover every item of the company, whatever the search
+        totals = dict.fromkeys(
+            ("opening_val", "inwards_val", "outwards_val", "closing_val", "gross_profit"),
+            0,
+        )
+        everything = self.find(**self.timeline_items(company_id, current_user.user_id))
+        async for row in timeline.rows(everything):
+            for field in totals:
+                totals[field] += row[field] or 0
+        outwards_val = totals["outwards_val"]
+        profit_percent = (
+            totals["gross_profit"] / outwards_val * 100 if outwards_val != 0 else 0
+        )
 
         class Meta2(Page):
             total: int
@@ -3343,14 +1676,9 @@ class StockItemRepo(BaseMongoDbCrud[StockItemDB]):
                 page=pagination.paging.page,
                 limit=pagination.paging.limit,
                 total=count,
-                opening_val=round(opening_val, 2),
-                inwards_val=round(inwards_val, 2),
-                outwards_val=round(outwards_val, 2),
-                closing_val=round(closing_val, 2),
-                gross_profit=round(gross_profit, 2),
+                **{field: round(value, 2) for field, value in totals.items()},
                 profit_percent=round(profit_percent, 2),
             ),
         )
 
-
 stock_item_repo = StockItemRepo()
@@ -0,0 +1,181 @@
+"""------------------------------------------------------------------------------------------------------------------------
+                                                    STOCK TIMELINE
+------------------------------------------------------------------------------------------------------------------------
+Opening / inward / outward / closing figures per stock item for a date window.
+
+Inventory rows carry their voucher's date and type, so the window's purchases and
+sales are one range scan of the (user_id, company_id, date) index grouped by
+item. The opening adjustments start from the last month-end BalanceSnapshot
+before the window plus the same kind of scan over the days since.
+The stock items are then streamed in order and each one's figures are worked out
+in Python from its opening fields and the two groups: no per-item $lookup, and
+the rows are never held in memory as arrays.
+"""
+
+import asyncio
+from typing import AsyncIterator, Dict
+
+from app.database.repositories.InventoryRepo import inventory_repo
+from app.database.repositories.balanceSnapshotRepo import (
+    STOCK,
+    after_month,
+    balance_snapshot_repo,
+)
+
+MOVEMENT_FIELDS = ("purchase_qty", "purchase_value", "sales_qty", "sales_value")
+
+# Stock item fields the figures are worked out from
+ITEM_PROJECTION = {
+    "stock_item_name": 1,
+    "unit": 1,
+    "category": 1,
+    "opening_balance": 1,
+    "opening_rate": 1,
+    "opening_value": 1,
+}
+
+NO_MOVEMENT = dict.fromkeys(MOVEMENT_FIELDS, 0)
+
+# Columns of the exported report, in order
+EXPORT_FIELDS = [
+    "item",
+    "unit",
+    "category",
+    "opening_qty",
+    "opening_rate",
+    "opening_val",
+    "inwards_qty",
+    "inwards_rate",
+    "inwards_val",
+    "outwards_qty",
+    "outwards_rate",
+    "outwards_val",
+    "gross_profit",
+    "profit_percent",
+    "closing_qty",
+    "closing_rate",
+    "closing_val",
+]
+
+
+class StockTimeline:
+    """
+    STOCK TIMELINE
+    --------------
+    One report window of one company. load() runs the grouped scans, then
+    row(item) gives the figures of a StockItem document (with ITEM_PROJECTION)
+    and rows(cursor) streams them for a whole cursor of items, e.g. for export.
+    An empty start_date / end_date leaves that side of the window open.
+    """
+
+    def __init__(self, user_id: str, company_id: str, start_date: str, end_date: str):
+        self.user_id = user_id
+        self.company_id = company_id
+        self.start_date = start_date or None
+        self.end_date = end_date or None
+        self.before: Dict[str, dict] = {}
+        self.period: Dict[str, dict] = {}
+
+    async def load(self) -> "StockTimeline":
+        period = {}
+        if self.start_date:
+            period["$gte"] = self.start_date
+        if self.end_date:
+            period["$lte"] = self.end_date
+
+        self.before, self.period = await asyncio.gather(
+            self.opening_movements(),
+            inventory_repo.movement_totals(
+                self.user_id, self.company_id, period or {"$exists": True}
+            ),
+        )
+        return self
+
+    async def opening_movements(self) -> Dict[str, dict]:
+        """Purchases and sales before the window, folded into the opening figures."""
+        if not self.start_date:
+            return {}
+        month, totals = await balance_snapshot_repo.totals(
+            STOCK, self.user_id, self.company_id, self.start_date
+        )
+        date = {"$lt": self.start_date}
+        if month is not None:
+            date["$gt"] = after_month(month)
+
+        for item_id, moved in (
+            await inventory_repo.movement_totals(self.user_id, self.company_id, date)
+        ).items():
+            carried = totals.setdefault(item_id, dict(NO_MOVEMENT))
+            for field in MOVEMENT_FIELDS:
+                carried[field] = (carried.get(field) or 0) + (moved.get(field) or 0)
+        return totals
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    def row(self, item: dict) -> dict:
+        before = self.before.get(item["_id"], NO_MOVEMENT)
+        period = self.period.get(item["_id"], NO_MOVEMENT)
+
+        opening_balance = item.get("opening_balance") or 0
+        opening_value = item.get("opening_value")
+        if opening_value is None:
+            opening_value = opening_balance * (item.get("opening_rate") or 0)
+
+        # Weighted purchase rate of the stock held at the start of the window
+        basis_qty = opening_balance + before["purchase_qty"]
+        avg_purchase_rate = (
+            (opening_value + before["purchase_value"]) / basis_qty if basis_qty > 0 else 0
+        )
+        opening_qty = basis_qty - before["sales_qty"]
+        opening_val = (
+            opening_value
+            + before["purchase_value"]
+            - before["sales_qty"] * avg_purchase_rate
+        )
+
+        # Weighted cost of everything bought up to the end of the window (COGS basis)
+        combined_qty = basis_qty + period["purchase_qty"]
+        combined_value = (
+            opening_value + before["purchase_value"] + period["purchase_value"]
+        )
+        avg_cost_rate = combined_value / combined_qty if combined_qty > 0 else 1
+
+        inwards_rate = (
+            period["purchase_value"] / period["purchase_qty"]
+            if period["purchase_qty"] > 0
+            else 0
+        )
+        outwards_rate = (
+            period["sales_value"] / period["sales_qty"] if period["sales_qty"] > 0 else 0
+        )
+        gross_profit = period["sales_value"] - period["sales_qty"] * avg_cost_rate
+        profit_percent = (
+            gross_profit / period["sales_value"] * 100 if period["sales_value"] > 0 else 0
+        )
+        closing_qty = opening_qty + period["purchase_qty"] - period["sales_qty"]
+
+        return {
+            "_id": item["_id"],
+            "item_id": item["_id"],
+            "item": item.get("stock_item_name"),
+            "unit": item.get("unit"),
+            "category": item.get("category"),
+            "opening_qty": round(opening_qty, 2),
+            "opening_rate": round(avg_purchase_rate, 2),
+            "opening_val": round(opening_val, 2),
+            "inwards_qty": round(period["purchase_qty"], 2),
+            "inwards_val": round(period["purchase_value"], 2),
+            "inwards_rate": round(inwards_rate, 2),
+            "outwards_qty": round(period["sales_qty"], 2),
+            "outwards_val": round(period["sales_value"], 2),
+            "outwards_rate": round(outwards_rate, 2),
+            "gross_profit": round(gross_profit, 2),
+            "profit_percent": round(profit_percent, 2),
+            "closing_qty": round(closing_qty, 2),
+            "closing_rate": round(avg_cost_rate, 2),
+            "closing_val": round(closing_qty * avg_cost_rate, 2),
+        }
+
+    async def rows(self, items) -> AsyncIterator[dict]:
+        async for item in items:
+            yield self.row(item)
@@ -1,8 +1,11 @@
-from typing import List
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
 
 from fastapi import status
 from loguru import logger
-from pymongo.errors import DuplicateKeyError
+from pymongo.errors import DuplicateKeyError, OperationFailure
 
 from app.Config import ENV_PROJECT
 from app import http_exception
@@ -11,6 +14,103 @@ from ..models.token import RefreshTokenCreate, RefreshTokenDB
 from .crud.base_mongo_crud import BaseMongoDbCrud
 
 
+TokenKey = Tuple[str, str, str]  # (user_id, device_type, user_type)
+
+
+class TokenVersionCache:
+    """
+    In-process TTL cache of token_version per (user_id, device_type, user_type),
+    so get_current_user does not read the token collection on every request.
+
+    Every write through RefreshTokenRepository invalidates the user's entries in
+    this worker. Other workers learn about it from a change stream on the token
+    collection (see watch()); without a replica set the TTL bounds how long a
+    revoked access token can still be accepted by another worker.
+    """
+
+    def __init__(self, ttl: int, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[TokenKey, Tuple[int, str, float]]" = OrderedDict()
+        self._by_document: Dict[str, TokenKey] = {}
+        self._by_user: Dict[str, Set[TokenKey]] = {}
+        self._watcher: Optional[asyncio.Task] = None
+
+    def get(self, key: TokenKey) -> Optional[int]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        version, _, expires = entry
+        if expires < time.monotonic():
+            self._drop(key)
+            return None
+        return version
+
+    def put(self, key: TokenKey, version: int, document_id: str):
+        self._drop(key)
+        self._entries[key] = (version, document_id, time.monotonic() + self.ttl)
+        self._by_document[document_id] = key
+        self._by_user.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: TokenKey):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._by_document.pop(entry[1], None)
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+    def invalidate_user(self, user_id: str):
+        for key in list(self._by_user.get(user_id, ())):
+            self._drop(key)
+
+    def invalidate_document(self, document_id: str):
+        key = self._by_document.get(document_id)
+        if key is not None:
+            self._drop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_document.clear()
+        self._by_user.clear()
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    def start(self, collection):
+        self._watcher = asyncio.create_task(self.watch(collection))
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+
+    async def watch(self, collection):
+        """Drop entries whose token document changed in any worker."""
+        while True:
+            try:
+                async with collection.watch() as stream:
+                    # Anything may have changed while the stream was down
+                    self.clear()
+                    async for change in stream:
+                        self.invalidate_document(change["documentKey"]["_id"])
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                # Standalone servers have no change streams; rely on the TTL
+                logger.warning(f"Token cache change stream unavailable: {e}")
+                return
+            except Exception as e:
+                logger.warning(f"Token cache change stream dropped: {e}")
+                self.clear()
+                await asyncio.sleep(5)
+
+
 class RefreshTokenRepository(BaseMongoDbCrud[RefreshTokenDB]):
     def __init__(self):
         super().__init__(
@@ -28,6 +128,52 @@ class RefreshTokenRepository(BaseMongoDbCrud[RefreshTokenDB]):
         except Exception as e:
             logger.error(e)
             raise http_exception.InternalServerErrorException()
+        finally:
+            token_version_cache.invalidate_user(data.user_id)
+
+    async def token_version(self, user_id: str, device_type: str, user_type: str):
+        """Current token_version for a login, or None when it was revoked."""
+        key = (user_id, device_type, user_type)
+        version = token_version_cache.get(key)
+        if version is not None:
+            return version
+
+        db_token = await self.findOne(
+            {"user_id": user_id, "device_type": device_type, "user_type": user_type},
+            {"token_version"},
+        )
+        if not db_token:
+            return None
+        version = db_token.get("token_version", 1)
+        token_version_cache.put(key, version, db_token["_id"])
+        return version
+
+    # Writes below drop the affected cache entries of this worker.
+
+    async def update_one(self, filter: dict, update: dict):
+        result = await super().update_one(filter, update)
+        self._invalidate(filter)
+        return result
+
+    async def deleteOne(self, filter: dict):
+        deleted = await self.collection.find_one_and_delete(
+            {**filter, **self.default_filter}, projection={"user_id": 1}
+        )
+        if deleted is not None:
+            token_version_cache.invalidate_user(deleted["user_id"])
+        return deleted
+
+    async def deleteAll(self, filter: dict):
+        result = await super().deleteAll(filter)
+        self._invalidate(filter)
+        return result
+
+    def _invalidate(self, filter: dict):
+        if isinstance(filter.get("user_id"), str):
+            token_version_cache.invalidate_user(filter["user_id"])
+        else:
+            token_version_cache.clear()
 
 
+token_version_cache = TokenVersionCache(ttl=ENV_PROJECT.TOKEN_CACHE_TTL_SECONDS)
 refresh_token_repo = RefreshTokenRepository()
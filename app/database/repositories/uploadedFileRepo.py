@@ -0,0 +1,23 @@
+from typing import Optional
+
+from app.Config import ENV_PROJECT
+from app.database.models.UploadedFile import UploadedFile, UploadedFileDB
+from .crud.base_mongo_crud import BaseMongoDbCrud
+
+
+class UploadedFileRepo(BaseMongoDbCrud[UploadedFileDB]):
+    def __init__(self):
+        super().__init__(ENV_PROJECT.MONGO_DATABASE, "UploadedFile")
+
+    async def lookup(self, digest: str) -> Optional[dict]:
+        return await self.collection.find_one({"_id": digest})
+
+    async def remember(self, digest: str, uploaded: UploadedFile):
+        """Record an upload; concurrent uploads of the same content keep the first."""
+        document = self.serializer(UploadedFileDB(_id=digest, **uploaded.model_dump()))
+        await self.collection.update_one(
+            {"_id": digest}, {"$setOnInsert": document}, upsert=True
+        )
+
+
+uploaded_file_repo = UploadedFileRepo()
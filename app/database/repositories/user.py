@@ -4,6 +4,7 @@ from app.database.models.user import User, UserDB
 from app.oauth2 import get_current_user
 from app.schema.token import TokenData
 from .crud.base_mongo_crud import BaseMongoDbCrud
+from .crud.mixins import LastLoginMixin
 from app.database.repositories.crud.base import (
     PageRequest,
     Meta,
@@ -13,7 +14,7 @@ from app.database.repositories.crud.base import (
 )
 
 
-class userRepo(BaseMongoDbCrud[UserDB]):
+class userRepo(LastLoginMixin, BaseMongoDbCrud[UserDB]):
     def __init__(self):
         super().__init__(ENV_PROJECT.MONGO_DATABASE, "User", unique_attributes=["email"])
 
@@ -1,11 +1,20 @@
-from typing import Any, List, Union
+from typing import Any, Dict, List, Optional, Union
 from fastapi import Depends
 from pydantic import BaseModel
 from app.Config import ENV_PROJECT
 from app.database.models.Vouchar import Voucher, VoucherDB
+from app.database.models.Accounting import AccountingDB
+from app.database.models.Inventory import InventoryItemDB
 from app.oauth2 import get_current_user
 from app.schema.token import TokenData
 from .crud.base_mongo_crud import BaseMongoDbCrud
+from .crud.cursor import keyset_page, keyset_stages, listing_totals, sort_key, totals_key
+from .analyticsRollupRepo import analytics_rollup_repo
+from .accountingRepo import accounting_repo
+from .InventoryRepo import inventory_repo
+from .voucharCounterRepo import vouchar_counter_repo
+from pymongo import DeleteMany, IndexModel, InsertOne, UpdateOne
+from pymongo.errors import OperationFailure
 from app.database.repositories.crud.base import (
     PageRequest,
     Meta,
@@ -19,6 +28,32 @@ from datetime import datetime, timedelta
 import math
 import calendar
 
+# Voucher fields the cursor listing can sort on before the joins run
+CURSOR_SORT_FIELDS = {
+    "date",
+    "voucher_number",
+    "voucher_type",
+    "party_name",
+    "created_at",
+}
+
+# Voucher fields copied onto its Accounting / Inventory rows, so reports can
+# filter and sort the rows by company and date without joining Voucher.
+ENTRY_FIELDS = (
+    "user_id",
+    "company_id",
+    "date",
+    "voucher_type",
+    "voucher_number",
+    "party_name",
+    "party_name_id",
+)
+
+
+def entry_fields(voucher: dict) -> dict:
+    """The ENTRY_FIELDS present in `voucher` (a document or a $set)."""
+    return {field: voucher[field] for field in ENTRY_FIELDS if field in voucher}
+
 
 def convert_to_daily_data(docs):
     if not docs:
@@ -116,7 +151,59 @@ def month_range(sd: datetime, ed: datetime):
     return months
 
 
+def entry_operations(
+    existing: List[dict], received: List[dict], key: str = None, fields: dict = None
+):
+    """
+    Diff the rows submitted for a voucher against the stored ones.
+
+    Each received row is {"entry_id", "set", "new"}: the fields to update when a
+    stored row with that id (and the same `key` field) exists, otherwise the full
+    document to insert, stamped with the voucher's `fields` (see entry_fields).
+    Returns the bulk_write operations (changed rows only, plus one DeleteMany for
+    rows no longer submitted) and the resulting rows.
+    """
+    stored = {str(row["_id"]): row for row in existing}
+    now = datetime.now()
+
+    operations = []
+    rows = []
+    kept = set()
+    for row in received:
+        current = stored.get(str(row["entry_id"]))
+        if current is not None and (key is None or current.get(key) == row["new"].get(key)):
+            kept.add(str(current["_id"]))
+            changes = {
+                field: value
+                for field, value in row["set"].items()
+                if current.get(field) != value
+            }
+            if changes:
+                changes["updated_at"] = now
+                operations.append(UpdateOne({"_id": current["_id"]}, {"$set": changes}))
+            rows.append({**current, **changes})
+        else:
+            document = {**row["new"], **(fields or {})}
+            operations.append(InsertOne(document))
+            rows.append(document)
+
+    removed = [row["_id"] for row_id, row in stored.items() if row_id not in kept]
+    if removed:
+        operations.append(DeleteMany({"_id": {"$in": removed}}))
+
+    return operations, rows
+
+
 class VoucherRepo(BaseMongoDbCrud[VoucherDB]):
+    indexes = [
+        # Listings, dashboards and reports: one company, newest first
+        IndexModel([("user_id", 1), ("company_id", 1), ("date", -1)]),
+        IndexModel(
+            [("user_id", 1), ("company_id", 1), ("voucher_type", 1), ("date", -1)]
+        ),
+        IndexModel([("party_name_id", 1)]),
+    ]
+
     def __init__(self):
         super().__init__(
             ENV_PROJECT.MONGO_DATABASE,
@@ -133,6 +220,157 @@ class VoucherRepo(BaseMongoDbCrud[VoucherDB]):
     async def new(self, sub: Voucher):
         return await self.save(VoucherDB(**sub.model_dump()))
 
+    async def create_with_entries(
+        self,
+        voucher: VoucherDB,
+        accounting: List[AccountingDB],
+        inventory: List[InventoryItemDB],
+        counter_filter: Union[dict, None] = None,
+    ) -> VoucherDB:
+        """
+        Insert a voucher with all of its accounting and inventory rows (and bump
+        its VoucherCounter when counter_filter is given) in one transaction.
+
+        Rows are written with insert_many, so an invoice costs a handful of round
+        trips whatever its length. On a standalone server, which has no
+        transactions, the same writes run unsessioned and are undone on failure.
+        """
+
+        document = self.serializer(voucher)
+        fields = entry_fields(document)
+
+        async def write(session=None):
+            await self.collection.insert_one(document, session=session)
+            if accounting:
+                await accounting_repo.collection.insert_many(
+                    [{**accounting_repo.serializer(row), **fields} for row in accounting],
+                    session=session,
+                )
+            if inventory:
+                await inventory_repo.collection.insert_many(
+                    [{**inventory_repo.serializer(row), **fields} for row in inventory],
+                    session=session,
+                )
+            if counter_filter:
+                await vouchar_counter_repo.collection.update_one(
+                    counter_filter, {"$inc": {"current_number": 1}}, session=session
+                )
+
+        async def undo():
+            await accounting_repo.deleteAll({"vouchar_id": voucher.vouchar_id})
+            await inventory_repo.deleteAll({"vouchar_id": voucher.vouchar_id})
+            await self.deleteById(voucher.vouchar_id)
+
+        await self.run_in_transaction(write, undo)
+        return voucher
+
+    async def update_with_entries(
+        self,
+        voucher_filter: dict,
+        voucher_update: dict,
+        accounting_operations: List[Any],
+        inventory_operations: List[Any],
+        fields: dict = None,
+    ):
+        """
+        Update a voucher and apply the accounting / inventory diffs computed by
+        `entry_operations`, one bulk_write per collection, in one transaction.
+        The voucher's ENTRY_FIELDS are then copied onto all of its rows again:
+        pass the full `fields` of the updated voucher (stored document merged
+        with the $set), otherwise only those in the $set are copied.
+        """
+        if fields is None:
+            fields = entry_fields(voucher_update.get("$set", {}))
+
+        async def write(session=None):
+            result = await self.collection.update_one(
+                voucher_filter, voucher_update, session=session
+            )
+            if accounting_operations:
+                await accounting_repo.collection.bulk_write(
+                    accounting_operations, session=session
+                )
+            if inventory_operations:
+                await inventory_repo.collection.bulk_write(
+                    inventory_operations, session=session
+                )
+            if fields:
+                for repository in (accounting_repo, inventory_repo):
+                    await repository.collection.update_many(
+                        {"vouchar_id": voucher_filter["_id"]},
+                        {"$set": fields},
+                        session=session,
+                    )
+            return result
+
+        return await self.run_in_transaction(write)
+
+    async def backfill_entry_fields(self, company_id: str = None) -> Dict[str, int]:
+        """
+        Copy ENTRY_FIELDS from every voucher (of one company, or all of them)
+        onto its Accounting and Inventory rows, server side with $merge. Needed
+        once for rows written before the fields existed; safe to run again.
+        """
+        match = {"company_id": company_id} if company_id else {}
+        copied = {}
+        for repository in (accounting_repo, inventory_repo):
+            await repository.ensure_indexes()
+            await self.collection.aggregate(
+                [
+                    {"$match": match},
+                    {
+                        "$lookup": {
+                            "from": repository.collection_name,
+                            "localField": "_id",
+                            "foreignField": "vouchar_id",
+                            "as": "entries",
+                        }
+                    },
+                    {"$unwind": "$entries"},
+                    {
+                        "$project": {
+                            "_id": "$entries._id",
+                            **{field: f"${field}" for field in ENTRY_FIELDS},
+                        }
+                    },
+                    {
+                        "$merge": {
+                            "into": repository.collection_name,
+                            "on": "_id",
+                            "whenMatched": "merge",
+                            "whenNotMatched": "discard",
+                        }
+                    },
+                ],
+                allowDiskUse=True,
+            ).to_list(None)
+            copied[repository.collection_name] = await repository.count(
+                {**match, "date": {"$ne": None}}
+            )
+        return copied
+
+    async def run_in_transaction(self, write, undo=None):
+        """
+        Run `write(session)` in a transaction. A standalone server has no
+        transactions, there `write(None)` runs unsessioned and `undo()` (when
+        given) cleans up after a failure.
+        """
+        try:
+            async with await self.client.start_session() as session:
+                async with session.start_transaction():
+                    return await write(session)
+        except OperationFailure as e:
+            # 20 = IllegalOperation: transactions need a replica set or mongos
+            if e.code != 20:
+                raise
+
+        try:
+            return await write()
+        except Exception:
+            if undo is not None:
+                await undo()
+            raise
+
     async def viewAllVouchar(
         self,
         search: str,
@@ -174,8 +412,8 @@ class VoucherRepo(BaseMongoDbCrud[VoucherDB]):
         else:
             sort_stage = {"date": -1, "voucher_number": -1}
 
-        pipeline = [
-            {"$match": filter_params},
+        match = {"$match": filter_params}
+        joins = [
             {
                 "$lookup": {
                     "from": "Ledger",
@@ -271,95 +509,112 @@ class VoucherRepo(BaseMongoDbCrud[VoucherDB]):
                     "created_at": 1,
                 }
             },
-            {"$sort": sort_stage},
-            {
-                "$match": {
-                    **(
-                        {
-                            "$or": [
-                                {
-                                    "voucher_number": {
-                                        "$regex": f"{search}",
-                                        "$options": "i",
-                                    }
-                                },
-                                {
-                                    "voucher_type": {
-                                        "$regex": f"{search}",
-                                        "$options": "i",
-                                    }
-                                },
-                                {
-                                    "party_name": {
-                                        "$regex": f"{search}",
-                                        "$options": "i",
-                                    }
-                                },
-                                {
-                                    "ledger_name": {
-                                        "$regex": f"{search}",
-                                        "$options": "i",
-                                    }
-                                },
-                                {
-                                    "narration": {
-                                        "$regex": f"{search}",
-                                        "$options": "i",
-                                    }
-                                },
-                            ]
-                        }
-                        if search not in ["", None]
-                        else {}
-                    )
+        ]
+        search_match = {
+            "$match": {
+                **(
+                    {
+                        "$or": [
+                            {
+                                "voucher_number": {
+                                    "$regex": f"{search}",
+                                    "$options": "i",
+                                }
+                            },
+                            {
+                                "voucher_type": {
+                                    "$regex": f"{search}",
+                                    "$options": "i",
+                                }
+                            },
+                            {
+                                "party_name": {
+                                    "$regex": f"{search}",
+                                    "$options": "i",
+                                }
+                            },
+                            {
+                                "ledger_name": {
+                                    "$regex": f"{search}",
+                                    "$options": "i",
+                                }
+                            },
+                            {
+                                "narration": {
+                                    "$regex": f"{search}",
+                                    "$options": "i",
+                                }
+                            },
+                        ]
+                    }
+                    if search not in ["", None]
+                    else {}
+                )
+            }
+        }
+        # Count and debit / credit totals of every matching voucher
+        summary = {
+            "count": [{"$count": "count"}],
+            "totals": [
+                {
+                    "$group": {
+                        "_id": None,
+                        "total_debit": {
+                            "$sum": {
+                                "$cond": [
+                                    {"$eq": ["$is_deemed_positive", True]},
+                                    "$amount",
+                                    0,
+                                ]
+                            }
+                        },
+                        "total_credit": {
+                            "$sum": {
+                                "$cond": [
+                                    {"$eq": ["$is_deemed_positive", False]},
+                                    "$amount",
+                                    0,
+                                ]
+                            }
+                        },
+                    }
                 }
-            },
+            ],
+        }
+
+        pipeline = [
+            match,
+            *joins,
+            {"$sort": sort_stage},
+            search_match,
             {
                 "$facet": {
                     "docs": [
                         {"$skip": (pagination.paging.page - 1) * pagination.paging.limit},
                         {"$limit": pagination.paging.limit},
                     ],
-                    "count": [{"$count": "count"}],
-                    "totals": [
-                        {
-                            "$group": {
-                                "_id": None,
-                                "total_debit": {
-                                    "$sum": {
-                                        "$cond": [
-                                            {"$eq": ["$is_deemed_positive", True]},
-                                            "$amount",
-                                            0,
-                                        ]
-                                    }
-                                },
-                                "total_credit": {
-                                    "$sum": {
-                                        "$cond": [
-                                            {"$eq": ["$is_deemed_positive", False]},
-                                            "$amount",
-                                            0,
-                                        ]
-                                    }
-                                },
-                            }
-                        }
-                    ],
+                    **summary,
                 }
             },
         ]
 
-        res = [doc async for doc in self.collection.aggregate(pipeline)]
-        docs = res[0]["docs"]
-        count = res[0]["count"][0]["count"] if len(res[0]["count"]) > 0 else 0
-        # pprint.pprint(docs, indent=2, width=120)
-        totals = res[0]["totals"][0] if len(res[0]["totals"]) > 0 else {}
+        next_cursor = None
+        if pagination.paging.cursor:
+            docs, next_cursor, count, totals = await self._vouchers_after(
+                match, joins, search_match, summary, sort, pagination, search
+            )
+        else:
+            res = [doc async for doc in self.collection.aggregate(pipeline)]
+            docs = res[0]["docs"]
+            count = res[0]["count"][0]["count"] if len(res[0]["count"]) > 0 else 0
+            # pprint.pprint(docs, indent=2, width=120)
+            totals = res[0]["totals"][0] if len(res[0]["totals"]) > 0 else {}
 
         class Meta3(Page):
             total: int
             total_debit: float = 0
             total_credit: float = 0
+            next: Optional[str] = None
 
         class PaginatedResponse3(BaseModel):
             docs: List[Any]
@@ -373,9 +628,63 @@ class VoucherRepo(BaseMongoDbCrud[VoucherDB]):
                 total=count,
                 total_debit=round(totals.get("total_debit", 0), 2),
                 total_credit=round(totals.get("total_credit", 0), 2),
+                cursor=pagination.paging.cursor,
+                after=pagination.paging.after,
+                next=next_cursor,
             ),
         )
 
+    async def _vouchers_after(
+        self,
+        match: dict,
+        joins: List[dict],
+        search_match: dict,
+        summary: dict,
+        sort: Sort,
+        pagination: PageRequest,
+        search: str,
+    ):
+        """
+        viewAllVouchar in keyset mode, from the stages its offset pipeline is
+        built of: `match`, `joins` (lookups + $project), `search_match` and the
+        `summary` ($facet count and totals). Without a search only the rows of
+        the page are joined; count and totals come from the cached totals
+        pipeline.
+        """
+
+        field = "voucher_type" if sort.sort_field == "type" else sort.sort_field
+        if field not in CURSOR_SORT_FIELDS:
+            field = "date"
+        key = sort_key(field, int(sort.sort_order), ["voucher_number", "_id"])
+        limit = pagination.paging.limit
+
+        stages = [match, *keyset_stages(key, pagination.paging.after)]
+        if search in ["", None]:
+            stages.append({"$limit": limit + 1})
+        stages += [*joins, search_match, {"$sort": dict(key)}, {"$limit": limit + 1}]
+        docs = [doc async for doc in self.collection.aggregate(stages)]
+        docs, next_cursor = keyset_page(docs, key, limit)
+
+        async def compute_totals():
+            totals_pipeline = [
+                match,
+                *joins,
+                search_match,
+                {"$facet": summary},
+            ]
+            res = [doc async for doc in self.collection.aggregate(totals_pipeline)]
+            return {
+                "count": res[0]["count"][0]["count"] if res[0]["count"] else 0,
+                "totals": res[0]["totals"][0] if res[0]["totals"] else {},
+            }
+
+        totals = await listing_totals.get_or_compute(
+            match["$match"]["company_id"],
+            totals_key(self.collection_name, match["$match"], search),
+            compute_totals,
+        )
+        return docs, next_cursor, totals["count"], totals["totals"]
+
     async def get_analytics_data(
         self,
         year: int,
@@ -391,949 +700,128 @@ class VoucherRepo(BaseMongoDbCrud[VoucherDB]):
         start_date = sd.strftime("%Y-%m-%d")
         end_date = ed.strftime("%Y-%m-%d")
 
-        match_stage = {
-            "user_id": current_user.user_id,
-            "company_id": company_id,
-        }
-
-        # Compute total sales/purchase for the year
-        pipeline = [
-            {"$match": match_stage},
-            # Join with Inventory and calculate total_qty for distributing additional_charge
-            {
-                "$lookup": {
-                    "from": "Inventory",
-                    "let": {"vouchar_id": "$_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$vouchar_id", "$$vouchar_id"]}}},
-                        {
-                            "$group": {
-                                "_id": None,
-                                "items": {"$push": "$$ROOT"},
-                                "total_qty": {"$sum": "$quantity"},
-                            }
-                        },
-                    ],
-                    "as": "inventory_info",
-                }
-            },
-            {"$unwind": {"path": "$inventory_info"}},
-            {"$unwind": {"path": "$inventory_info.items"}},
-            # Flatten inventory + voucher fields
-            {
-                "$addFields": {
-                    "item": "$inventory_info.items.item",
-                    "item_id": "$inventory_info.items.item_id",
-                    "unit": "$inventory_info.items.unit",
-                    "quantity": "$inventory_info.items.quantity",
-                    "rate": "$inventory_info.items.rate",
-                    "amount": "$inventory_info.items.amount",
-                    "is_purchase": {
-                        "$cond": [{"$eq": ["$voucher_type", "Purchase"]}, 1, 0]
-                    },
-                    "is_sale": {"$cond": [{"$eq": ["$voucher_type", "Sales"]}, 1, 0]},
-                    "date": "$date",
-                    "total_qty": "$inventory_info.total_qty",
-                    # per-unit additional charge
-                    "per_unit_additional": {
-                        "$cond": [
-                            {"$gt": ["$inventory_info.total_qty", 0]},
-                            {
-                                "$cond": [
-                                    {"$gt": ["$additional_charge", 0]},
-                                    {
-                                        "$divide": [
-                                            "$additional_charge",
-                                            "$inventory_info.total_qty",
-                                        ]
-                                    },
-                                    0,
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                }
-            },
-            # Adjusted total amount (item.total_amount + distributed additional charge)
-            {
-                "$addFields": {
-                    "per_item_additional": {
-                        "$multiply": ["$per_unit_additional", "$quantity"]
-                    },
-                    "adj_total_amount": {
-                        "$add": [
-                            "$inventory_info.items.total_amount",
-                            {"$multiply": ["$per_unit_additional", "$quantity"]},
-                        ]
-                    },
-                }
-            },
-            # 🔹 Join with StockItem to fetch master opening balances
-            {
-                "$lookup": {
-                    "from": "StockItem",
-                    "let": {"item_id": "$item_id"},
-                    "pipeline": [{"$match": {"$expr": {"$eq": ["$_id", "$$item_id"]}}}],
-                    "as": "stock_item",
-                }
-            },
-            {"$unwind": {"path": "$stock_item", "preserveNullAndEmptyArrays": True}},
-            # Group per item
-            {
-                "$group": {
-                    "_id": "$item_id",
-                    "item_id": {"$first": "$item_id"},
-                    "item": {"$first": "$item"},
-                    "unit": {"$first": "$unit"},
-                    "stock_opening_qty": {
-                        "$first": {"$ifNull": ["$stock_item.opening_balance", 0]}
-                    },
-                    "stock_opening_val": {
-                        "$first": {"$ifNull": ["$stock_item.opening_value", 0]}
-                    },
-                    "stock_opening_rate": {
-                        "$first": {"$ifNull": ["$stock_item.opening_rate", 0]}
-                    },
-                    # Opening balances (before start_date, from vouchers)
-                    "opening_qty_vouchers": {
-                        "$sum": {
-                            "$cond": [
-                                {"$lt": ["$date", start_date]},
-                                {
-                                    "$cond": [
-                                        {"$eq": ["$is_purchase", 1]},
-                                        "$quantity",
-                                        {"$multiply": [-1, "$quantity"]},
-                                    ]
-                                },
-                                0,
-                            ]
-                        }
-                    },
-                    "opening_val_vouchers": {
-                        "$sum": {
-                            "$cond": [
-                                {"$lt": ["$date", start_date]},
-                                {
-                                    "$cond": [
-                                        {"$eq": ["$is_purchase", 1]},
-                                        "$adj_total_amount",
-                                        {"$multiply": [-1, "$adj_total_amount"]},
-                                    ]
-                                },
-                                0,
-                            ]
-                        }
-                    },
-                    # Inwards (Purchases in date range)
-                    "inwards_qty": {
-                        "$sum": {
-                            "$cond": [
-                                {
-                                    "$and": [
-                                        {"$gte": ["$date", start_date]},
-                                        {"$lte": ["$date", end_date]},
-                                        {"$eq": ["$is_purchase", 1]},
-                                    ]
-                                },
-                                "$quantity",
-                                0,
-                            ]
-                        }
-                    },
-                    "inwards_val": {
-                        "$sum": {
-                            "$cond": [
-                                {
-                                    "$and": [
-                                        {"$gte": ["$date", start_date]},
-                                        {"$lte": ["$date", end_date]},
-                                        {"$eq": ["$is_purchase", 1]},
-                                    ]
-                                },
-                                "$adj_total_amount",
-                                0,
-                            ]
-                        }
-                    },
-                    # Outwards (Sales in date range)
-                    "outwards_qty": {
-                        "$sum": {
-                            "$cond": [
-                                {
-                                    "$and": [
-                                        {"$gte": ["$date", start_date]},
-                                        {"$lte": ["$date", end_date]},
-                                        {"$eq": ["$is_sale", 1]},
-                                    ]
-                                },
-                                "$quantity",
-                                0,
-                            ]
-                        }
-                    },
-                    "outwards_val": {
-                        "$sum": {
-                            "$cond": [
-                                {
-                                    "$and": [
-                                        {"$gte": ["$date", start_date]},
-                                        {"$lte": ["$date", end_date]},
-                                        {"$eq": ["$is_sale", 1]},
-                                    ]
-                                },
-                                "$adj_total_amount",
-                                0,
-                            ]
-                        }
-                    },
-                }
-            },
-            # 🔹 Add StockItem opening + voucher opening together
-            {
-                "$addFields": {
-                    "opening_qty": {
-                        "$round": [
-                            {
-                                "$ifNull": [
-                                    {
-                                        "$add": [
-                                            "$stock_opening_qty",
-                                            "$opening_qty_vouchers",
-                                        ]
-                                    },
-                                    0,
-                                ]
-                            },
-                            2,
-                        ]
-                    },
-                    "opening_val": {
-                        "$round": [
-                            {
-                                "$ifNull": [
-                                    {
-                                        "$add": [
-                                            "$stock_opening_val",
-                                            "$opening_val_vouchers",
-                                        ]
-                                    },
-                                    0,
-                                ]
-                            },
-                            2,
-                        ]
-                    },
-                }
-            },
-            # Recalculate opening_rate with new qty/val
-            {
-                "$addFields": {
-                    "closing_qty": {
-                        "$round": [
-                            {
-                                "$ifNull": [
-                                    {
-                                        "$subtract": [
-                                            {
-                                                "$add": [
-                                                    "$opening_qty",
-                                                    "$inwards_qty",
-                                                ]
-                                            },
-                                            "$outwards_qty",
-                                        ]
-                                    },
-                                    0,
-                                ]
-                            },
-                            2,
-                        ]
-                    },
-                    "outwards_rate": {
-                        "$cond": [
-                            {"$eq": ["$outwards_qty", 0]},
-                            0,
-                            {
-                                "$round": [
-                                    {"$divide": ["$outwards_val", "$outwards_qty"]},
-                                    2,
-                                ]
-                            },
-                        ]
-                    },
-                }
-            },
-            {
-                "$addFields": {
-                    # Gross Profit = OutwardsVal – (OutwardsQty × AvgCostRate)
-                    "avg_cost_rate": {
-                        "$cond": [
-                            {"$gt": [{"$add": ["$opening_qty", "$inwards_qty"]}, 0]},
-                            {
-                                "$round": [
-                                    {
-                                        "$divide": [
-                                            {"$add": ["$opening_val", "$inwards_val"]},
-                                            {"$add": ["$opening_qty", "$inwards_qty"]},
-                                        ]
-                                    },
-                                    2,
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                }
-            },
-            {
-                "$addFields": {
-                    "gross_profit": {
-                        "$round": [
-                            {
-                                "$multiply": [
-                                    "$outwards_qty",
-                                    {"$subtract": ["$outwards_rate", "$avg_cost_rate"]},
-                                ]
-                            },
-                            2,
-                        ]
-                    },
-                    "closing_val": {"$multiply": ["$closing_qty", "$avg_cost_rate"]},
-                }
-            },
-            {
-                "$project": {
-                    "item_id": 1,
-                    "opening_val": 1,
-                    "inwards_val": 1,
-                    "outwards_val": 1,
-                    "closing_rate": "$avg_cost_rate",
-                    "closing_val": 1,
-                    "gross_profit": 1,
-                }
-            },
-        ]
-
-        totals_res = [doc async for doc in self.collection.aggregate(pipeline)]
-        opening_val = sum((doc.get("opening_val") or 0) for doc in totals_res)
-        inwards_val = sum((doc.get("inwards_val") or 0) for doc in totals_res)
-        outwards_val = sum((doc.get("outwards_val") or 0) for doc in totals_res)
-        closing_val = sum((doc.get("closing_val") or 0) for doc in totals_res)
-        gross_profit = sum((doc.get("gross_profit") or 0) for doc in totals_res)
-        profit_percent = gross_profit / outwards_val * 100 if outwards_val != 0 else 0
-
-        return {
-            "opening": round(opening_val, 2),
-            "purchase": round(inwards_val, 2),
-            "sales": round(outwards_val, 2),
-            "current": round(closing_val, 2),
-            "profit": round(gross_profit, 2),
-            "profit_percent": round(profit_percent, 2),
-        }
-
-    async def get_monthly_data(
-        self,
-        year: int,
-        company_id: str,
-        current_user: TokenData = Depends(get_current_user),
-    ):
-
-        # Calculate start and end dates for the year
-        sd = datetime(year=year, month=4, day=1)
-        ed = datetime(year=year + 1, month=3, day=31, hour=23, minute=59, second=59)
-
-        # Ensure same format as DB ("YYYY-MM-DD")
-        start_date = sd.strftime("%Y-%m-%d")
-        end_date = ed.strftime("%Y-%m-%d")
-
-        match_stage = {
-            "user_id": current_user.user_id,
-            "company_id": company_id,
-        }
-
-        pipeline_total = [
-            {"$match": match_stage},
-            {
-                "$lookup": {
-                    "from": "Inventory",
-                    "let": {"vouchar_id": "$_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$vouchar_id", "$$vouchar_id"]}}},
-                        {
-                            "$group": {
-                                "_id": None,
-                                "items": {"$push": "$$ROOT"},
-                                "total_qty": {"$sum": "$quantity"},
-                            }
-                        },
-                    ],
-                    "as": "inventory_info",
-                }
-            },
-            {"$unwind": {"path": "$inventory_info"}},
-            {"$unwind": {"path": "$inventory_info.items"}},
-            # Flatten fields from inventory items
-            {
-                "$addFields": {
-                    "item_id": "$inventory_info.items.item_id",
-                    "item": "$inventory_info.items.item",
-                    "quantity": "$inventory_info.items.quantity",
-                    "amount": "$inventory_info.items.amount",
-                    "month_only": {"$substr": ["$date", 0, 7]},
-                    "is_purchase": {
-                        "$cond": [{"$eq": ["$voucher_type", "Purchase"]}, 1, 0]
-                    },
-                    "is_sale": {"$cond": [{"$eq": ["$voucher_type", "Sales"]}, 1, 0]},
-                    "total_qty": "$inventory_info.total_qty",
-                    # per-unit additional charge
-                    "per_unit_additional": {
-                        "$cond": [
-                            {"$gt": ["$inventory_info.total_qty", 0]},
-                            {
-                                "$cond": [
-                                    {"$gt": ["$additional_charge", 0]},
-                                    {
-                                        "$divide": [
-                                            "$additional_charge",
-                                            "$inventory_info.total_qty",
-                                        ]
-                                    },
-                                    0,
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                }
-            },
-            # Adjusted total amount including additional charges
-            {
-                "$addFields": {
-                    "per_item_additional": {
-                        "$multiply": ["$per_unit_additional", "$quantity"]
-                    },
-                    "adj_total_amount": {
-                        "$add": [
-                            "$inventory_info.items.total_amount",
-                            {"$multiply": ["$per_unit_additional", "$quantity"]},
-                        ]
-                    },
-                }
-            },
-            # Bring in StockItem for opening balances
-            {
-                "$lookup": {
-                    "from": "StockItem",
-                    "let": {"item_id": "$item_id"},
-                    "pipeline": [{"$match": {"$expr": {"$eq": ["$_id", "$$item_id"]}}}],
-                    "as": "stock_item",
-                }
-            },
-            {"$unwind": {"path": "$stock_item", "preserveNullAndEmptyArrays": True}},
-            # Group by item + date
-            {
-                "$group": {
-                    "_id": {"item_id": "$item_id", "date": "$month_only"},
-                    "item": {"$first": "$item"},
-                    "date": {"$first": "$month_only"},
-                    "stock_opening_qty": {
-                        "$first": {"$ifNull": ["$stock_item.opening_balance", 0]}
-                    },
-                    "stock_opening_val": {
-                        "$first": {"$ifNull": ["$stock_item.opening_value", 0]}
-                    },
-                    # Opening balances adjusted by vouchers < start_date
-                    "opening_qty_vouchers": {
-                        "$sum": {
-                            "$cond": [
-                                {"$lt": ["$date", start_date]},
-                                {
-                                    "$cond": [
-                                        {"$eq": ["$is_purchase", 1]},
-                                        "$quantity",
-                                        {"$multiply": [-1, "$quantity"]},
-                                    ]
-                                },
-                                0,
-                            ]
-                        }
-                    },
-                    "opening_val_vouchers": {
-                        "$sum": {
-                            "$cond": [
-                                {"$lt": ["$date", start_date]},
-                                {
-                                    "$cond": [
-                                        {"$eq": ["$is_purchase", 1]},
-                                        "$adj_total_amount",
-                                        {"$multiply": [-1, "$adj_total_amount"]},
-                                    ]
-                                },
-                                0,
-                            ]
-                        }
-                    },
-                    "purchase_qty": {
-                        "$sum": {"$cond": [{"$eq": ["$is_purchase", 1]}, "$quantity", 0]}
-                    },
-                    "purchase_val": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": ["$is_purchase", 1]},
-                                "$adj_total_amount",
-                                0,
-                            ]
-                        }
-                    },
-                    "sales_qty": {
-                        "$sum": {"$cond": [{"$eq": ["$is_sale", 1]}, "$quantity", 0]}
-                    },
-                    "sales_val": {
-                        "$sum": {
-                            "$cond": [{"$eq": ["$is_sale", 1]}, "$adj_total_amount", 0]
-                        }
-                    },
-                }
-            },
-            # Add final opening balances
-            {
-                "$addFields": {
-                    "opening_qty": {
-                        "$round": [
-                            {
-                                "$ifNull": [
-                                    {
-                                        "$add": [
-                                            "$stock_opening_qty",
-                                            "$opening_qty_vouchers",
-                                        ]
-                                    },
-                                    0,
-                                ]
-                            },
-                            2,
-                        ]
-                    },
-                    "opening_val": {
-                        "$round": [
-                            {
-                                "$ifNull": [
-                                    {
-                                        "$add": [
-                                            "$stock_opening_val",
-                                            "$opening_val_vouchers",
-                                        ]
-                                    },
-                                    0,
-                                ]
-                            },
-                            2,
-                        ]
-                    },
-                }
-            },
-            # Compute average cost including opening stock + purchases
-            {
-                "$addFields": {
-                    "total_qty_for_cost": {"$add": ["$opening_qty", "$purchase_qty"]},
-                    "total_val_for_cost": {"$add": ["$opening_val", "$purchase_val"]},
-                }
-            },
-            {
-                "$addFields": {
-                    "avg_cost_rate": {
-                        "$cond": [
-                            {"$gt": ["$total_qty_for_cost", 0]},
-                            {
-                                "$round": [
-                                    {
-                                        "$divide": [
-                                            "$total_val_for_cost",
-                                            "$total_qty_for_cost",
-                                        ]
-                                    },
-                                    2,
-                                ]
-                            },
-                            0,
-                        ]
-                    }
-                }
-            },
-            # Gross profit = sales value – (sales qty × avg cost rate)
-            {
-                "$addFields": {
-                    "gross_profit": {
-                        "$round": [
-                            {
-                                "$subtract": [
-                                    "$sales_val",
-                                    {"$multiply": ["$sales_qty", "$avg_cost_rate"]},
-                                ]
-                            },
-                            2,
-                        ]
-                    }
-                }
-            },
-            # Group by date for daily totals
-            {
-                "$group": {
-                    "_id": "$date",
-                    "total_purchase_qty": {"$sum": "$purchase_qty"},
-                    "total_purchase_val": {"$sum": "$purchase_val"},
-                    "total_sales_qty": {"$sum": "$sales_qty"},
-                    "total_sales_val": {"$sum": "$sales_val"},
-                    "gross_profit": {"$sum": "$gross_profit"},
-                }
-            },
-            {"$sort": {"_id": 1}},
-        ]
-        total_result = await self.collection.aggregate(pipeline_total).to_list(None)
-        months_range = month_range(sd, ed)
-        data_by_month = {doc["_id"]: doc for doc in total_result}
-        final_result = []
-
-        for d in months_range:
-            if d in data_by_month:
-                final_result.append(data_by_month[d])
-            else:
-                final_result.append(
-                    {
-                        "_id": d,
-                        "total_purchase_qty": 0,
-                        "total_purchase_val": 0,
-                        "total_sales_qty": 0,
-                        "total_sales_val": 0,
-                        "gross_profit": 0,
-                    }
-                )
-
-        formatted = transform_monthly_to_yearly(final_result, 2025)
-
-        return formatted
-
-    async def get_daily_data(
-        self,
-        year: int,
-        month: Union[int, None],
-        company_id: str,
-        current_user: TokenData = Depends(get_current_user),
-    ):
-
-        # Calculate start and end dates for the year
-        sd = datetime(
-            year=year, month=month if month is not None else datetime.now().month, day=1
-        )
-        last_day = calendar.monthrange(
-            int(year), int(month if month is not None else datetime.now().month)
-        )[1]
-        ed = datetime(
-            year=int(year),
-            month=int(month if month is not None else datetime.now().month),
-            day=last_day,
-            hour=23,
-            minute=59,
-            second=59,
-        )
-
-        # Ensure same format as DB ("YYYY-MM-DD")
-        start_date = sd.strftime("%Y-%m-%d")
-        end_date = ed.strftime("%Y-%m-%d")
-
-        match_stage = {
-            "user_id": current_user.user_id,
-            "company_id": company_id,
-        }
-
-        # Compute total sales/purchase for the year
-        pipeline_total = [
-            {"$match": match_stage},
-            # Join inventory
-            {
-                "$lookup": {
-                    "from": "Inventory",
-                    "let": {"vouchar_id": "$_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$vouchar_id", "$$vouchar_id"]}}},
-                        {
-                            "$group": {
-                                "_id": None,
-                                "items": {"$push": "$$ROOT"},
-                                "total_qty": {"$sum": "$quantity"},
-                            }
-                        },
-                    ],
-                    "as": "inventory_info",
-                }
-            },
-            {"$unwind": {"path": "$inventory_info"}},
-            {"$unwind": {"path": "$inventory_info.items"}},
-            # Flatten fields from inventory items
-            {
-                "$addFields": {
-                    "item_id": "$inventory_info.items.item_id",
-                    "item": "$inventory_info.items.item",
-                    "quantity": "$inventory_info.items.quantity",
-                    "amount": "$inventory_info.items.amount",
-                    "date_only": {"$substr": ["$date", 0, 10]},
-                    "is_purchase": {
-                        "$cond": [{"$eq": ["$voucher_type", "Purchase"]}, 1, 0]
-                    },
-                    "is_sale": {"$cond": [{"$eq": ["$voucher_type", "Sales"]}, 1, 0]},
-                    "total_qty": "$inventory_info.total_qty",
-                    # per-unit additional charge
-                    "per_unit_additional": {
-                        "$cond": [
-                            {"$gt": ["$inventory_info.total_qty", 0]},
-                            {
-                                "$cond": [
-                                    {"$gt": ["$additional_charge", 0]},
-                                    {
-                                        "$divide": [
-                                            "$additional_charge",
-                                            "$inventory_info.total_qty",
-                                        ]
-                                    },
-                                    0,
-                                ]
-                            },
-                            0,
-                        ]
-                    },
-                }
-            },
-            # Adjusted total amount including additional charges
-            {
-                "$addFields": {
-                    "per_item_additional": {
-                        "$multiply": ["$per_unit_additional", "$quantity"]
-                    },
-                    "adj_total_amount": {
-                        "$add": [
-                            "$inventory_info.items.total_amount",
-                            {"$multiply": ["$per_unit_additional", "$quantity"]},
-                        ]
-                    },
-                }
-            },
-            # Bring in StockItem for opening balances
-            {
-                "$lookup": {
-                    "from": "StockItem",
-                    "let": {"item_id": "$item_id"},
-                    "pipeline": [{"$match": {"$expr": {"$eq": ["$_id", "$$item_id"]}}}],
-                    "as": "stock_item",
-                }
-            },
-            {"$unwind": {"path": "$stock_item", "preserveNullAndEmptyArrays": True}},
-            # Group by item + date
-            {
-                "$group": {
-                    "_id": {"item_id": "$item_id", "date": "$date_only"},
-                    "item": {"$first": "$item"},
-                    "date": {"$first": "$date_only"},
-                    "stock_opening_qty": {
-                        "$first": {"$ifNull": ["$stock_item.opening_balance", 0]}
-                    },
-                    "stock_opening_val": {
-                        "$first": {"$ifNull": ["$stock_item.opening_value", 0]}
-                    },
-                    # Opening balances adjusted by vouchers < start_date
-                    "opening_qty_vouchers": {
-                        "$sum": {
-                            "$cond": [
-                                {"$lt": ["$date", start_date]},
-                                {
-                                    "$cond": [
-                                        {"$eq": ["$is_purchase", 1]},
-                                        "$quantity",
-                                        {"$multiply": [-1, "$quantity"]},
-                                    ]
-                                },
-                                0,
-                            ]
-                        }
-                    },
-                    "opening_val_vouchers": {
-                        "$sum": {
-                            "$cond": [
-                                {"$lt": ["$date", start_date]},
-                                {
-                                    "$cond": [
-                                        {"$eq": ["$is_purchase", 1]},
-                                        "$adj_total_amount",
-                                        {"$multiply": [-1, "$adj_total_amount"]},
-                                    ]
-                                },
-                                0,
-                            ]
-                        }
-                    },
-                    "purchase_qty": {
-                        "$sum": {"$cond": [{"$eq": ["$is_purchase", 1]}, "$quantity", 0]}
-                    },
-                    "purchase_val": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": ["$is_purchase", 1]},
-                                "$adj_total_amount",
-                                0,
-                            ]
-                        }
-                    },
-                    "sales_qty": {
-                        "$sum": {"$cond": [{"$eq": ["$is_sale", 1]}, "$quantity", 0]}
-                    },
-                    "sales_val": {
-                        "$sum": {
-                            "$cond": [{"$eq": ["$is_sale", 1]}, "$adj_total_amount", 0]
-                        }
-                    },
-                }
-            },
-            # Add final opening balances
-            {
-                "$addFields": {
-                    "opening_qty": {
-                        "$round": [
-                            {
-                                "$ifNull": [
-                                    {
-                                        "$add": [
-                                            "$stock_opening_qty",
-                                            "$opening_qty_vouchers",
-                                        ]
-                                    },
-                                    0,
-                                ]
-                            },
-                            2,
-                        ]
-                    },
-                    "opening_val": {
-                        "$round": [
-                            {
-                                "$ifNull": [
-                                    {
-                                        "$add": [
-                                            "$stock_opening_val",
-                                            "$opening_val_vouchers",
-                                        ]
-                                    },
-                                    0,
-                                ]
-                            },
-                            2,
-                        ]
-                    },
-                }
-            },
-            # Compute average cost including opening stock + purchases
-            {
-                "$addFields": {
-                    "total_qty_for_cost": {"$add": ["$opening_qty", "$purchase_qty"]},
-                    "total_val_for_cost": {"$add": ["$opening_val", "$purchase_val"]},
-                }
-            },
-            {
-                "$addFields": {
-                    "avg_cost_rate": {
-                        "$cond": [
-                            {"$gt": ["$total_qty_for_cost", 0]},
-                            {
-                                "$round": [
-                                    {
-                                        "$divide": [
-                                            "$total_val_for_cost",
-                                            "$total_qty_for_cost",
-                                        ]
-                                    },
-                                    2,
-                                ]
-                            },
-                            0,
-                        ]
-                    }
-                }
-            },
-            # Gross profit = sales value – (sales qty × avg cost rate)
-            {
-                "$addFields": {
-                    "gross_profit": {
-                        "$round": [
-                            {
-                                "$subtract": [
-                                    "$sales_val",
-                                    {"$multiply": ["$sales_qty", "$avg_cost_rate"]},
-                                ]
-                            },
-                            2,
-                        ]
-                    }
-                }
-            },
-            # Group by date for daily totals
-            {
-                "$group": {
-                    "_id": "$date",
-                    "total_purchase_qty": {"$sum": "$purchase_qty"},
-                    "total_purchase_val": {"$sum": "$purchase_val"},
-                    "total_sales_qty": {"$sum": "$sales_qty"},
-                    "total_sales_val": {"$sum": "$sales_val"},
-                    "gross_profit": {"$sum": "$gross_profit"},
-                }
-            },
-            {"$sort": {"_id": 1}},
-        ]
-
-        total_result = await self.collection.aggregate(pipeline_total).to_list(None)
-
-        date_range = [
-            (sd + timedelta(days=i)).strftime("%Y-%m-%d")
-            for i in range((ed - sd).days + 1)
-        ]
-
-        # Map aggregation results by date
-        data_by_date = {doc["_id"]: doc for doc in total_result}
-
-        # Fill missing dates with zeros
-        final_result = []
-        for d in date_range:
-            if d in data_by_date:
-                final_result.append(data_by_date[d])
-            else:
-                final_result.append(
-                    {
-                        "_id": d,
-                        "total_purchase_qty": 0,
-                        "total_purchase_val": 0,
-                        "total_sales_qty": 0,
-                        "total_sales_val": 0,
-                        "gross_profit": 0,
-                    }
-                )
-        daily_data = convert_to_daily_data(final_result)
-        return daily_data
-
-    async def viewHSNSummary(
-        self,
-        search: str,
-        company_id: str,
-        pagination: PageRequest,
-        sort: Sort,
-        category: str = "",
-        current_user: TokenData = Depends(get_current_user),
-        start_date: datetime = None,
-        end_date: datetime = None,
-    ):
-        # Convert datetime to string (YYYY-MM-DD)
-        start_date = str(start_date)[:10] if start_date else ""
-        end_date = str(end_date)[:10] if end_date else ""
-
-        filter_params = {
+        return await analytics_rollup_repo.year_summary(
+            current_user.user_id, company_id, start_date, end_date
+        )
+
+    async def get_monthly_data(
+        self,
+        year: int,
+        company_id: str,
+        current_user: TokenData = Depends(get_current_user),
+    ):
+
+        # Calculate start and end dates for the year
+        sd = datetime(year=year, month=4, day=1)
+        ed = datetime(year=year + 1, month=3, day=31, hour=23, minute=59, second=59)
+
+        # Ensure same format as DB ("YYYY-MM-DD")
+        start_date = sd.strftime("%Y-%m-%d")
+        end_date = ed.strftime("%Y-%m-%d")
+
+        total_result = await analytics_rollup_repo.period_totals(
+            current_user.user_id, company_id, start_date, end_date, period="month"
+        )
+        months_range = month_range(sd, ed)
+        data_by_month = {doc["_id"]: doc for doc in total_result}
+        final_result = []
+
+        for d in months_range:
+            if d in data_by_month:
+                final_result.append(data_by_month[d])
+            else:
+                final_result.append(
+                    {
+                        "_id": d,
+                        "total_purchase_qty": 0,
+                        "total_purchase_val": 0,
+                        "total_sales_qty": 0,
+                        "total_sales_val": 0,
+                        "gross_profit": 0,
+                    }
+                )
+
+        formatted = transform_monthly_to_yearly(final_result, 2025)
+
+        return formatted
+
+    async def get_daily_data(
+        self,
+        year: int,
+        month: Union[int, None],
+        company_id: str,
+        current_user: TokenData = Depends(get_current_user),
+    ):
+
+        # Calculate start and end dates for the year
+        sd = datetime(
+            year=year, month=month if month is not None else datetime.now().month, day=1
+        )
+        last_day = calendar.monthrange(
+            int(year), int(month if month is not None else datetime.now().month)
+        )[1]
+        ed = datetime(
+            year=int(year),
+            month=int(month if month is not None else datetime.now().month),
+            day=last_day,
+            hour=23,
+            minute=59,
+            second=59,
+        )
+
+        # Ensure same format as DB ("YYYY-MM-DD")
+        start_date = sd.strftime("%Y-%m-%d")
+        end_date = ed.strftime("%Y-%m-%d")
+
+        total_result = await analytics_rollup_repo.period_totals(
+            current_user.user_id, company_id, start_date, end_date, period="date"
+        )
+
+        date_range = [
+            (sd + timedelta(days=i)).strftime("%Y-%m-%d")
+            for i in range((ed - sd).days + 1)
+        ]
+
+        # Map aggregation results by date
+        data_by_date = {doc["_id"]: doc for doc in total_result}
+
+        # Fill missing dates with zeros
+        final_result = []
+        for d in date_range:
+            if d in data_by_date:
+                final_result.append(data_by_date[d])
+            else:
+                final_result.append(
+                    {
+                        "_id": d,
+                        "total_purchase_qty": 0,
+                        "total_purchase_val": 0,
+                        "total_sales_qty": 0,
+                        "total_sales_val": 0,
+                        "gross_profit": 0,
+                    }
+                )
+        daily_data = convert_to_daily_data(final_result)
+        return daily_data
+
+    async def viewHSNSummary(
+        self,
+        search: str,
+        company_id: str,
+        pagination: PageRequest,
+        sort: Sort,
+        category: str = "",
+        current_user: TokenData = Depends(get_current_user),
+        start_date: datetime = None,
+        end_date: datetime = None,
+    ):
+        # Convert datetime to string (YYYY-MM-DD)
+        start_date = str(start_date)[:10] if start_date else ""
+        end_date = str(end_date)[:10] if end_date else ""
+
+        # Inventory rows carry their voucher's user, company, type, date, number
+        # and party, so the summary starts from them instead of the vouchers
+        filter_params = {
             "user_id": current_user.user_id,
             "company_id": company_id,
             "voucher_type": {"$in": ["Sales", "Purchase"]},
@@ -1344,68 +832,40 @@ class VoucherRepo(BaseMongoDbCrud[VoucherDB]):
 
         pipeline = [
             {"$match": filter_params},
-            # Join with Inventory
-            {
-                "$lookup": {
-                    "from": "Inventory",
-                    "let": {"vouchar_id": "$_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$vouchar_id", "$$vouchar_id"]}}},
-                        {
-                            "$project": {
-                                "item_id": 1,
-                                "item": 1,
-                                "unit": 1,
-                                "hsn_code": 1,
-                                "quantity": 1,
-                                "total_amount": 1,
-                                "tax_rate": 1,
-                                "taxable_value": {
-                                    "$subtract": ["$total_amount", "$tax_amount"]
-                                },
-                                "tax_amount": 1,
-                            }
-                        },
-                    ],
-                    "as": "inventory_info",
-                }
-            },
-            {"$unwind": "$inventory_info"},
-            # 🔹 Join with Ledger to fetch TIN (using party_name or party_id depending on your schema)
-            {
-                "$lookup": {
-                    "from": "Ledger",
-                    "let": {"id": "$party_name_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$_id", "$$id"]}}},
-                        {"$project": {"tin": 1, "_id": 0}},
-                    ],
-                    "as": "ledger_info",
-                }
-            },
-            {"$unwind": {"path": "$ledger_info", "preserveNullAndEmptyArrays": True}},
             # Group at item + voucher level first
             {
                 "$group": {
                     "_id": {
-                        "hsn_code": "$inventory_info.hsn_code",
-                        "item": "$inventory_info.item",
-                        "item_id": "$inventory_info.item_id",
-                        "unit": "$inventory_info.unit",
-                        "tax_rate": "$inventory_info.tax_rate",
-                        "voucher_id": "$_id",
+                        "hsn_code": "$hsn_code",
+                        "item": "$item",
+                        "item_id": "$item_id",
+                        "unit": "$unit",
+                        "tax_rate": "$tax_rate",
+                        "voucher_id": "$vouchar_id",
                         "date": "$date",
                         "party_name": "$party_name",
-                        "party_tin": "$ledger_info.tin",  # ✅ pull from Ledger
+                        "party_name_id": "$party_name_id",
                         "voucher_type": "$voucher_type",
                         "voucher_number": "$voucher_number",
                     },
-                    "quantity": {"$sum": "$inventory_info.quantity"},
-                    "total_amount": {"$sum": "$inventory_info.total_amount"},
-                    "taxable_value": {"$sum": "$inventory_info.taxable_value"},
-                    "tax_amount": {"$sum": "$inventory_info.tax_amount"},
+                    "quantity": {"$sum": "$quantity"},
+                    "total_amount": {"$sum": "$total_amount"},
+                    "taxable_value": {
+                        "$sum": {"$subtract": ["$total_amount", "$tax_amount"]}
+                    },
+                    "tax_amount": {"$sum": "$tax_amount"},
+                }
+            },
+            # 🔹 Join with Ledger to fetch TIN, once per item + voucher
+            {
+                "$lookup": {
+                    "from": "Ledger",
+                    "localField": "_id.party_name_id",
+                    "foreignField": "_id",
+                    "as": "ledger_info",
                 }
             },
+            {"$unwind": {"path": "$ledger_info", "preserveNullAndEmptyArrays": True}},
             # Prepare invoice list
             {
                 "$project": {
@@ -1417,7 +877,7 @@ class VoucherRepo(BaseMongoDbCrud[VoucherDB]):
                     "invoice_detail": {
                         "date": "$_id.date",
                         "party_name": "$_id.party_name",
-                        "party_tin": "$_id.party_tin",  # ✅ from Ledger now
+                        "party_tin": "$ledger_info.tin",  # ✅ from Ledger now
                         "voucher_id": "$_id.voucher_id",
                         "voucher_type": "$_id.voucher_type",
                         "voucher_number": "$_id.voucher_number",
@@ -1487,7 +947,7 @@ class VoucherRepo(BaseMongoDbCrud[VoucherDB]):
             },
         ]
 
-        res = [doc async for doc in self.collection.aggregate(pipeline)]
+        res = [doc async for doc in inventory_repo.collection.aggregate(pipeline)]
         docs = res[0]["docs"]
         count = res[0]["count"][0]["count"] if len(res[0]["count"]) > 0 else 0
         totals = res[0]["totals"][0] if len(res[0]["totals"]) > 0 else {}
@@ -17,6 +17,7 @@ from app.http_exception import http_error_handler
 from app.routes.api.routers import routers
 from app.schema.health import Health_Schema
 from app.utils.uptime import getUptime
+from app.utils import metrics
 from fastapi import FastAPI
 from apscheduler.schedulers.background import BackgroundScheduler
 import requests
@@ -85,6 +86,18 @@ async def check_health(request: Request, response: Response):
     )
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """
+    Metrics Route : Prometheus text format, per worker process.
+
+    """
+    if ENV_PROJECT.METRICS_TOKEN:
+        if request.headers.get("authorization") != f"Bearer {ENV_PROJECT.METRICS_TOKEN}":
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 for app_configure in configs:
     app_configure(app)
 
@@ -52,16 +52,11 @@ async def get_current_user(
     tokens: dict = Depends(oauth2_scheme),
 ) -> TokenData:
     token: TokenData = await verify_access_token(tokens["access_token"])
-    # Check token_version in DB
-    db_token = await refresh_token_repo.findOne(
-        {
-            "user_id": token.user_id,
-            "device_type": token.device_type,
-            "user_type": token.user_type,
-        },
-        {"token_version"},
+    # Check token_version (cached per login, see TokenVersionCache)
+    token_version = await refresh_token_repo.token_version(
+        token.user_id, token.device_type, token.user_type
     )
-    if not db_token or db_token.get("token_version", 1) != token.token_version:
+    if token_version is None or token_version != token.token_version:
         raise http_exception.CredentialsInvalidException(
             detail="Token is invalid or has been revoked."
         )
@@ -0,0 +1,126 @@
+import asyncio
+import copy
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import Depends
+
+from app.Config import ENV_PROJECT
+from app.database.repositories.CompanySettingsRepo import company_settings_repo
+from app.database.repositories.UserSettingsRepo import user_settings_repo
+from app.database.repositories.companyRepo import company_repo
+from app.oauth2 import get_current_user
+from app.schema.token import TokenData
+
+SETTINGS = "user_settings"  # cache slot of the user settings, next to one per company
+
+
+class ContextCache:
+    """
+    Short lived per-process cache of user settings, companies and company
+    settings, grouped by user so one write can drop everything of that user.
+
+    Routes writing any of the three collections call invalidate(user_id); other
+    workers pick the change up once their entry expires after `ttl` seconds.
+    """
+
+    def __init__(self, ttl: int, max_users: int = 10000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._users: "OrderedDict[str, dict]" = OrderedDict()
+
+    def get(self, user_id: str, slot: str):
+        entry = self._users.get(user_id, {}).get(slot)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, user_id: str, slot: str, value):
+        self._users.setdefault(user_id, {})[slot] = (time.monotonic() + self.ttl, value)
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        self._users.pop(user_id, None)
+
+
+context_cache = ContextCache(ttl=ENV_PROJECT.REQUEST_CONTEXT_TTL_SECONDS)
+
+
+class RequestContext:
+    """What most handlers look up before doing any real work."""
+
+    def __init__(
+        self,
+        current_user: TokenData,
+        user_settings: Optional[dict],
+        company: Optional[dict],
+        company_settings: Optional[dict],
+    ):
+        self.current_user = current_user
+        self.user_settings = user_settings
+        self.company = company
+        self.company_settings = company_settings
+
+    @property
+    def company_id(self) -> Optional[str]:
+        if self.current_user.current_company_id:
+            return self.current_user.current_company_id
+        return (self.user_settings or {}).get("current_company_id")
+
+
+async def _user_settings(user_id: str) -> Optional[dict]:
+    user_settings = context_cache.get(user_id, SETTINGS)
+    if user_settings is None:
+        user_settings = await user_settings_repo.findOne({"user_id": user_id})
+        if user_settings is not None:
+            context_cache.put(user_id, SETTINGS, user_settings)
+    return user_settings
+
+
+async def _company(
+    user_id: str, company_id: Optional[str]
+) -> Tuple[Optional[dict], Optional[dict]]:
+    if not company_id:
+        return None, None
+
+    cached = context_cache.get(user_id, company_id)
+    if cached is not None:
+        return cached
+
+    company, company_settings = await asyncio.gather(
+        company_repo.findOne({"_id": company_id, "user_id": user_id}),
+        company_settings_repo.findOne({"company_id": company_id, "user_id": user_id}),
+    )
+    if company is not None:
+        context_cache.put(user_id, company_id, (company, company_settings))
+    return company, company_settings
+
+
+async def get_request_context(
+    current_user: TokenData = Depends(get_current_user),
+) -> RequestContext:
+    """
+    User settings, active company and company settings for this request. The
+    three reads run concurrently, and FastAPI resolves the dependency once per
+    request however many dependants ask for it.
+    """
+    user_id = current_user.user_id
+    if current_user.current_company_id:
+        user_settings, (company, company_settings) = await asyncio.gather(
+            _user_settings(user_id), _company(user_id, current_user.current_company_id)
+        )
+    else:
+        user_settings = await _user_settings(user_id)
+        company_id = (user_settings or {}).get("current_company_id")
+        company, company_settings = await _company(user_id, company_id)
+
+    # Handlers own their copies, the cached documents stay untouched
+    return RequestContext(
+        current_user,
+        copy.deepcopy(user_settings),
+        copy.deepcopy(company),
+        copy.deepcopy(company_settings),
+    )
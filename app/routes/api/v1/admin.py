@@ -6,6 +6,12 @@ from app.oauth2 import get_current_user
 
 import app.http_exception as http_exception
 from app.database.repositories.user import user_repo
+from app.database.repositories.stockBalanceRepo import stock_balance_repo
+from app.database.repositories.analyticsRollupRepo import analytics_rollup_repo
+import app.core.services as browser_module
+from app.utils.pdf_cache import pdf_cache
+from app.database.profiler import aggregation_profiler
+from app.database.indexes import sync_indexes
 import asyncio
 
 from app.database.repositories.crud.base import SortingOrder, Sort, Page, PageRequest
@@ -48,6 +54,132 @@ async def view_users(
     return {"success": True, "message": "Data Fetched Successfully...", "data": result}
 
 
+@admin.post(
+    "/rebuild/stock/balance",
+    response_class=ORJSONResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def rebuild_stock_balance(
+    current_user: TokenData = Depends(get_current_user),
+    company_id: str = Query(None),
+):
+    if current_user.user_type != "admin":
+        raise http_exception.CredentialsInvalidException(
+            detail="Only admin can access this data."
+        )
+
+    result = await stock_balance_repo.rebuild(company_id=company_id)
+
+    return {"success": True, "message": "Stock Balance Rebuilt Successfully", "data": result}
+
+
+@admin.post(
+    "/recompute/analytics",
+    response_class=ORJSONResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def recompute_analytics(
+    current_user: TokenData = Depends(get_current_user),
+    company_id: str = Query(None),
+):
+    if current_user.user_type != "admin":
+        raise http_exception.CredentialsInvalidException(
+            detail="Only admin can access this data."
+        )
+
+    result = await analytics_rollup_repo.recompute(company_id=company_id)
+
+    return {"success": True, "message": "Analytics Recomputed Successfully", "data": result}
+
+
+@admin.get(
+    "/pdf/pool",
+    response_class=ORJSONResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def pdf_pool_metrics(
+    current_user: TokenData = Depends(get_current_user),
+):
+    if current_user.user_type != "admin":
+        raise http_exception.CredentialsInvalidException(
+            detail="Only admin can access this data."
+        )
+
+    return {
+        "success": True,
+        "message": "Data Fetched Successfully...",
+        "data": {
+            **browser_module.page_pool.metrics(),
+            "cache": await pdf_cache.metrics(),
+        },
+    }
+
+
+@admin.get(
+    "/profile/aggregations",
+    response_class=ORJSONResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def aggregation_profile(
+    limit: int = Query(20, ge=1, le=200),
+    recent: bool = Query(False, description="Latest slow runs instead of the summary"),
+    current_user: TokenData = Depends(get_current_user),
+):
+    if current_user.user_type != "admin":
+        raise http_exception.CredentialsInvalidException(
+            detail="Only admin can access this data."
+        )
+
+    if not aggregation_profiler.enabled:
+        raise http_exception.BadRequestException(
+            detail="Aggregation profiling is off, set AGG_PROFILE_THRESHOLD_MS."
+        )
+
+    if recent:
+        data = await aggregation_profiler.recent(limit)
+    else:
+        data = await aggregation_profiler.summary(limit)
+
+    return {
+        "success": True,
+        "message": "Data Fetched Successfully...",
+        "data": data,
+    }
+
+
+@admin.get("/indexes", response_class=ORJSONResponse, status_code=status.HTTP_200_OK)
+async def index_drift(
+    current_user: TokenData = Depends(get_current_user),
+):
+    if current_user.user_type != "admin":
+        raise http_exception.CredentialsInvalidException(
+            detail="Only admin can access this data."
+        )
+
+    return {
+        "success": True,
+        "message": "Data Fetched Successfully...",
+        "data": await sync_indexes(create=False),
+    }
+
+
+@admin.post("/indexes", response_class=ORJSONResponse, status_code=status.HTTP_200_OK)
+async def create_missing_indexes(
+    current_user: TokenData = Depends(get_current_user),
+):
+    """Create the declared indexes the server is missing; drift is only reported."""
+    if current_user.user_type != "admin":
+        raise http_exception.CredentialsInvalidException(
+            detail="Only admin can access this data."
+        )
+
+    return {
+        "success": True,
+        "message": "Indexes Synced Successfully",
+        "data": await sync_indexes(create=True),
+    }
+
+
 # @admin.post(
 #     "/create/stockist/{user_id}",
 #     response_class=ORJSONResponse,
@@ -13,8 +13,9 @@ from loguru import logger
 from pydantic import BaseModel
 from app.schema.token import TokenData
 import app.http_exception as http_exception
-from app.utils.hashing import verify_hash, hash_password
+from app.utils.hashing import hash_password_async
 from app.oauth2 import get_current_user
+from app.request_context import context_cache
 
 from app.database import mongodb
 
@@ -41,18 +42,21 @@ from app.routes.api.v1.userSettings import (
 
 from app.Config import ENV_PROJECT
 from app.utils.mailer_module import template
-from app.utils.mailer_module import mail
-from app.database.repositories.accountingRepo import accounting_repo
+from app.utils.mailer_module import mail_queue
 from app.database.repositories.accountingGroupRepo import accounting_group_repo
 from app.database.repositories.categoryRepo import category_repo
 from app.database.repositories.voucharCounterRepo import vouchar_counter_repo
 from app.database.repositories.VoucharTypeRepo import vouchar_type_repo
 from app.database.repositories.companyRepo import company_repo
 from app.database.repositories.CompanySettingsRepo import company_settings_repo
-from app.database.repositories.InventoryRepo import inventory_repo
+from app.database.repositories.companyPurge import company_purge, delete_vouchers
+from app.database.repositories.purgeJobRepo import purge_job_repo
 from app.database.repositories.inventoryGroupRepo import inventory_group_repo
 from app.database.repositories.ledgerRepo import ledger_repo
 from app.database.repositories.stockItemRepo import stock_item_repo
+from app.database.repositories.stockBalanceRepo import stock_balance_repo
+from app.database.repositories.analyticsRollupRepo import analytics_rollup_repo
+from app.database.repositories.balanceSnapshotRepo import balance_snapshot_repo
 from app.database.repositories.token import refresh_token_repo
 from app.Config import ENV_PROJECT
 
@@ -60,7 +64,6 @@ from app.Config import ENV_PROJECT
 from app.database.repositories.UnitOMeasureRepo import units_repo
 from app.database.repositories.user import user_repo
 from app.database.repositories.UserSettingsRepo import user_settings_repo
-from app.database.repositories.voucharRepo import vouchar_repo
 from typing import Optional
 from app.schema.enums import UserTypeEnum
 from datetime import datetime
@@ -138,6 +141,18 @@ class EmailQuery(BaseModel):
 #         }
 
 
+async def verify_login_password(user: dict, password: str) -> bool:
+    """Check a login password, upgrading the stored hash when BCRYPT_ROUNDS changed."""
+    if not await hashing.verify_hash_async(password, user["password"]):
+        return False
+    if hashing.needs_rehash(user["password"]):
+        await user_repo.update_one(
+            {"_id": user["_id"]},
+            {"$set": {"password": await hashing.hash_password_async(password)}},
+        )
+    return True
+
+
 @auth.post("/login", response_class=ORJSONResponse, status_code=status.HTTP_200_OK)
 async def login(
     request: Request,
@@ -158,7 +173,7 @@ async def login(
             "_id": "admin-0001",
         }
         token_version = 1
-        if hashing.verify_hash(creds.password, user["password"]):
+        if await hashing.verify_hash_async(creds.password, user["password"]):
             token_data = TokenData(
                 user_id=user["_id"],
                 user_type=user_type.value,
@@ -197,8 +212,6 @@ async def login(
             detail="User not found. Please check your username."
         )
 
-    db_password = user["password"]
-
     user_settings = await user_settings_repo.findOne({"user_id": user["_id"]})
 
     if not user_settings:
@@ -243,7 +256,7 @@ async def login(
         )
 
         new_token_version = db_token.get("token_version", 1)
-        if hashing.verify_hash(creds.password, db_password):
+        if await verify_login_password(user, creds.password):
 
             token_data = TokenData(
                 user_id=user["_id"],
@@ -274,6 +287,7 @@ async def login(
                     }
                 },
             )
+            context_cache.invalidate(user["_id"])
             # await otp_repo.delete_one({"phone_number": creds.username, "otp": creds.password})
             return {
                 "ok": True,
@@ -286,7 +300,7 @@ async def login(
             )
     else:
         token_version = 1
-        if hashing.verify_hash(creds.password, db_password):
+        if await verify_login_password(user, creds.password):
             token_data = TokenData(
                 user_id=user["_id"],
                 user_type=user_type.value,
@@ -314,6 +328,7 @@ async def login(
                     }
                 },
             )
+            context_cache.invalidate(user["_id"])
 
             return {
                 "ok": True,
@@ -361,7 +376,7 @@ async def register(
         f"{ENV_PROJECT.FRONTEND_DOMAIN}/verify?token={token_generated}&email={user.email}"
     )
 
-    mail.send(
+    await mail_queue.enqueue(
         "Welcome to Vyapar Drishti",
         user.email,
         template.Onboard(
@@ -374,7 +389,7 @@ async def register(
 
     keys = ["password", "email", "phone", "user_type", "name"]
     values = [
-        hash_password(password=user.password),
+        await hash_password_async(password=user.password),
         user.email,
         user.phone,
         "user",
@@ -685,45 +700,12 @@ async def delete_user_company(
             detail="First switch to the company you want to delete."
         )
 
-    voucher_docs = await vouchar_repo.findMany({"company_id": company_id})
-    voucher_ids = [doc["_id"] for doc in voucher_docs]
-
-    # Delete related data
-    await asyncio.gather(
-        accounting_repo.deleteAll({"vouchar_id": {"$in": voucher_ids}}),
-        inventory_repo.deleteAll({"vouchar_id": {"$in": voucher_ids}}),
-        vouchar_repo.deleteAll(
-            {"company_id": company_id, "user_id": current_user.user_id}
-        ),
-        accounting_group_repo.deleteAll(
-            {"company_id": company_id, "user_id": current_user.user_id}
-        ),
-        category_repo.deleteAll(
-            {"company_id": company_id, "user_id": current_user.user_id}
-        ),
-        vouchar_counter_repo.deleteAll(
-            {"company_id": company_id, "user_id": current_user.user_id}
-        ),
-        vouchar_type_repo.deleteAll(
-            {"company_id": company_id, "user_id": current_user.user_id}
-        ),
-        inventory_group_repo.deleteAll(
-            {"company_id": company_id, "user_id": current_user.user_id}
-        ),
-        ledger_repo.deleteAll(
-            {"company_id": company_id, "user_id": current_user.user_id}
-        ),
-        stock_item_repo.deleteAll(
-            {"company_id": company_id, "user_id": current_user.user_id}
-        ),
-        units_repo.deleteAll({"company_id": company_id, "user_id": current_user.user_id}),
-        company_settings_repo.deleteAll(
-            {"company_id": company_id, "user_id": current_user.user_id}
-        ),
+    # Hide the company now; its data is deleted in the background
+    await company_repo.update_one(
+        {"_id": company_id, "user_id": current_user.user_id},
+        {"$set": {"is_deleted": True}},
     )
-
-    # Delete the company
-    await company_repo.deleteOne({"_id": company_id, "user_id": current_user.user_id})
+    job_id = await company_purge.submit(current_user.user_id, company_id)
 
     # Find fallback company
     remaining_companies = await company_repo.collection.aggregate(
@@ -758,6 +740,7 @@ async def delete_user_company(
                 }
             },
         )
+    context_cache.invalidate(current_user.user_id)
 
     client_info = classify_client(request.headers.get("user-agent", "unknown"))
 
@@ -780,6 +763,7 @@ async def delete_user_company(
         "accessToken": token_pair.access_token,
         "refreshToken": token_pair.refresh_token,
         "company_id": fallback_company["_id"] if fallback_company else None,
+        "job_id": job_id,
         "message": (
             "Company and all associated data deleted successfully. Switched to fallback company."
             if fallback_company
@@ -788,6 +772,34 @@ async def delete_user_company(
     }
 
 
+@auth.get(
+    "/delete/user/company/jobs/{job_id}",
+    response_class=ORJSONResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def company_purge_progress(
+    job_id: str,
+    current_user: TokenData = Depends(get_current_user),
+):
+    job = await purge_job_repo.findOne({"_id": job_id, "user_id": current_user.user_id})
+    if job is None:
+        raise http_exception.ResourceNotFoundException(detail="Job not found.")
+
+    return {
+        "success": True,
+        "message": "Data Fetched Successfully...",
+        "data": {
+            "job_id": job["_id"],
+            "company_id": job["company_id"],
+            "status": job["status"],
+            "stage": job.get("stage"),
+            "deleted": job.get("deleted", {}),
+            "error": job.get("error"),
+            "finished_at": job.get("finished_at"),
+        },
+    }
+
+
 # Endpoint to delete the user data completely
 @auth.delete(
     "/delete/user",
@@ -816,14 +828,10 @@ async def delete_user(
             detail="Can't find User. Aborting deletion."
         )
 
-    voucher_docs = await vouchar_repo.findMany({"user_id": current_user.user_id})
-    voucher_ids = [doc["_id"] for doc in voucher_docs]
+    await delete_vouchers({"user_id": current_user.user_id}, ENV_PROJECT.PURGE_BATCH_SIZE)
 
     # Delete related data
     await asyncio.gather(
-        accounting_repo.deleteAll({"vouchar_id": {"$in": voucher_ids}}),
-        inventory_repo.deleteAll({"vouchar_id": {"$in": voucher_ids}}),
-        vouchar_repo.deleteAll({"user_id": current_user.user_id}),
         accounting_group_repo.deleteAll({"user_id": current_user.user_id}),
         category_repo.deleteAll({"user_id": current_user.user_id}),
         vouchar_counter_repo.deleteAll({"user_id": current_user.user_id}),
@@ -831,12 +839,16 @@ async def delete_user(
         inventory_group_repo.deleteAll({"user_id": current_user.user_id}),
         ledger_repo.deleteAll({"user_id": current_user.user_id}),
         stock_item_repo.deleteAll({"user_id": current_user.user_id}),
+        stock_balance_repo.deleteAll({"user_id": current_user.user_id}),
+        analytics_rollup_repo.deleteAll({"user_id": current_user.user_id}),
+        balance_snapshot_repo.deleteAll({"user_id": current_user.user_id}),
         units_repo.deleteAll({"user_id": current_user.user_id}),
         company_settings_repo.deleteAll({"user_id": current_user.user_id}),
         company_repo.deleteAll({"user_id": current_user.user_id}),
     )
     # Delete the user settings
     await user_settings_repo.deleteOne({"user_id": current_user.user_id})
+    context_cache.invalidate(current_user.user_id)
 
     # Delete the refresh tokens associated with the user
 
@@ -967,7 +979,7 @@ async def send_email_query(
     email_query: EmailQuery,
 ):
     queryId = await generatePassword.createPassword()
-    mail.send(
+    await mail_queue.enqueue(
         "New Query from Vyapar Drishti Website",
         ENV_PROJECT.EMAIL_ADDRESS,
         template.QueryEmail(
@@ -1027,7 +1039,7 @@ async def forgot_password(request: Request, email: str):
 
     forgot_password_link = f"{ENV_PROJECT.FRONTEND_DOMAIN}/reset-password?token={token_generated}&email={userExists['email']}"
 
-    mail.send(
+    await mail_queue.enqueue(
         "Vyapar Drishti - Password Reset",
         userExists["email"],
         template.ForgotPassword(link=forgot_password_link, agenda="forgot_password"),
@@ -1067,7 +1079,7 @@ async def reset_password(request: Request, response: Response, data: ResetPasswo
         )
 
     # Hash the new password
-    hashed_password = hash_password(password=data.new_password)
+    hashed_password = await hash_password_async(password=data.new_password)
 
     if not hashed_password:
         raise http_exception.CredentialsInvalidException(
@@ -1141,6 +1153,7 @@ async def reset_password(request: Request, response: Response, data: ResetPasswo
                 }
             },
         )
+        context_cache.invalidate(userExists["_id"])
         return {
             "success": True,
             "accessToken": token_generated.access_token,
@@ -1175,6 +1188,7 @@ async def reset_password(request: Request, response: Response, data: ResetPasswo
                 }
             },
         )
+        context_cache.invalidate(userExists["_id"])
         return {
             "success": True,
             "accessToken": token_generated.access_token,
@@ -2,6 +2,7 @@ from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
 from app.oauth2 import get_current_user
+from app.request_context import context_cache
 from app.schema.token import TokenData
 import app.http_exception as http_exception
 from app.database.models.CompanySettings import CompanySettings
@@ -47,5 +48,6 @@ async def initialize_company_settings(
         "is_deleted": False,
     }
     await company_settings_repo.new(CompanySettings(**company_settings))
+    context_cache.invalidate(user_id)
 
     return {"message": "Company Settings initialized."}
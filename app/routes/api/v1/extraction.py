@@ -1,19 +1,81 @@
+import asyncio
+import json
+
 from fastapi import APIRouter,Depends
 from fastapi import UploadFile, File
+from fastapi.responses import StreamingResponse
 from app.database.repositories.extraction import extraction_tools
+from app.database.repositories.extractionJobRepo import extraction_job_repo
 from app.schema.token import TokenData
 import app.http_exception as http_exception
 from app.oauth2 import get_current_user
 extraction = APIRouter()
 
+# Fields a client polls / streams; the per page text is only in the full job
+PROGRESS_FIELDS = ["status", "method", "pages_total", "pages_done", "error"]
+
+
 @extraction.post("/file/upload")
-async def upload_file(file: UploadFile = File(...)):
-    response = await extraction_tools.text_extraction_for_scanned_and_selectable_file_for_json_format_through_gemini(file)
+async def upload_file(
+    file: UploadFile = File(...),
+    current_user: TokenData = Depends(get_current_user),
+):
+    if current_user.user_type != "user" and current_user.user_type != "admin":
+        raise http_exception.CredentialsInvalidException()
+
+    job_id = await extraction_tools.submit(file, current_user.user_id)
     return {
         "success": True,
-        "message": "Data Extracted Successfully",
-        "data": response
+        "message": "Extraction Started",
+        "data": {"job_id": job_id},
     }
+
+
+@extraction.get("/jobs/{job_id}")
+async def get_extraction_job(
+    job_id: str,
+    current_user: TokenData = Depends(get_current_user),
+):
+    job = await extraction_job_repo.findOne(
+        {"_id": job_id, "user_id": current_user.user_id}
+    )
+    if job is None:
+        raise http_exception.ResourceNotFoundException(detail="Extraction Job Not Found")
+    done = job["status"] == "done"
+    return {
+        "success": True,
+        "message": "Data Extracted Successfully" if done else "Extraction In Progress",
+        "data": job,
+    }
+
+
+@extraction.get("/jobs/{job_id}/events")
+async def stream_extraction_job(
+    job_id: str,
+    current_user: TokenData = Depends(get_current_user),
+):
+    """Server-sent events with the job progress until it is done or failed."""
+    owned = {"_id": job_id, "user_id": current_user.user_id}
+    if await extraction_job_repo.findOne(owned) is None:
+        raise http_exception.ResourceNotFoundException(detail="Extraction Job Not Found")
+
+    async def events():
+        last = None
+        while True:
+            job = await extraction_job_repo.findOne(owned)
+            if job is None:
+                return
+            progress = {field: job.get(field) for field in PROGRESS_FIELDS}
+            if job["status"] == "done":
+                progress["result"] = job["result"]
+            if progress != last:
+                yield f"data: {json.dumps(progress, default=str)}\n\n"
+                last = progress
+            if job["status"] in ("done", "failed"):
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
    
 
 # @extraction.post("/extraction/save/database")
@@ -4,6 +4,7 @@ from fastapi.responses import ORJSONResponse
 from fastapi import APIRouter
 from app.schema.token import TokenData
 from app.oauth2 import get_current_user
+from app.request_context import RequestContext, get_request_context
 import app.http_exception as http_exception
 from app.database.models.Ledger import Ledger
 from app.database.repositories.crud.base import (
@@ -15,11 +16,13 @@ from app.database.repositories.crud.base import (
     Page,
 )
 from fastapi import Query
+from app.database.repositories.crud.cursor import listing_totals
 from app.database.repositories.ledgerRepo import ledger_repo
 from app.database.repositories.voucharRepo import vouchar_repo
 from app.database.repositories.UserSettingsRepo import user_settings_repo
 from app.utils.cloudinary_client import cloudinary_client
 import sys
+from app.utils.pdf_cache import pdf_cache
 from typing import Any, Dict, Optional
 from pymongo.errors import (
     DuplicateKeyError,
@@ -66,11 +69,12 @@ async def create_ledger(
     bank_name: str = Form(None),
     bank_branch: str = Form(None),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "admin" and current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -151,6 +155,7 @@ async def create_ledger(
         raise http_exception.ResourceAlreadyExistsException(
             detail="Creditor Already Exists"
         )
+    listing_totals.invalidate(ledger_data["company_id"])
 
     return {"success": True, "message": "Ledger Created Successfully"}
 
@@ -158,6 +163,7 @@ async def create_ledger(
 @ledger.get("/view/all", response_class=ORJSONResponse, status_code=status.HTTP_200_OK)
 async def view_all_ledger(
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
     search: str = None,
     state: str = Query(None),
     parent: str = Query(None),
@@ -167,18 +173,20 @@ async def view_all_ledger(
     page_no: int = Query(1, ge=1),
     sortField: str = "created_at",
     sortOrder: SortingOrder = SortingOrder.DESC,
+    cursor: bool = Query(False, description="Keyset pagination, see `after`"),
+    after: str = Query(None, description="`meta.next` of the previous page"),
 ):
     if current_user.user_type != "admin" and current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
             detail="User Settings Not Found. Please create user settings first."
         )
 
-    page = Page(page=page_no, limit=limit)
+    page = Page(page=page_no, limit=limit, cursor=cursor, after=after)
     sort = Sort(sort_field=sortField, sort_order=sortOrder)
     page_request = PageRequest(paging=page, sorting=sort)
 
@@ -202,11 +210,12 @@ async def view_all_ledger(
 async def view_all_ledgers(
     company_id: str = Query(None),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "admin" and current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -242,11 +251,12 @@ async def view_ledgers_with_type(
     type: str,
     company_id: str = Query(None),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "admin" and current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -327,11 +337,12 @@ async def view_ledgers_transaction_type(
     type: list[str],
     company_id: str = Query(None),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "admin" and current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -390,11 +401,12 @@ async def update_ledger(
     bank_name: str = Form(None),
     bank_branch: str = Form(None),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "admin" and current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -473,6 +485,11 @@ async def update_ledger(
             },
             {"$set": update_fields},
         )
+        listing_totals.invalidate(ledgerExists["company_id"])
+        # Printed vouchers embed the party details
+        await pdf_cache.invalidate_company(
+            current_user.current_company_id or userSettings["current_company_id"]
+        )
 
         return {
             "success": True,
@@ -507,13 +524,14 @@ async def update_ledger_details(
     ledger_id: str,
     ledger_details: Dict[str, Any] = Body(...),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "admin" and current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException(
             detail="Invalid user type. Only admin and user types are allowed."
         )
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -574,6 +592,11 @@ async def update_ledger_details(
             },
             {"$set": updated_dict, "$currentDate": {"updated_at": True}},
         )
+        listing_totals.invalidate(ledgerExists["company_id"])
+        # Printed vouchers embed the party details
+        await pdf_cache.invalidate_company(
+            current_user.current_company_id or userSettings["current_company_id"]
+        )
 
         return {
             "success": True,
@@ -598,6 +621,32 @@ async def update_ledger_details(
         )
 
 
+# Ledger fields left out of the statement view
+LEDGER_VIEW_HIDDEN_FIELDS = [
+    "tax_registration_type",
+    "account_holder",
+    "account_number",
+    "bank_ifsc",
+    "bank_name",
+    "bank_branch",
+    "created_at",
+    "updated_at",
+    "is_revenue",
+    "is_deemed_positive",
+    "alias",
+    "image",
+    "qr_image",
+    "parent_id",
+    "company_id",
+    "user_id",
+    "mailing_name",
+    "mailing_address",
+    "mailing_state",
+    "mailing_country",
+    "mailing_pincode",
+]
+
+
 @ledger.get(
     "/view/{ledger_id}",
     response_class=ORJSONResponse,
@@ -608,12 +657,15 @@ async def view_ledger(
     start_date: str,
     end_date: str,
     company_id: str = Query(None),
+    page_no: int = Query(1, ge=1),
+    limit: int = Query(50, le=sys.maxsize),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "admin" and current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -624,211 +676,28 @@ async def view_ledger(
     if end_date not in [None, ""]:
         end_date = end_date[:10]
 
-    result = await ledger_repo.collection.aggregate(
-        [
-            {
-                "$match": {
-                    "user_id": current_user.user_id,
-                    "company_id": current_user.current_company_id
-                    or userSettings["current_company_id"],
-                    "_id": ledger_id,
-                    "is_deleted": False,
-                },
-            },
-            {
-                "$lookup": {
-                    "from": "Accounting",
-                    "localField": "_id",
-                    "foreignField": "ledger_id",
-                    "as": "accounts",
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "Voucher",
-                    "localField": "accounts.vouchar_id",
-                    "foreignField": "_id",
-                    "as": "vouchars",
-                }
-            },
-            {
-                "$addFields": {
-                    "opening_accounts": {
-                        "$filter": {
-                            "input": {
-                                "$map": {
-                                    "input": "$accounts",
-                                    "as": "acc",
-                                    "in": {
-                                        "amount": "$$acc.amount",
-                                        "vouchar_id": "$$acc.vouchar_id",
-                                        "date": {
-                                            "$arrayElemAt": [
-                                                {
-                                                    "$map": {
-                                                        "input": {
-                                                            "$filter": {
-                                                                "input": "$vouchars",
-                                                                "as": "v",
-                                                                "cond": {
-                                                                    "$eq": [
-                                                                        "$$v._id",
-                                                                        "$$acc.vouchar_id",
-                                                                    ]
-                                                                },
-                                                            }
-                                                        },
-                                                        "as": "fv",
-                                                        "in": "$$fv.date",
-                                                    }
-                                                },
-                                                0,
-                                            ]
-                                        },
-                                    },
-                                }
-                            },
-                            "as": "oa",
-                            "cond": {"$lt": ["$$oa.date", start_date]},
-                        }
-                    },
-                    "current_accounts": {
-                        "$filter": {
-                            "input": {
-                                "$map": {
-                                    "input": "$accounts",
-                                    "as": "acc",
-                                    "in": {
-                                        "amount": "$$acc.amount",
-                                        "vouchar_id": "$$acc.vouchar_id",
-                                        "date": {
-                                            "$arrayElemAt": [
-                                                {
-                                                    "$map": {
-                                                        "input": {
-                                                            "$filter": {
-                                                                "input": "$vouchars",
-                                                                "as": "v",
-                                                                "cond": {
-                                                                    "$eq": [
-                                                                        "$$v._id",
-                                                                        "$$acc.vouchar_id",
-                                                                    ]
-                                                                },
-                                                            }
-                                                        },
-                                                        "as": "fv",
-                                                        "in": "$$fv.date",
-                                                    }
-                                                },
-                                                0,
-                                            ]
-                                        },
-                                    },
-                                }
-                            },
-                            "as": "ca",
-                            "cond": {
-                                "$and": [
-                                    {"$gte": ["$$ca.date", start_date]},
-                                    {"$lte": ["$$ca.date", end_date]},
-                                ]
-                            },
-                        }
-                    },
-                }
-            },
-            {
-                "$addFields": {
-                    "opening_txn": {"$sum": "$opening_accounts.amount"},
-                    "current_debit": {
-                        "$sum": {
-                            "$map": {
-                                "input": "$current_accounts",
-                                "as": "ca",
-                                "in": {
-                                    "$cond": [
-                                        {"$gt": ["$$ca.amount", 0]},
-                                        "$$ca.amount",
-                                        0,
-                                    ]
-                                },
-                            }
-                        }
-                    },
-                    "current_credit": {
-                        "$sum": {
-                            "$map": {
-                                "input": "$current_accounts",
-                                "as": "ca",
-                                "in": {
-                                    "$cond": [
-                                        {"$lt": ["$$ca.amount", 0]},
-                                        "$$ca.amount",
-                                        0,
-                                    ]
-                                },
-                            }
-                        }
-                    },
-                }
-            },
-            {
-                "$addFields": {
-                    "opening_balance": {
-                        "$round": [{"$add": ["$opening_balance", "$opening_txn"]}, 2]
-                    },
-                    "total_debit": {"$round": ["$current_debit", 2]},
-                    "total_credit": {"$round": ["$current_credit", 2]},
-                    "closing_balance": {
-                        "$round": [
-                            {
-                                "$add": [
-                                    "$opening_balance",
-                                    "$opening_txn",
-                                    "$current_debit",
-                                    "$current_credit",
-                                ]
-                            },
-                            2,
-                        ]
-                    },
-                }
-            },
-            {
-                "$project": {
-                    "accounts": 0,
-                    "vouchars": 0,
-                    "opening_accounts": 0,
-                    "current_accounts": 0,
-                    "opening_txn": 0,
-                    "current_debit": 0,
-                    "current_credit": 0,
-                    "tax_registration_type": 0,
-                    "account_holder": 0,
-                    "account_number": 0,
-                    "bank_ifsc": 0,
-                    "bank_name": 0,
-                    "bank_branch": 0,
-                    "created_at": 0,
-                    "updated_at": 0,
-                    "is_revenue": 0,
-                    "is_deemed_positive": 0,
-                    "alias": 0,
-                    "image": 0,
-                    "qr_image": 0,
-                    "parent_id": 0,
-                    "company_id": 0,
-                    "user_id": 0,
-                    "mailing_name": 0,
-                    "mailing_address": 0,
-                    "mailing_state": 0,
-                    "mailing_country": 0,
-                    "mailing_pincode": 0,
-                }
-            },
-        ]
-    ).to_list(length=1)
+    company_id = current_user.current_company_id or userSettings["current_company_id"]
+    ledger_doc = await ledger_repo.findOne(
+        {
+            "user_id": current_user.user_id,
+            "company_id": company_id,
+            "_id": ledger_id,
+            "is_deleted": False,
+        },
+        {field: 0 for field in LEDGER_VIEW_HIDDEN_FIELDS},
+    )
+
+    result = []
+    if ledger_doc is not None:
+        statement = await ledger_repo.statement(
+            ledger_doc,
+            current_user.user_id,
+            company_id,
+            start_date,
+            end_date,
+            Page(page=page_no, limit=limit),
+        )
+        result.append({**ledger_doc, **statement})
 
     return {
         "success": True,
@@ -846,11 +715,12 @@ async def get_ledger(
     ledger_id: str,
     company_id: str = Query(None),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "admin" and current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -895,11 +765,12 @@ async def view_ledger_invoices(
     sortField: str = "created_at",
     sortOrder: SortingOrder = SortingOrder.DESC,
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "admin" and current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -932,12 +803,14 @@ async def view_ledger_invoices(
 # Api endpoint for checking if a user can create a ledger with a given name
 @ledger.get("/check/name", response_class=ORJSONResponse, status_code=status.HTTP_200_OK)
 async def check_ledger_name(
-    ledger_name: str, current_user: TokenData = Depends(get_current_user)
+    ledger_name: str,
+    current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "admin" and current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException(detail="Invalid user type")
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
             detail="User Settings Not Found. Please contact support."
@@ -998,11 +871,12 @@ async def check_ledger_name(
 async def delete_ledger(
     ledger_id: str = "",
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "admin" and current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
             detail="User Settings Not Found. Please contact support."
@@ -1045,6 +919,9 @@ async def delete_ledger(
             or userSettings["current_company_id"],
         },
     )
+    listing_totals.invalidate(
+        current_user.current_company_id or userSettings["current_company_id"]
+    )
 
     return {
         "success": True,
@@ -3,13 +3,16 @@ from fastapi.responses import ORJSONResponse
 import app.http_exception as http_exception
 from app.schema.token import TokenData
 from app.oauth2 import get_current_user
+from app.request_context import RequestContext, get_request_context
 from fastapi import Query
 from app.database.repositories.crud.base import SortingOrder, Sort, Page, PageRequest
+from app.database.repositories.crud.cursor import listing_totals
 from app.database.repositories.UserSettingsRepo import user_settings_repo
 from app.database.repositories.CompanySettingsRepo import company_settings_repo
 from app.database.repositories.stockItemRepo import stock_item_repo
 from app.database.repositories.voucharRepo import vouchar_repo
 from app.database.repositories.InventoryRepo import inventory_repo
+from app.database.repositories.stockBalanceRepo import stock_balance_repo
 from app.database.models.StockItem import StockItem
 from app.utils.cloudinary_client import cloudinary_client
 import re
@@ -54,11 +57,12 @@ async def create_product(
     tax_rate: float = Form(0.0),
     low_stock_alert: float = Form(5.0),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -113,7 +117,15 @@ async def create_product(
     }
 
     try:
-        await stock_item_repo.new(StockItem(**product_data))
+        product = await stock_item_repo.new(StockItem(**product_data))
+        await stock_balance_repo.set_opening(
+            item_id=product.stock_item_id,
+            user_id=product.user_id,
+            company_id=product.company_id,
+            opening_balance=product.opening_balance,
+            opening_value=product.opening_value,
+        )
+        listing_totals.invalidate(product.company_id)
 
         return {
             "success": True,
@@ -147,11 +159,12 @@ async def get_product(
     product_id: str,
     company_id: str,
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -237,11 +250,12 @@ async def get_product_details(
     product_id: str,
     company_id: str,
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -643,11 +657,12 @@ async def getProductTimeline(
     product_id: str,
     company_id: str = Query(""),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type not in {"user", "admin"}:
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -672,6 +687,7 @@ async def getProductTimeline(
 )
 async def view_all_product(
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
     company_id: str = Query(None),
     search: str = None,
     category: str = None,
@@ -685,7 +701,7 @@ async def view_all_product(
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -716,6 +732,7 @@ async def view_all_product(
 )
 async def view_inventory_items(
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
     company_id: str = Query(None),
     search: str = None,
     category: str = None,
@@ -729,7 +746,7 @@ async def view_inventory_items(
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -763,12 +780,13 @@ async def view_inventory_items(
 )
 async def view_inventory_stats(
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
     company_id: str = Query(None),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -792,6 +810,7 @@ async def view_inventory_stats(
 )
 async def view_all_stock_items(
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
     company_id: str = Query(None),
     search: str = None,
     category: str = None,
@@ -801,18 +820,20 @@ async def view_all_stock_items(
     limit: int = Query(10, le=sys.maxsize),
     sortField: str = "created_at",
     sortOrder: SortingOrder = SortingOrder.DESC,
+    cursor: bool = Query(False, description="Keyset pagination, see `after`"),
+    after: str = Query(None, description="`meta.next` of the previous page"),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
             detail="User Settings Not Found. Please create user settings first."
         )
 
-    page = Page(page=page_no, limit=limit)
+    page = Page(page=page_no, limit=limit, cursor=cursor, after=after)
     sort = Sort(sort_field=sortField, sort_order=sortOrder)
     page_request = PageRequest(paging=page, sorting=sort)
 
@@ -838,11 +859,12 @@ async def view_all_stock_items(
 async def get_products_with_id(
     company_id: str,
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -902,24 +924,19 @@ async def update_product(
     tax_rate: float = Form(0),
     low_stock_alert: float = Form(10),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
             detail="User Settings Not Found. Please contact support."
         )
 
-    companySettings = await company_settings_repo.findOne(
-        {
-            "company_id": current_user.current_company_id
-            or userSettings["current_company_id"],
-            "user_id": current_user.user_id,
-        }
-    )
+    companySettings = context.company_settings
     if companySettings is None:
         raise http_exception.ResourceNotFoundException(
             detail="Company Settings Not Found. Please contact support."
@@ -991,6 +1008,14 @@ async def update_product(
             },
             {"$set": update_fields},
         )
+        await stock_balance_repo.set_opening(
+            item_id=product_id,
+            user_id=current_user.user_id,
+            company_id=productExists["company_id"],
+            opening_balance=opening_balance,
+            opening_value=opening_value,
+        )
+        listing_totals.invalidate(productExists["company_id"])
 
         return {
             "success": True,
@@ -1024,26 +1049,21 @@ async def update_product_details(
     product_id: str = "",
     product_details: Dict[str, Any] = Body(...),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException(
             detail="Operation not allowed for this user type."
         )
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
             detail="User Settings Not Found. Please contact support."
         )
 
-    companySettings = await company_settings_repo.findOne(
-        {
-            "company_id": current_user.current_company_id
-            or userSettings["current_company_id"],
-            "user_id": current_user.user_id,
-        }
-    )
+    companySettings = context.company_settings
 
     if companySettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -1081,6 +1101,19 @@ async def update_product_details(
             },
             {"$set": updated_dict, "$currentDate": {"updated_at": True}},
         )
+        if "opening_balance" in updated_dict or "opening_value" in updated_dict:
+            await stock_balance_repo.set_opening(
+                item_id=product_id,
+                user_id=current_user.user_id,
+                company_id=productExists["company_id"],
+                opening_balance=updated_dict.get(
+                    "opening_balance", productExists.get("opening_balance")
+                ),
+                opening_value=updated_dict.get(
+                    "opening_value", productExists.get("opening_value")
+                ),
+            )
+        listing_totals.invalidate(productExists["company_id"])
 
         return {
             "success": True,
@@ -1115,11 +1148,12 @@ async def delete_product(
     product_id: str,
     company_id: str,
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -1164,6 +1198,8 @@ async def delete_product(
                     or userSettings["current_company_id"],
                 },
             )
+            await stock_balance_repo.deleteById(product_id)
+            listing_totals.invalidate(product["company_id"])
 
     return {"success": True, "message": "Product Deleted Successfully"}
 
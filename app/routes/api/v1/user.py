@@ -19,6 +19,7 @@ from app.routes.api.v1.voucharCounter import initialize_voucher_counters
 from app.routes.api.v1.companySettings import initialize_company_settings
 from app.schema.token import TokenData
 from app.oauth2 import create_access_token, get_current_user, set_cookies
+from app.request_context import RequestContext, context_cache, get_request_context
 from app.database.repositories.UserSettingsRepo import user_settings_repo
 from app.database.repositories.ledgerRepo import ledger_repo, Ledger
 from app.utils.cloudinary_client import cloudinary_client
@@ -26,6 +27,7 @@ from app.database.repositories.companyRepo import company_repo, Company
 from app.database.repositories.CompanySettingsRepo import company_settings_repo
 from typing import Any, Dict, Optional
 from app.Config import ENV_PROJECT
+from app.utils.pdf_cache import pdf_cache
 from motor.motor_asyncio import AsyncIOMotorClient
 
 
@@ -295,6 +297,7 @@ async def createCompany(
                     }
                 },
             )
+            context_cache.invalidate(current_user.user_id)
 
         ledger_data = [
             {
@@ -520,6 +523,7 @@ async def get_all_company(
 async def get_company(
     # company_id: str,
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     user = await user_repo.findOne({"_id": current_user.user_id})
     if user is None:
@@ -530,7 +534,7 @@ async def get_company(
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -723,6 +727,9 @@ async def updateCompany(
             {"$set": settings_dict, "$currentDate": {"updated_at": True}},
         )
 
+    await pdf_cache.invalidate_company(company_id)
+    context_cache.invalidate(current_user.user_id)
+
     return {
         "success": True,
         "message": "Company Updated Successfully",
@@ -773,6 +780,9 @@ async def updateCompanyDetails(
         {"_id": company_id, "user_id": current_user.user_id},
         {"$set": updated_dict, "$currentDate": {"updated_at": True}},
     )
+    await pdf_cache.invalidate_company(company_id)
+    context_cache.invalidate(current_user.user_id)
+
     if not updated_settings_dict:
         return {
             "success": True,
@@ -784,6 +794,7 @@ async def updateCompanyDetails(
         {"company_id": company_id, "user_id": current_user.user_id},
         {"$set": updated_settings_dict, "$currentDate": {"updated_at": True}},
     )
+    context_cache.invalidate(current_user.user_id)
 
     # # Fetch the updated document after update
     # updatedCompany = await company_repo.findOne(
@@ -15,6 +15,7 @@ from fastapi import (
     Header,
 )
 from app.oauth2 import get_current_user, create_access_token, set_cookies
+from app.request_context import context_cache
 from app.schema.token import TokenData
 import app.http_exception as http_exception
 from app.database.models.UserSettings import UserSettings
@@ -111,6 +112,7 @@ async def initialize_user_settings(
         "last_login_device": extract_device_info(last_login_device),
     }
     await user_settings_repo.new(UserSettings(**user_settigs))
+    context_cache.invalidate(user_id)
 
     return {"message": "User Settings initialized"}
 
@@ -153,6 +155,7 @@ async def updateUserSettings(
         {"_id": settings_id, "user_id": current_user.user_id},
         {"$set": updated_dict, "$currentDate": {"updated_at": True}},
     )
+    context_cache.invalidate(current_user.user_id)
 
     # Fetch the updated document after update
     updatedSettings = await user_settings_repo.findOne(
@@ -1,3 +1,6 @@
+import asyncio
+import csv
+import io
 import json
 from fastapi import (
     APIRouter,
@@ -6,44 +9,57 @@ from fastapi import (
     Form,
     UploadFile,
     status,
+    Request,
     Response,
 )
 from app.database.repositories.CompanySettingsRepo import company_settings_repo
 from app.database.repositories.companyRepo import company_repo
-from fastapi.responses import ORJSONResponse, HTMLResponse
+from fastapi.responses import ORJSONResponse, HTMLResponse, StreamingResponse
 from pydantic import BaseModel
 import app.http_exception as http_exception
 from app.routes.api.v1.taxModel import generate_tax_summary, get_current_user_tax_model
 from app.schema.token import TokenData
 from app.oauth2 import get_current_user
-from app.database.repositories.voucharRepo import vouchar_repo
+from app.request_context import RequestContext, get_request_context
+from app.database.repositories.voucharRepo import (
+    vouchar_repo,
+    entry_fields,
+    entry_operations,
+)
 from app.routes.api.v1.voucharCounter import get_cuurent_counter
 from app.database.repositories.voucharCounterRepo import vouchar_counter_repo
 from app.database.repositories.UserSettingsRepo import user_settings_repo
 from app.database.repositories.ledgerRepo import ledger_repo
 from app.database.repositories.accountingRepo import accounting_repo
 from app.database.repositories.InventoryRepo import inventory_repo
-from app.database.models.Vouchar import Voucher, VoucherCreate, VoucherUpdate
+from app.database.repositories.stockBalanceRepo import stock_balance_repo
+from app.database.repositories.analyticsRollupRepo import analytics_rollup_repo
+from app.database.repositories.balanceSnapshotRepo import balance_snapshot_repo
+from app.database.models.Vouchar import Voucher, VoucherDB, VoucherCreate, VoucherUpdate
 from app.database.models.VoucharCounter import VoucherCounter
-from app.database.models.Accounting import Accounting, AccountingUpdate
+from app.database.models.Accounting import Accounting, AccountingDB, AccountingUpdate
 from typing import Optional, List
 from app.database.models.Inventory import (
     InventoryItem,
+    InventoryItemDB,
     UpdateInventoryItemWithTAX,
     CreateInventoryItemWithTAX,
 )
 from fastapi import Query
+from pymongo.errors import DuplicateKeyError
 from app.database.repositories.crud.base import SortingOrder, Sort, Page, PageRequest
+from app.database.repositories.crud.cursor import listing_totals
 from app.database.repositories.stockItemRepo import stock_item_repo
-from jinja2 import Template
-import aiofiles
+from app.database.repositories.stockTimeline import EXPORT_FIELDS, StockTimeline
+from app.utils.templates.environment import get_template, template_version
+from app.utils.pdf_cache import pdf_cache
 from num2words import num2words
 from math import ceil
 import sys
 from app.Config import ENV_PROJECT
 from datetime import datetime
 from app.utils.mailer_module import template
-from app.utils.mailer_module import mail
+from app.utils.mailer_module import mail_queue
 
 # from playwright.async_api import async_playwright
 # from app.core.services import browser as shared_browser
@@ -51,6 +67,12 @@ import app.core.services as browser_module
 
 Vouchar = APIRouter()
 
+PDF_OPTIONS = {
+    "format": "A4",
+    "print_background": True,
+    "margin": {"top": "1cm", "bottom": "1cm", "left": "1cm", "right": "1cm"},
+}
+
 
 class VoucherWithTAXCreate(BaseModel):
     company_id: str
@@ -112,15 +134,15 @@ class TAXVoucherUpdate(BaseModel):
     items: Optional[List[UpdateInventoryItemWithTAX]]
 
 
-async def render_paginated_html(template_path, template_vars, items, items_per_page=17):
+async def render_paginated_html(
+    template_name, template_vars, items, items_per_page=17, company_id=None
+):
     """
     Splits items into pages, renders HTML for each page, and returns all rendered HTMLs.
     """
     pages = [items[i : i + items_per_page] for i in range(0, len(items), items_per_page)]
     rendered_pages = []
-    async with aiofiles.open(template_path, "r") as f:
-        template_str = await f.read()
-    template = Template(template_str)
+    template = get_template(template_name, company_id)
     for page_items in pages:
         page_vars = dict(template_vars)
         page_vars["invoice"]["items"] = page_items
@@ -132,26 +154,123 @@ async def render_paginated_html(template_path, template_vars, items, items_per_p
     return rendered_pages
 
 
+async def render_pdf_response(
+    request: Request, invoice: dict, template, template_vars: dict, filename: str
+) -> Response:
+    """
+    Serve a printed voucher from the PDF cache, rendering it only on a miss.
+    The cache digest doubles as ETag, so an unchanged voucher answers 304.
+    """
+    digest = pdf_cache.digest(template_vars, template_version(template))
+    etag = f'"{digest}"'
+    headers = {
+        "Content-Disposition": f"inline; filename={filename}",
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+    }
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    company_id, voucher_id = invoice["company_id"], invoice["_id"]
+    pdf_bytes = await pdf_cache.get(company_id, voucher_id, digest)
+    if pdf_bytes is None:
+        rendered_html = template.render(**template_vars)
+        pdf_bytes = await browser_module.page_pool.render_pdf(rendered_html, **PDF_OPTIONS)
+        await pdf_cache.put(company_id, voucher_id, digest, pdf_bytes)
+
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+
+
+async def build_accounting_entries(
+    vouchar, vouchar_id: str, current_user: TokenData
+) -> List[AccountingDB]:
+    """
+    Accounting rows of a new voucher. For Sales / Purchase vouchers every entry
+    other than the party is booked against the Sales / Purchases ledger, which
+    is looked up once for the whole voucher.
+    """
+    party_ledger = None
+    if vouchar.voucher_type in ["Sales", "Purchase"]:
+        party_ledger = await ledger_repo.findOne(
+            {
+                "company_id": current_user.current_company_id,
+                "ledger_name": (
+                    "Sales" if vouchar.voucher_type.lower() == "sales" else "Purchases"
+                ),
+                "user_id": current_user.user_id,
+            }
+        )
+        if party_ledger is None:
+            raise http_exception.BadRequestException()
+
+    entries = []
+    for entry in vouchar.accounting:
+        use_party_ledger = party_ledger is not None and entry.ledger != vouchar.party_name
+        entry_data = {
+            "vouchar_id": vouchar_id,
+            "ledger": party_ledger["ledger_name"] if use_party_ledger else entry.ledger,
+            "ledger_id": party_ledger["_id"] if use_party_ledger else entry.ledger_id,
+            "amount": entry.amount,
+            "order_index": entry.order_index,  # assign incremental order index
+        }
+        entries.append(AccountingDB(**Accounting(**entry_data).model_dump()))
+    return entries
+
+
+async def send_voucher_created_mail(vouchar, customer_ledger: dict, company: dict):
+    if vouchar.voucher_type in ["Sales", "Purchase"]:
+        await mail_queue.enqueue(
+            "Vyapar Drishti - Invoice Created",
+            customer_ledger["email"],
+            template.InvoiceCreated(
+                invoice_number=vouchar.voucher_number,
+                invoice_date=vouchar.date,
+                customer_name=vouchar.party_name,
+                total_amount=vouchar.total_amount,
+                due_date=vouchar.due_date,
+                payment_status=(
+                    "Paid" if vouchar.paid_amount >= vouchar.grand_total else "Unpaid"
+                ),
+            ),
+        )
+    elif vouchar.voucher_type in ["Payment", "Receipt"]:
+        await mail_queue.enqueue(
+            "Vyapar Drishti - Transaction Created",
+            customer_ledger["email"],
+            template.TransactionCreated(
+                user_name=company["company_name"],
+                transaction_type=vouchar.voucher_type,
+                customer_name=customer_ledger["ledger_name"],
+                currency_symbol='INR',
+                reference_note=vouchar.narration,
+                transaction_date=vouchar.date,
+                amount=vouchar.grand_total,
+                support_link=f"{ENV_PROJECT.FRONTEND_DOMAIN}/contact",
+            ),
+        )
+
+
 @Vouchar.post(
     "/create/vouchar", response_class=ORJSONResponse, status_code=status.HTTP_200_OK
 )
 async def createVouchar(
     vouchar: VoucherCreate,
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
             detail="User Settings Not Found. Please create user settings first."
         )
 
-    companyExists = await company_repo.findOne(
-        {"_id": current_user.current_company_id, "user_id": current_user.user_id}
-    )
+    companyExists = context.company
 
     if not companyExists:
         raise http_exception.ResourceNotFoundException(
@@ -165,7 +284,6 @@ async def createVouchar(
     )
 
     shouldIncreaseCounter = db_invoice_no == vouchar.voucher_number
-    shouldDecreaseCounter = False
 
     if len(vouchar.date) < 10:
         # Assuming the date is in 'YYYY-MM-DD' format, we can pad it with zeros where required.
@@ -212,158 +330,88 @@ async def createVouchar(
         "is_deleted": False,
     }
 
-    accounting_data = vouchar.accounting
-    inventory_data = vouchar.items
-
-    response = await vouchar_repo.new(Voucher(**vouchar_data))
-
-    if response:
-        try:
-
-            for entry in accounting_data:
-                if vouchar.voucher_type in ["Sales", "Purchase"]:
-                    ledger = (
-                        "Sales"
-                        if vouchar.voucher_type.lower() == "sales"
-                        else "Purchases"
-                    )
-                    party_ledger = await ledger_repo.findOne(
-                        {
-                            "company_id": current_user.current_company_id,
-                            "ledger_name": ledger,
-                            "user_id": current_user.user_id,
-                        }
-                    )
-
-                    entry_data = {
-                        "vouchar_id": response.vouchar_id,
-                        "ledger": (
-                            entry.ledger
-                            if entry.ledger == vouchar.party_name
-                            else party_ledger["ledger_name"]
-                        ),
-                        "ledger_id": (
-                            entry.ledger_id
-                            if entry.ledger == vouchar.party_name
-                            else party_ledger["_id"]
-                        ),
-                        "amount": entry.amount,
-                        "order_index": entry.order_index,  # assign incremental order index
-                    }
-                    await accounting_repo.new(Accounting(**entry_data))
+    voucher = VoucherDB(**Voucher(**vouchar_data).model_dump())
+    accounting_entries = await build_accounting_entries(
+        vouchar, voucher.vouchar_id, current_user
+    )
 
-                else:
+    # Create all inventory items
+    created_items = []
+    for item in vouchar.items:
+        item_data = {
+            "vouchar_id": voucher.vouchar_id,
+            "item": item.item,
+            "item_id": item.item_id,
+            "quantity": item.quantity,
+            "rate": item.rate,
+            "amount": item.amount,
+            "total_amount": item.total_amount,
+            "discount_amount": (item.discount_amount if item.discount_amount else 0.0),
+            "godown": item.godown if item.godown else "",
+            "godown_id": item.godown_id if item.godown_id else "",
+            "tax_rate": 0,
+            "tax_amount": 0,
+            "hsn_code": "",
+            "unit": item.unit if item.unit else "",
+            "order_index": item.order_index,  # assign incremental order index
+        }
+        created_items.append(item_data)
+    inventory_entries = [
+        InventoryItemDB(**InventoryItem(**item_data).model_dump())
+        for item_data in created_items
+    ]
 
-                    entry_data = {
-                        "vouchar_id": response.vouchar_id,
-                        "ledger": entry.ledger,
-                        "ledger_id": entry.ledger_id,
-                        "amount": entry.amount,
-                        "order_index": entry.order_index,  # assign incremental order index
-                    }
-                    await accounting_repo.new(Accounting(**entry_data))
-
-            # Create all inventory items
-            for item in inventory_data:
-                item_data = {
-                    "vouchar_id": response.vouchar_id,
-                    "item": item.item,
-                    "item_id": item.item_id,
-                    "quantity": item.quantity,
-                    "rate": item.rate,
-                    "amount": item.amount,
-                    "total_amount": item.total_amount,
-                    "discount_amount": (
-                        item.discount_amount if item.discount_amount else 0.0
-                    ),
-                    "godown": item.godown if item.godown else "",
-                    "godown_id": item.godown_id if item.godown_id else "",
-                    "tax_rate": 0,
-                    "tax_amount": 0,
-                    "hsn_code": "",
-                    "unit": item.unit if item.unit else "",
-                    "order_index": item.order_index,  # assign incremental order index
-                }
-                await inventory_repo.new(InventoryItem(**item_data))
-
-            if shouldIncreaseCounter:
-                # Increase the vouchar counter for the voucher type
-                await vouchar_counter_repo.update_one(
-                    {
-                        "voucher_type": vouchar.voucher_type,
-                        "company_id": current_user.current_company_id,
-                        "user_id": current_user.user_id,
-                    },
-                    {"$inc": {"current_number": 1}},
-                )
-
-                customer_ledger = await ledger_repo.findOne(
-                    {
-                        "company_id": current_user.current_company_id,
-                        "ledger_name": vouchar.party_name,
-                        "user_id": current_user.user_id,
-                    }
-                )
-
-                if vouchar.voucher_type in ["Sales", "Purchase"]:
-                    mail.send(
-                        "Vyapar Drishti - Invoice Created",
-                        customer_ledger["email"],
-                        template.InvoiceCreated(
-                            invoice_number=vouchar.voucher_number,
-                            invoice_date=vouchar.date,
-                            customer_name=vouchar.party_name,
-                            total_amount=vouchar.total_amount,
-                            due_date=vouchar.due_date,
-                            payment_status=(
-                                "Paid"
-                                if vouchar.paid_amount >= vouchar.grand_total
-                                else "Unpaid"
-                            ),
-                        ),
-                    )
-                elif vouchar.voucher_type in ["Payment", "Receipt"]:
-                    mail.send(
-                        "Vyapar Drishti - Transaction Created",
-                        customer_ledger["email"],
-                        template.TransactionCreated(
-                            user_name=companyExists["company_name"],
-                            transaction_type=vouchar.voucher_type,
-                            customer_name=customer_ledger["ledger_name"],
-                            currency_symbol='INR',
-                            reference_note=vouchar.narration,
-                            transaction_date=vouchar.date,
-                            amount=vouchar.grand_total,
-                            support_link=f"{ENV_PROJECT.FRONTEND_DOMAIN}/contact",
-                        ),
-                    )
+    counter_filter = {
+        "voucher_type": vouchar.voucher_type,
+        "company_id": current_user.current_company_id,
+        "user_id": current_user.user_id,
+    }
 
-                shouldDecreaseCounter = True
+    try:
+        await vouchar_repo.create_with_entries(
+            voucher,
+            accounting_entries,
+            inventory_entries,
+            counter_filter=counter_filter if shouldIncreaseCounter else None,
+        )
+    except DuplicateKeyError:
+        raise http_exception.ResourceAlreadyExistsException(
+            detail="Vouchar Already Exists. Please try with different vouchar name."
+        )
+    except Exception as e:
+        # Nothing was written, the transaction (or its fallback cleanup) undid it all
+        print("Error during vouchar creation:", e)
+        raise http_exception.BadRequestException()
 
+    if shouldIncreaseCounter:
+        customer_ledger = await ledger_repo.findOne(
+            {
+                "company_id": current_user.current_company_id,
+                "ledger_name": vouchar.party_name,
+                "user_id": current_user.user_id,
+            }
+        )
+        try:
+            await send_voucher_created_mail(vouchar, customer_ledger, companyExists)
         except Exception as e:
-            # Rollback vouchar creation if any error occurs
-            print("Error during vouchar creation:", e)
-            if shouldDecreaseCounter:
-                await vouchar_counter_repo.update_one(
-                    {
-                        "voucher_type": vouchar.voucher_type,
-                        "company_id": current_user.current_company_id,
-                        "user_id": current_user.user_id,
-                    },
-                    {"$inc": {"current_number": -1}},
-                )
-            await accounting_repo.deleteAll({"vouchar_id": response.vouchar_id})
-            await inventory_repo.deleteAll({"vouchar_id": response.vouchar_id})
-            await vouchar_repo.deleteById(response.vouchar_id)
+            print("Error sending vouchar mail:", e)
 
-            raise http_exception.BadRequestException()
+    await stock_balance_repo.apply_voucher_items(
+        user_id=current_user.user_id,
+        company_id=current_user.current_company_id,
+        voucher_type=vouchar.voucher_type,
+        date=vouchar.date,
+        added=created_items,
+    )
+    await analytics_rollup_repo.refresh_days(
+        current_user.user_id, current_user.current_company_id, [vouchar.date]
+    )
+    await balance_snapshot_repo.invalidate(
+        current_user.current_company_id, [vouchar.date]
+    )
+    listing_totals.invalidate(current_user.current_company_id)
 
-        return {"success": True, "message": "Vouchar Created Successfully"}
-
-    if not response:
-        raise http_exception.ResourceAlreadyExistsException(
-            detail="Vouchar Already Exists. Please try with different vouchar name."
-        )
+    return {"success": True, "message": "Vouchar Created Successfully"}
 
 
 @Vouchar.put(
@@ -375,11 +423,12 @@ async def updateVouchar(
     vouchar_id: str,
     vouchar: VoucherUpdate,
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -433,138 +482,109 @@ async def updateVouchar(
         "is_deleted": False,
     }
 
-    accounting_data = vouchar.accounting
-    inventory_data = vouchar.items
+    voucher_filter = {
+        "_id": vouchar_id,
+        "user_id": current_user.user_id,
+        "company_id": current_user.current_company_id
+        or userSettings["current_company_id"],
+    }
 
-    response = await vouchar_repo.update_one(
-        {
-            "_id": vouchar_id,
-            "user_id": current_user.user_id,
-            "company_id": current_user.current_company_id
-            or userSettings["current_company_id"],
-        },
-        {"$set": vouchar_data},
+    # Load the stored rows once and diff them against the submitted ones in memory
+    existing_acc, existing_items = await asyncio.gather(
+        accounting_repo.collection.find({"vouchar_id": vouchar_id}).to_list(None),
+        inventory_repo.collection.find({"vouchar_id": vouchar_id}).to_list(None),
     )
 
-    if response:
-        try:
-            # First, get all existing inventory items for this vouchar
-            existing_acc = await accounting_repo.collection.aggregate(
-                [{"$match": {"vouchar_id": vouchar_id}}]
-            ).to_list(None)
-            existing_acc_ids = {str(acc.get("_id")) for acc in existing_acc}
-
-            # Track the item entry_ids received in the update
-            received_acc_ids = set()
-            for entry in accounting_data:
-                acc_id = getattr(entry, "entry_id", None)
-                received_acc_ids.add(str(acc_id))
-                # Check if entry already exists
-                existing_acc = await accounting_repo.findOne(
-                    {"_id": entry.entry_id, "vouchar_id": vouchar_id}
-                )
-
-                acc_data = {
-                    "ledger": entry.ledger,
-                    "ledger_id": entry.ledger_id,
-                    "amount": entry.amount,
-                    "order_index": entry.order_index,
-                }
-
-                if existing_acc:
-                    await accounting_repo.update_one(
-                        {"_id": entry.entry_id, "vouchar_id": vouchar_id},
-                        {"$set": acc_data},
-                    )
-                else:
-                    acc_data.update(
-                        {
-                            "vouchar_id": vouchar_id,
-                        }
-                    )
-                    await accounting_repo.new(Accounting(**acc_data))
-
-            acc_to_delete = existing_acc_ids - received_acc_ids
-            if acc_to_delete:
-                await accounting_repo.deleteAll(
-                    {
-                        "_id": {"$in": list(acc_to_delete)},
-                        "vouchar_id": vouchar_id,
-                    }
-                )
-
-            # First, get all existing inventory items for this vouchar
-            existing_items = await inventory_repo.collection.aggregate(
-                [{"$match": {"vouchar_id": vouchar_id}}]
-            ).to_list(None)
-
-            existing_item_ids = {str(item.get("_id")) for item in existing_items}
-
-            # Track the item entry_ids received in the update
-            received_entry_ids = set()
-            for item in inventory_data:
-                entry_id = getattr(item, "entry_id", None)
-                received_entry_ids.add(str(entry_id))
-                # Check if item already exists
-                existing_item = await inventory_repo.findOne(
-                    {
-                        "_id": entry_id,
-                        "vouchar_id": vouchar_id,
-                        "item_id": item.item_id,
-                    }
-                )
-                item_data = {
-                    "quantity": item.quantity,
-                    "rate": item.rate,
-                    "amount": item.amount,
-                    "discount_amount": (
-                        item.discount_amount if item.discount_amount else 0.0
-                    ),
-                    "total_amount": item.total_amount,
-                    "godown": item.godown if item.godown else "",
-                    "godown_id": item.godown_id if item.godown_id else "",
-                    "order_index": item.order_index,
-                }
-                if existing_item:
-                    await inventory_repo.update_one(
-                        {
-                            "_id": entry_id,
-                            "vouchar_id": vouchar_id,
-                            "item_id": item.item_id,
-                        },
-                        {"$set": item_data},
-                    )
-                else:
-                    item_data.update(
-                        {
-                            "vouchar_id": vouchar_id,
-                            "item": item.item,
-                            "item_id": item.item_id,
-                        }
+    received_acc = []
+    for entry in vouchar.accounting:
+        acc_data = {
+            "ledger": entry.ledger,
+            "ledger_id": entry.ledger_id,
+            "amount": entry.amount,
+            "order_index": entry.order_index,
+        }
+        received_acc.append(
+            {
+                "entry_id": entry.entry_id,
+                "set": acc_data,
+                "new": accounting_repo.serializer(
+                    AccountingDB(
+                        **Accounting(vouchar_id=vouchar_id, **acc_data).model_dump()
                     )
-                    await inventory_repo.new(InventoryItem(**item_data))
-
-                    # Delete inventory items that are in DB but not in the received update
-            items_to_delete = existing_item_ids - received_entry_ids
-            if items_to_delete:
-                await inventory_repo.deleteAll(
-                    {
-                        "_id": {"$in": list(items_to_delete)},
-                        "vouchar_id": vouchar_id,
-                    }
-                )
+                ),
+            }
+        )
 
-        except Exception as e:
-            print("Error during vouchar update:", e)
-            # Rollback vouchar update if any error occurs
-            raise http_exception.BadRequestException()
+    received_items = []
+    for item in vouchar.items or []:
+        item_data = {
+            "quantity": item.quantity,
+            "rate": item.rate,
+            "amount": item.amount,
+            "discount_amount": (item.discount_amount if item.discount_amount else 0.0),
+            "total_amount": item.total_amount,
+            "godown": item.godown if item.godown else "",
+            "godown_id": item.godown_id if item.godown_id else "",
+            "order_index": item.order_index,
+        }
+        new_item = {
+            **item_data,
+            "vouchar_id": vouchar_id,
+            "item": item.item,
+            "item_id": item.item_id,
+        }
+        received_items.append(
+            {
+                "entry_id": getattr(item, "entry_id", None),
+                "set": item_data,
+                "new": inventory_repo.serializer(
+                    InventoryItemDB(**InventoryItem(**new_item).model_dump())
+                ),
+            }
+        )
 
-        return {"success": True, "message": "Vouchar Updated Successfully"}
+    # Rows inserted here get the voucher's stored fields too (user, company, type)
+    fields = entry_fields({**vouchar_exists, **vouchar_data})
+    accounting_operations, _ = entry_operations(
+        existing_acc, received_acc, fields=fields
+    )
+    inventory_operations, updated_items = entry_operations(
+        existing_items, received_items, key="item_id", fields=fields
+    )
 
-    if not response:
-        raise http_exception.ResourceAlreadyExistsException(
-            detail="Vouchar Already Exists. Please try with different vouchar name."
+    try:
+        await vouchar_repo.update_with_entries(
+            voucher_filter,
+            {"$set": vouchar_data},
+            accounting_operations,
+            inventory_operations,
+            fields,
         )
+    except Exception as e:
+        print("Error during vouchar update:", e)
+        raise http_exception.BadRequestException()
+
+    await stock_balance_repo.apply_voucher_items(
+        user_id=current_user.user_id,
+        company_id=vouchar_exists["company_id"],
+        voucher_type=vouchar_exists["voucher_type"],
+        date=vouchar.date,
+        added=updated_items,
+        removed=existing_items,
+    )
+    await analytics_rollup_repo.refresh_days(
+        current_user.user_id,
+        vouchar_exists["company_id"],
+        [vouchar_exists["date"], vouchar.date],
+    )
+    await balance_snapshot_repo.invalidate(
+        vouchar_exists["company_id"], [vouchar_exists["date"], vouchar.date]
+    )
+    listing_totals.invalidate(vouchar_exists["company_id"])
+
+    await pdf_cache.invalidate_voucher(vouchar_exists["company_id"], vouchar_id)
+
+    return {"success": True, "message": "Vouchar Updated Successfully"}
 
 
 @Vouchar.post(
@@ -573,20 +593,19 @@ async def updateVouchar(
 async def createVoucharWithTAX(
     vouchar: VoucherWithTAXCreate,
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
             detail="User Settings Not Found. Please create user settings first."
         )
 
-    companyExists = await company_repo.findOne(
-        {"_id": current_user.current_company_id, "user_id": current_user.user_id}
-    )
+    companyExists = context.company
 
     if not companyExists:
         raise http_exception.ResourceNotFoundException(
@@ -600,7 +619,6 @@ async def createVoucharWithTAX(
     )
 
     shouldIncreaseCounter = db_invoice_no == vouchar.voucher_number
-    shouldDecreaseCounter = False
 
     if len(vouchar.date) < 10:
         # Assuming the date is in 'YYYY-MM-DD' format, we can pad it with zeros where required.
@@ -645,155 +663,88 @@ async def createVoucharWithTAX(
         "is_deleted": False,
     }
 
-    accounting_data = vouchar.accounting
-    inventory_data = vouchar.items
+    voucher = VoucherDB(**Voucher(**vouchar_data).model_dump())
+    accounting_entries = await build_accounting_entries(
+        vouchar, voucher.vouchar_id, current_user
+    )
 
-    response = await vouchar_repo.new(Voucher(**vouchar_data))
+    # Create all inventory items
+    created_items = []
+    for item in vouchar.items:
+        item_data = {
+            "vouchar_id": voucher.vouchar_id,
+            "item": item.item,
+            "item_id": item.item_id,
+            "quantity": item.quantity,
+            "rate": item.rate,
+            "amount": item.amount,
+            "total_amount": item.total_amount,
+            "discount_amount": (item.discount_amount if item.discount_amount else 0.0),
+            "godown": item.godown if item.godown else "",
+            "godown_id": item.godown_id if item.godown_id else "",
+            "tax_rate": item.tax_rate if item.tax_rate else None,
+            "tax_amount": item.tax_amount if item.tax_amount else None,
+            "hsn_code": item.hsn_code if item.hsn_code else None,
+            "unit": item.unit if item.unit else None,
+            "order_index": item.order_index,
+        }
+        created_items.append(item_data)
+    inventory_entries = [
+        InventoryItemDB(**InventoryItem(**item_data).model_dump())
+        for item_data in created_items
+    ]
 
-    if response:
-        try:
-            # Create all accounting entries
-            for entry in accounting_data:
-                if vouchar.voucher_type in ["Sales", "Purchase"]:
-                    ledger = (
-                        "Sales"
-                        if vouchar.voucher_type.lower() == "sales"
-                        else "Purchases"
-                    )
-                    party_ledger = await ledger_repo.findOne(
-                        {
-                            "company_id": current_user.current_company_id,
-                            "ledger_name": ledger,
-                            "user_id": current_user.user_id,
-                        }
-                    )
+    counter_filter = {
+        "voucher_type": vouchar.voucher_type,
+        "company_id": current_user.current_company_id,
+        "user_id": current_user.user_id,
+    }
 
-                    entry_data = {
-                        "vouchar_id": response.vouchar_id,
-                        "ledger": (
-                            entry.ledger
-                            if entry.ledger == vouchar.party_name
-                            else party_ledger["ledger_name"]
-                        ),
-                        "ledger_id": (
-                            entry.ledger_id
-                            if entry.ledger == vouchar.party_name
-                            else party_ledger["_id"]
-                        ),
-                        "amount": entry.amount,
-                        "order_index": entry.order_index,
-                    }
-                    await accounting_repo.new(Accounting(**entry_data))
-
-                else:
-                    entry_data = {
-                        "vouchar_id": response.vouchar_id,
-                        "ledger": entry.ledger,
-                        "ledger_id": entry.ledger_id,
-                        "amount": entry.amount,
-                        "order_index": entry.order_index,
-                    }
-                    await accounting_repo.new(Accounting(**entry_data))
-
-            # Create all inventory items
-            for item in inventory_data:
-                item_data = {
-                    "vouchar_id": response.vouchar_id,
-                    "item": item.item,
-                    "item_id": item.item_id,
-                    "quantity": item.quantity,
-                    "rate": item.rate,
-                    "amount": item.amount,
-                    "total_amount": item.total_amount,
-                    "discount_amount": (
-                        item.discount_amount if item.discount_amount else 0.0
-                    ),
-                    "godown": item.godown if item.godown else "",
-                    "godown_id": item.godown_id if item.godown_id else "",
-                    "tax_rate": item.tax_rate if item.tax_rate else None,
-                    "tax_amount": item.tax_amount if item.tax_amount else None,
-                    "hsn_code": item.hsn_code if item.hsn_code else None,
-                    "unit": item.unit if item.unit else None,
-                    "order_index": item.order_index,
-                }
-                await inventory_repo.new(InventoryItem(**item_data))
-
-            if shouldIncreaseCounter:
-                await vouchar_counter_repo.update_one(
-                    {
-                        "voucher_type": vouchar.voucher_type,
-                        "company_id": current_user.current_company_id,
-                        "user_id": current_user.user_id,
-                    },
-                    {"$inc": {"current_number": 1}},
-                )
-                
-                customer_ledger = await ledger_repo.findOne(
-                    {
-                        "company_id": current_user.current_company_id,
-                        "ledger_name": vouchar.party_name,
-                        "user_id": current_user.user_id,
-                    }
-                )
-
-                if vouchar.voucher_type in ["Sales", "Purchase"]:
-                    mail.send(
-                        "Vyapar Drishti - Invoice Created",
-                        customer_ledger["email"],
-                        template.InvoiceCreated(
-                            invoice_number=vouchar.voucher_number,
-                            invoice_date=vouchar.date,
-                            customer_name=vouchar.party_name,
-                            total_amount=vouchar.total_amount,
-                            due_date=vouchar.due_date,
-                            payment_status=(
-                                "Paid"
-                                if vouchar.paid_amount >= vouchar.grand_total
-                                else "Unpaid"
-                            ),
-                        ),
-                    )
-                elif vouchar.voucher_type in ["Payment", "Receipt"]:
-                    mail.send(
-                        "Vyapar Drishti - Transaction Created",
-                        customer_ledger["email"],
-                        template.TransactionCreated(
-                            user_name=companyExists["company_name"],
-                            transaction_type=vouchar.voucher_type,
-                            customer_name=customer_ledger["ledger_name"],
-                            currency_symbol='INR',
-                            reference_note=vouchar.narration,
-                            transaction_date=vouchar.date,
-                            amount=vouchar.grand_total,
-                            support_link=f"{ENV_PROJECT.FRONTEND_DOMAIN}/contact",
-                        ),
-                    )
-                shouldDecreaseCounter = True
+    try:
+        await vouchar_repo.create_with_entries(
+            voucher,
+            accounting_entries,
+            inventory_entries,
+            counter_filter=counter_filter if shouldIncreaseCounter else None,
+        )
+    except DuplicateKeyError:
+        raise http_exception.ResourceAlreadyExistsException(
+            detail="Vouchar Already Exists. Please try with different vouchar name."
+        )
+    except Exception as e:
+        # Nothing was written, the transaction (or its fallback cleanup) undid it all
+        print("Error during vouchar creation:", e)
+        raise http_exception.BadRequestException()
 
+    if shouldIncreaseCounter:
+        customer_ledger = await ledger_repo.findOne(
+            {
+                "company_id": current_user.current_company_id,
+                "ledger_name": vouchar.party_name,
+                "user_id": current_user.user_id,
+            }
+        )
+        try:
+            await send_voucher_created_mail(vouchar, customer_ledger, companyExists)
         except Exception as e:
-            # Rollback vouchar creation if any error occurs
-            print("Error during vouchar creation:", e)
-            if shouldDecreaseCounter:
-                await vouchar_counter_repo.update_one(
-                    {
-                        "voucher_type": vouchar.voucher_type,
-                        "company_id": current_user.current_company_id,
-                        "user_id": current_user.user_id,
-                    },
-                    {"$inc": {"current_number": -1}},
-                )
-            await accounting_repo.deleteAll({"vouchar_id": response.vouchar_id})
-            await inventory_repo.deleteAll({"vouchar_id": response.vouchar_id})
-            await vouchar_repo.deleteById(response.vouchar_id)
-
-            raise http_exception.BadRequestException()
+            print("Error sending vouchar mail:", e)
 
-        return {"success": True, "message": "Vouchar Created Successfully"}
+    await stock_balance_repo.apply_voucher_items(
+        user_id=current_user.user_id,
+        company_id=current_user.current_company_id,
+        voucher_type=vouchar.voucher_type,
+        date=vouchar.date,
+        added=created_items,
+    )
+    await analytics_rollup_repo.refresh_days(
+        current_user.user_id, current_user.current_company_id, [vouchar.date]
+    )
+    await balance_snapshot_repo.invalidate(
+        current_user.current_company_id, [vouchar.date]
+    )
+    listing_totals.invalidate(current_user.current_company_id)
 
-    if not response:
-        raise http_exception.ResourceAlreadyExistsException(
-            detail="Vouchar Already Exists. Please try with different vouchar name."
-        )
+    return {"success": True, "message": "Vouchar Created Successfully"}
 
 
 @Vouchar.put(
@@ -805,32 +756,26 @@ async def updateVoucharWithTAX(
     vouchar_id: str,
     vouchar: TAXVoucherUpdate,
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
             detail="User Settings Not Found. Please create user settings first."
         )
 
-    companyExists = await company_repo.findOne(
-        {"_id": current_user.current_company_id, "user_id": current_user.user_id}
-    )
+    companyExists = context.company
 
     if not companyExists:
         raise http_exception.ResourceNotFoundException(
             detail="Company not found. Please check your company ID."
         )
 
-    companySettings = await company_settings_repo.findOne(
-        {
-            "company_id": current_user.current_company_id,
-            "user_id": current_user.user_id,
-        }
-    )
+    companySettings = context.company_settings
 
     if not companySettings:
         raise http_exception.ResourceNotFoundException(
@@ -885,154 +830,112 @@ async def updateVoucharWithTAX(
         "is_deleted": False,
     }
 
-    accounting_data = vouchar.accounting
-    inventory_data = vouchar.items
+    voucher_filter = {
+        "_id": vouchar_id,
+        "user_id": current_user.user_id,
+        "company_id": current_user.current_company_id,
+    }
 
-    response = await vouchar_repo.update_one(
-        {
-            "_id": vouchar_id,
-            "user_id": current_user.user_id,
-            "company_id": current_user.current_company_id,
-        },
-        {"$set": vouchar_data},
+    # Load the stored rows once and diff them against the submitted ones in memory
+    existing_acc, existing_items = await asyncio.gather(
+        accounting_repo.collection.find({"vouchar_id": vouchar_id}).to_list(None),
+        inventory_repo.collection.find({"vouchar_id": vouchar_id}).to_list(None),
     )
 
-    if response:
-        try:
-            # First, get all existing inventory items for this vouchar
-            existing_entry = await accounting_repo.collection.aggregate(
-                [{"$match": {"vouchar_id": vouchar_id}}]
-            ).to_list(None)
-
-            existing_entry_ids = {str(entry.get("_id")) for entry in existing_entry}
-
-            # Track the entry_ids received in the update
-            received_entry_ids = set()
-            for entry in accounting_data:
-                entry_id = getattr(entry, "entry_id", None)
-                received_entry_ids.add(str(entry_id))
-                # Check if item already exists
-                existing_acc = await accounting_repo.findOne(
-                    {
-                        "_id": entry_id,
-                        "vouchar_id": vouchar_id,
-                        "ledger_id": entry.ledger_id,
-                    }
-                )
-
-                entry_data = {
-                    "ledger": entry.ledger,
-                    "ledger_id": entry.ledger_id,
-                    "amount": entry.amount,
-                    "order_index": entry.order_index,
-                }
-
-                if existing_acc:
-                    await accounting_repo.update_one(
-                        {
-                            "_id": entry_id,
-                            "vouchar_id": vouchar_id,
-                            "ledger_id": entry.ledger_id,
-                        },
-                        {"$set": entry_data},
-                    )
-                else:
-                    entry_data.update(
-                        {
-                            "vouchar_id": vouchar_id,
-                        }
-                    )
-                    await accounting_repo.new(Accounting(**entry_data))
-
-                    # Delete accounting entries that are in DB but not in the received update
-            entries_to_delete = existing_entry_ids - received_entry_ids
-            if entries_to_delete:
-                await accounting_repo.deleteAll(
-                    {
-                        "vouchar_id": vouchar_id,
-                        "_id": {"$in": list(entries_to_delete)},
-                    }
-                )
-
-            # First, get all existing inventory items for this vouchar
-            existing_items = await inventory_repo.collection.aggregate(
-                [{"$match": {"vouchar_id": vouchar_id}}]
-            ).to_list(None)
-
-            existing_item_ids = {str(item.get("_id")) for item in existing_items}
-
-            # Track the item entry_ids received in the update
-            received_entry_ids = set()
-            for item in inventory_data:
-                entry_id = getattr(item, "entry_id", None)
-                received_entry_ids.add(str(entry_id))
-                # Check if item already exists
-                existing_item = await inventory_repo.findOne(
-                    {
-                        "_id": entry_id,
-                        "vouchar_id": vouchar_id,
-                        "item_id": item.item_id,
-                    }
-                )
-
-                item_data = {
-                    "quantity": item.quantity,
-                    "rate": item.rate,
-                    "amount": item.amount,
-                    "discount_amount": (
-                        item.discount_amount if item.discount_amount else 0.0
-                    ),
-                    "tax_rate": item.tax_rate if item.tax_rate else None,
-                    "tax_amount": item.tax_amount if item.tax_amount else None,
-                    "total_amount": item.total_amount,
-                    "godown": item.godown if item.godown else "",
-                    "godown_id": item.godown_id if item.godown_id else "",
-                    "order_index": item.order_index,
-                }
-
-                if existing_item:
-                    await inventory_repo.update_one(
-                        {
-                            "_id": entry_id,
-                            "vouchar_id": vouchar_id,
-                            "item_id": item.item_id,
-                        },
-                        {"$set": item_data},
-                    )
-
-                else:
-                    item_data.update(
-                        {
-                            "vouchar_id": vouchar_id,
-                            "item": item.item,
-                            "item_id": item.item_id,
-                            "hsn_code": item.hsn_code,
-                            "unit": item.unit,
-                        }
+    received_acc = []
+    for entry in vouchar.accounting:
+        acc_data = {
+            "ledger": entry.ledger,
+            "ledger_id": entry.ledger_id,
+            "amount": entry.amount,
+            "order_index": entry.order_index,
+        }
+        received_acc.append(
+            {
+                "entry_id": entry.entry_id,
+                "set": acc_data,
+                "new": accounting_repo.serializer(
+                    AccountingDB(
+                        **Accounting(vouchar_id=vouchar_id, **acc_data).model_dump()
                     )
+                ),
+            }
+        )
 
-                    await inventory_repo.new(InventoryItem(**item_data))
+    received_items = []
+    for item in vouchar.items or []:
+        item_data = {
+            "quantity": item.quantity,
+            "rate": item.rate,
+            "amount": item.amount,
+            "discount_amount": (item.discount_amount if item.discount_amount else 0.0),
+            "tax_rate": item.tax_rate if item.tax_rate else None,
+            "tax_amount": item.tax_amount if item.tax_amount else None,
+            "total_amount": item.total_amount,
+            "godown": item.godown if item.godown else "",
+            "godown_id": item.godown_id if item.godown_id else "",
+            "order_index": item.order_index,
+        }
+        new_item = {
+            **item_data,
+            "vouchar_id": vouchar_id,
+            "item": item.item,
+            "item_id": item.item_id,
+            "hsn_code": item.hsn_code,
+            "unit": item.unit,
+        }
+        received_items.append(
+            {
+                "entry_id": getattr(item, "entry_id", None),
+                "set": item_data,
+                "new": inventory_repo.serializer(
+                    InventoryItemDB(**InventoryItem(**new_item).model_dump())
+                ),
+            }
+        )
 
-                    # Delete inventory items that are in DB but not in the received update
-            items_to_delete = existing_item_ids - received_entry_ids
-            if items_to_delete:
-                await inventory_repo.deleteAll(
-                    {
-                        "_id": {"$in": list(items_to_delete)},
-                        "vouchar_id": vouchar_id,
-                    }
-                )
+    # Rows inserted here get the voucher's stored fields too (user, company, type)
+    fields = entry_fields({**vouchar_exists, **vouchar_data})
+    accounting_operations, _ = entry_operations(
+        existing_acc, received_acc, key="ledger_id", fields=fields
+    )
+    inventory_operations, updated_items = entry_operations(
+        existing_items, received_items, key="item_id", fields=fields
+    )
 
-        except Exception as e:
-            print("Error during vouchar update:", str(e))
-            raise http_exception.BadRequestException()
+    try:
+        await vouchar_repo.update_with_entries(
+            voucher_filter,
+            {"$set": vouchar_data},
+            accounting_operations,
+            inventory_operations,
+            fields,
+        )
+    except Exception as e:
+        print("Error during vouchar update:", e)
+        raise http_exception.BadRequestException()
+
+    await stock_balance_repo.apply_voucher_items(
+        user_id=current_user.user_id,
+        company_id=vouchar_exists["company_id"],
+        voucher_type=vouchar_exists["voucher_type"],
+        date=vouchar.date,
+        added=updated_items,
+        removed=existing_items,
+    )
+    await analytics_rollup_repo.refresh_days(
+        current_user.user_id,
+        vouchar_exists["company_id"],
+        [vouchar_exists["date"], vouchar.date],
+    )
+    await balance_snapshot_repo.invalidate(
+        vouchar_exists["company_id"], [vouchar_exists["date"], vouchar.date]
+    )
+    listing_totals.invalidate(vouchar_exists["company_id"])
 
-        return {"success": True, "message": "Vouchar Updated Successfully"}
+    await pdf_cache.invalidate_voucher(vouchar_exists["company_id"], vouchar_id)
 
-    if not response:
-        raise http_exception.ResourceAlreadyExistsException(
-            detail="Vouchar Already Exists. Please try with different vouchar name."
-        )
+    return {"success": True, "message": "Vouchar Updated Successfully"}
 
 
 @Vouchar.get(
@@ -1040,6 +943,7 @@ async def updateVoucharWithTAX(
 )
 async def view_all_vouchar(
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
     company_id: str = Query(...),
     search: str = None,
     type: str = None,
@@ -1049,17 +953,19 @@ async def view_all_vouchar(
     limit: int = Query(10, le=sys.maxsize),
     sortField: str = "date",
     sortOrder: SortingOrder = SortingOrder.DESC,
+    cursor: bool = Query(False, description="Keyset pagination, see `after`"),
+    after: str = Query(None, description="`meta.next` of the previous page"),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
             detail="User Settings Not Found. Please create user settings first."
         )
 
-    page = Page(page=page_no, limit=limit)
+    page = Page(page=page_no, limit=limit, cursor=cursor, after=after)
     sort = Sort(sort_field=sortField, sort_order=sortOrder)
     page_request = PageRequest(paging=page, sorting=sort)
 
@@ -1086,24 +992,20 @@ async def view_all_vouchar(
 async def getVouchar(
     vouchar_id: str,
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
     company_id: str = Query(""),
 ):
     if current_user.user_type not in {"user", "admin"}:
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
             detail="User Settings Not Found. Please contact support."
         )
 
-    companySettings = await company_settings_repo.findOne(
-        {
-            "company_id": current_user.current_company_id,
-            "user_id": current_user.user_id,
-        }
-    )
+    companySettings = context.company_settings
 
     if not companySettings:
         raise http_exception.ResourceNotFoundException(
@@ -1186,6 +1088,7 @@ async def getVouchar(
 )
 async def getTimeline(
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
     company_id: str = Query(""),
     search: str = "",
     category: str = "",
@@ -1199,7 +1102,7 @@ async def getTimeline(
     if current_user.user_type not in {"user", "admin"}:
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -1228,6 +1131,60 @@ async def getTimeline(
     }
 
 
+@Vouchar.get("/get/timeline/export", status_code=status.HTTP_200_OK)
+async def exportTimeline(
+    current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
+    search: str = "",
+    category: str = "",
+    start_date: str = "",
+    end_date: str = "",
+):
+    if current_user.user_type not in {"user", "admin"}:
+        raise http_exception.CredentialsInvalidException()
+
+    if context.user_settings is None:
+        raise http_exception.ResourceNotFoundException(
+            detail="User Settings Not Found. Please contact support."
+        )
+
+    timeline = await StockTimeline(
+        current_user.user_id,
+        current_user.current_company_id,
+        start_date[:10],
+        end_date[:10],
+    ).load()
+    items = stock_item_repo.find(
+        **stock_item_repo.timeline_items(
+            current_user.current_company_id,
+            current_user.user_id,
+            search=search,
+            category=category,
+        ),
+        batch_size=500,
+    )
+
+    async def lines():
+        # Every row is written out as soon as its item is read
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        async for row in timeline.rows(items):
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    period = f"{start_date[:10] or 'start'}-{end_date[:10] or 'today'}"
+    filename = f"stock-timeline-{period}.csv"
+    return StreamingResponse(
+        lines(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @Vouchar.get(
     "/get/hsn/summary",
     response_class=ORJSONResponse,
@@ -1235,6 +1192,7 @@ async def getTimeline(
 )
 async def getHsnSummary(
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
     company_id: str = Query(""),
     search: str = "",
     category: str = "",
@@ -1248,7 +1206,7 @@ async def getHsnSummary(
     if current_user.user_type not in ["user", "admin"]:
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -1284,6 +1242,7 @@ async def getHsnSummary(
 )
 async def getSummaryStats(
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
     company_id: str = Query(""),
     start_date: str = "",
     end_date: str = "",
@@ -1291,7 +1250,7 @@ async def getSummaryStats(
     if current_user.user_type not in ["user", "admin"]:
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -1319,6 +1278,7 @@ async def getSummaryStats(
 )
 async def getPartySummary(
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
     company_id: str = Query(""),
     search: str = "",
     start_date: str = "",
@@ -1331,7 +1291,7 @@ async def getPartySummary(
     if current_user.user_type not in ["user", "admin"]:
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -1366,6 +1326,7 @@ async def getPartySummary(
 )
 async def getInvoiceSummary(
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
     company_id: str = Query(""),
     search: str = "",
     start_date: str = "",
@@ -1378,7 +1339,7 @@ async def getInvoiceSummary(
     if current_user.user_type not in ["user", "admin"]:
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -1412,14 +1373,16 @@ async def getInvoiceSummary(
     status_code=status.HTTP_200_OK,
 )
 async def print_invoice(
+    request: Request,
     vouchar_id: str = Query(...),
     company_id: str = Query(...),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type not in {"user", "admin"}:
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -1539,28 +1502,9 @@ async def print_invoice(
         "company.motto": "LIFE'S A JOURNEY, KEEP SMILING",
     }
 
-    # Load HTML template (assuming you have it in a file)
-    async with aiofiles.open("app/utils/templates/template.html", "r") as f:
-        template_str = await f.read()
-
-    template = Template(template_str)
-    rendered_html = template.render(**template_vars)
-
-    if browser_module.browser is None:
-        raise RuntimeError("Browser is not ready yet")
-
-    page = await browser_module.browser.new_page()
-    await page.set_content(rendered_html, wait_until="domcontentloaded")
-    pdf_bytes = await page.pdf(
-        format="A4",
-        print_background=True,
-        margin={"top": "1cm", "bottom": "1cm", "left": "1cm", "right": "1cm"},
-    )
-
-    return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
-        headers={"Content-Disposition": "inline; filename=invoice-vyapar-drishti.pdf"},
+    template = get_template("template.html", invoice.get("company_id"))
+    return await render_pdf_response(
+        request, invoice, template, template_vars, "invoice-vyapar-drishti.pdf"
     )
 
 
@@ -1570,14 +1514,16 @@ async def print_invoice(
     status_code=status.HTTP_200_OK,
 )
 async def print_invoice_tax(
+    request: Request,
     vouchar_id: str = Query(...),
     company_id: str = Query(None),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type not in {"user", "admin"}:
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -1751,54 +1697,15 @@ async def print_invoice_tax(
     }
 
     if invoice.get("voucher_type", "") == "Sales":
-        async with aiofiles.open("app/utils/templates/tax_sale_template.html", "r") as f:
-            template_str = await f.read()
-
-        template = Template(template_str)
-        rendered_html = template.render(**template_vars)
-
-        page = await browser_module.browser.new_page()
-        await page.set_content(rendered_html, wait_until="domcontentloaded")
-        pdf_bytes = await page.pdf(
-            format="A4",
-            print_background=True,
-            margin={"top": "1cm", "bottom": "1cm", "left": "1cm", "right": "1cm"},
-            # display_header_footer=True,
-            # header_template="<span style='font-size:10px'>Header</span>",
-            # footer_template="<span style='font-size:10px'>Page <span class='pageNumber'></span> of <span class='totalPages'></span></span>",
-        )
-
-        return Response(
-            content=pdf_bytes,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": "inline; filename=sale-invoice-vyapar-drishti.pdf"
-            },
+        template = get_template("tax_sale_template.html", invoice.get("company_id"))
+        return await render_pdf_response(
+            request, invoice, template, template_vars, "sale-invoice-vyapar-drishti.pdf"
         )
 
     else:
-        async with aiofiles.open(
-            "app/utils/templates/tax_purchase_template.html", "r"
-        ) as f:
-            template_str = await f.read()
-
-        template = Template(template_str)
-        rendered_html = template.render(**template_vars)
-
-        page = await browser_module.browser.new_page()
-        await page.set_content(rendered_html, wait_until="domcontentloaded")
-        pdf_bytes = await page.pdf(
-            format="A4",
-            print_background=True,
-            margin={"top": "1cm", "bottom": "1cm", "left": "1cm", "right": "1cm"},
-        )
-
-        return Response(
-            content=pdf_bytes,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": "inline; filename=purchase-invoice-vyapar-drishti.pdf"
-            },
+        template = get_template("tax_purchase_template.html", invoice.get("company_id"))
+        return await render_pdf_response(
+            request, invoice, template, template_vars, "purchase-invoice-vyapar-drishti.pdf"
         )
 
 
@@ -1808,14 +1715,16 @@ async def print_invoice_tax(
     status_code=status.HTTP_200_OK,
 )
 async def print_receipt(
+    request: Request,
     vouchar_id: str = Query(...),
     company_id: str = Query(...),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type not in {"user", "admin"}:
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -1922,24 +1831,9 @@ async def print_receipt(
         },
     }
 
-    # Load HTML template (assuming you have it in a file)
-    async with aiofiles.open("app/utils/templates/reciept.html", "r") as f:
-        template_str = await f.read()
-
-    template = Template(template_str)
-    rendered_html = template.render(**template_vars)
-    page = await browser_module.browser.new_page()
-    await page.set_content(rendered_html, wait_until="domcontentloaded")
-    pdf_bytes = await page.pdf(
-        format="A4",
-        print_background=True,
-        margin={"top": "1cm", "bottom": "1cm", "left": "1cm", "right": "1cm"},
-    )
-
-    return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
-        headers={"Content-Disposition": "inline; filename=receipt.pdf"},
+    template = get_template("reciept.html", invoice.get("company_id"))
+    return await render_pdf_response(
+        request, invoice, template, template_vars, "receipt.pdf"
     )
 
 
@@ -1949,14 +1843,16 @@ async def print_receipt(
     status_code=status.HTTP_200_OK,
 )
 async def print_payment(
+    request: Request,
     vouchar_id: str = Query(...),
     company_id: str = Query(...),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type not in {"user", "admin"}:
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -2084,25 +1980,9 @@ async def print_payment(
         },
     }
 
-    # Load HTML template (assuming you have it in a file)
-    async with aiofiles.open("app/utils/templates/payment.html", "r") as f:
-        template_str = await f.read()
-
-    template = Template(template_str)
-    rendered_html = template.render(**template_vars)
-
-    page = await browser_module.browser.new_page()
-    await page.set_content(rendered_html, wait_until="domcontentloaded")
-    pdf_bytes = await page.pdf(
-        format="A4",
-        print_background=True,
-        margin={"top": "1cm", "bottom": "1cm", "left": "1cm", "right": "1cm"},
-    )
-
-    return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
-        headers={"Content-Disposition": "inline; filename=payment.pdf"},
+    template = get_template("payment.html", invoice.get("company_id"))
+    return await render_pdf_response(
+        request, invoice, template, template_vars, "payment.pdf"
     )
 
 
@@ -2115,11 +1995,12 @@ async def get_vouchar(
     vouchar_id: str,
     company_id: str = Query(...),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -2223,11 +2104,12 @@ async def delete_vouchar(
     vouchar_id: str,
     company_id: str = Query(None),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -2273,12 +2155,23 @@ async def delete_vouchar(
             {"$inc": {"current_number": -1}},
         )
 
+    deleted_items = await inventory_repo.collection.find(
+        {"vouchar_id": vouchar_id}
+    ).to_list(None)
+
     # Delete all accounting entries associated with the vouchers
     await accounting_repo.deleteAll({"vouchar_id": vouchar_id})
 
     # Delete all the inventory entries associated with the vouchers
     await inventory_repo.deleteAll({"vouchar_id": vouchar_id})
 
+    await stock_balance_repo.apply_voucher_items(
+        user_id=current_user.user_id,
+        company_id=voucharExists["company_id"],
+        voucher_type=voucharExists["voucher_type"],
+        removed=deleted_items,
+    )
+
     await vouchar_repo.deleteOne(
         {
             "_id": vouchar_id,
@@ -2288,6 +2181,16 @@ async def delete_vouchar(
         }
     )
 
+    await analytics_rollup_repo.refresh_days(
+        current_user.user_id, voucharExists["company_id"], [voucharExists["date"]]
+    )
+    await balance_snapshot_repo.invalidate(
+        voucharExists["company_id"], [voucharExists["date"]]
+    )
+    listing_totals.invalidate(voucharExists["company_id"])
+
+    await pdf_cache.invalidate_voucher(voucharExists["company_id"], vouchar_id)
+
     return {"success": True, "message": "Invoice Deleted Successfully..."}
 
 
@@ -2300,11 +2203,12 @@ async def delete_tax_vouchar(
     vouchar_id: str,
     company_id: str = Query(None),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -2325,12 +2229,23 @@ async def delete_tax_vouchar(
             detail="No Invoice Found. Please delete appropriate invoice."
         )
 
+    deleted_items = await inventory_repo.collection.find(
+        {"vouchar_id": vouchar_id}
+    ).to_list(None)
+
     # Delete all accounting entries associated with the vouchers
     await accounting_repo.deleteAll({"vouchar_id": vouchar_id})
 
     # Delete all the inventory entries associated with the vouchers
     await inventory_repo.deleteAll({"vouchar_id": vouchar_id})
 
+    await stock_balance_repo.apply_voucher_items(
+        user_id=current_user.user_id,
+        company_id=voucharExists["company_id"],
+        voucher_type=voucharExists["voucher_type"],
+        removed=deleted_items,
+    )
+
     await vouchar_repo.deleteOne(
         {
             "_id": vouchar_id,
@@ -2340,6 +2255,16 @@ async def delete_tax_vouchar(
         }
     )
 
+    await analytics_rollup_repo.refresh_days(
+        current_user.user_id, voucharExists["company_id"], [voucharExists["date"]]
+    )
+    await balance_snapshot_repo.invalidate(
+        voucharExists["company_id"], [voucharExists["date"]]
+    )
+    listing_totals.invalidate(voucharExists["company_id"])
+
+    await pdf_cache.invalidate_voucher(voucharExists["company_id"], vouchar_id)
+
     return {"success": True, "message": "Invoice Deleted Successfully..."}
 
 
@@ -2348,11 +2273,12 @@ async def get_analytics(
     company_id: str = Query(None),
     financial_year: int = Query(None),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -2380,11 +2306,12 @@ async def get_analytics_monthly(
     company_id: str = Query(None),
     financial_year: int = Query(None),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -2413,11 +2340,12 @@ async def get_analytics_daily(
     financial_year: int = Query(None),
     financial_month: int = Query(None),
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 from app.oauth2 import get_current_user
+from app.request_context import RequestContext, get_request_context
 from app.schema.token import TokenData
 import app.http_exception as http_exception
 from app.database.models.VoucharCounter import VoucherCounter
@@ -102,11 +103,12 @@ async def get_counter(
     voucher_type: str,
     company_id: str = "",
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -150,11 +152,12 @@ async def update_counter(
     request: CounterUpdateRequest,
     company_id: str,
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
@@ -192,11 +195,12 @@ async def reset_counter(
     company_id: str,
     voucher_type: str,
     current_user: TokenData = Depends(get_current_user),
+    context: RequestContext = Depends(get_request_context),
 ):
     if current_user.user_type != "user" and current_user.user_type != "admin":
         raise http_exception.CredentialsInvalidException()
 
-    userSettings = await user_settings_repo.findOne({"user_id": current_user.user_id})
+    userSettings = context.user_settings
 
     if userSettings is None:
         raise http_exception.ResourceNotFoundException(
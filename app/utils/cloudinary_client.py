@@ -1,12 +1,53 @@
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
 from cloudinary.uploader import upload
 from cloudinary.utils import cloudinary_url
 from cloudinary import config as cloudinary_config
 from fastapi import UploadFile, HTTPException
-from typing import Dict
+from loguru import logger
+from PIL import Image, ImageOps
+
 from app.Config import ENV_PROJECT
+from app.database.models.UploadedFile import UploadedFile
+from app.database.repositories.uploadedFileRepo import uploaded_file_repo
 
+# Formats worth re-encoding; GIFs may be animated and SVGs are not rasters
+RESIZABLE_TYPES = ["image/jpeg", "image/jpg", "image/png", "image/webp"]
+
+
+def prepare_image(content: bytes, max_dimension: int) -> Tuple[bytes, str]:
+    """
+    Downscale to `max_dimension` on the longest side and re-encode (JPEG, or PNG
+    when the image has transparency). Returns the original bytes when that does
+    not make the file smaller.
+    """
+    with Image.open(io.BytesIO(content)) as image:
+        original_format = (image.format or "jpeg").lower()
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension))
+
+        output = io.BytesIO()
+        if image.mode in ("RGBA", "LA", "P"):
+            image.save(output, format="PNG", optimize=True)
+            encoded_format = "png"
+        else:
+            image.convert("RGB").save(output, format="JPEG", quality=85, optimize=True)
+            encoded_format = "jpg"
+
+    if output.tell() >= len(content):
+        return content, original_format
+    return output.getvalue(), encoded_format
+
+
+class CloudinaryBackend:
+    name = "cloudinary"
 
-class CloudinaryClient:
     def __init__(self, cloud_name: str, api_key: str, api_secret: str):
         # Set Cloudinary global config
         cloudinary_config(
@@ -15,32 +56,135 @@ class CloudinaryClient:
             api_secret=api_secret,
         )
 
+    def store(
+        self, content: bytes, filename: str, public_id: str, format: str = None
+    ) -> UploadedFile:
+        # Cloudinary detects the format from the content itself
+        result = upload(
+            content,
+            resource_type="auto",
+            filename=filename,
+            folder="Vyapar_Drishti",
+            public_id=public_id,
+            overwrite=False,
+        )
+
+        # Generate secure URL
+        url, _ = cloudinary_url(
+            result["public_id"], secure=True, format=result.get("format", "jpg")
+        )
+        return UploadedFile(
+            backend=self.name,
+            url=url,
+            public_id=result["public_id"],
+            format=result.get("format"),
+            width=result.get("width"),
+            height=result.get("height"),
+            bytes=result.get("bytes"),
+        )
+
+
+class LocalBackend:
+    """Stores files on local disk; a stand-in for Cloudinary in tests and offline dev."""
+
+    name = "local"
+
+    def __init__(self, directory: str, base_url: Optional[str] = None):
+        self.directory = Path(directory)
+        self.base_url = base_url or self.directory.resolve().as_uri()
+
+    def store(
+        self, content: bytes, filename: str, public_id: str, format: str = None
+    ) -> UploadedFile:
+        """`format` is that of `content` when known (re-encoded images)."""
+        if format:
+            extension = f".{format.lower()}"
+        else:
+            extension = os.path.splitext(filename or "")[1].lower()
+        name = f"{public_id}{extension}"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / name).write_bytes(content)
+        return UploadedFile(
+            backend=self.name,
+            url=f"{self.base_url.rstrip('/')}/{name}",
+            public_id=public_id,
+            format=extension.lstrip(".") or None,
+            bytes=len(content),
+        )
+
+
+class CloudinaryClient:
+    """
+    UPLOADS
+    -------
+    upload_file keeps the event loop free: image preprocessing and the network
+    upload run in threads, at most `concurrency` at a time. Files are keyed by
+    the sha256 of their content, so a logo or QR code already uploaded is not
+    sent again.
+    """
+
+    def __init__(self, backend, concurrency: int, max_dimension: int):
+        self.backend = backend
+        self.max_dimension = max_dimension
+        self._semaphore = asyncio.Semaphore(concurrency)
+
     async def upload_file(self, file: UploadFile) -> Dict:
         try:
-            # Upload to Cloudinary
-            result = upload(file.file, resource_type="auto", filename=file.filename, folder='Vyapar_Drishti')
+            content = await file.read()
+            digest = hashlib.sha256(content).hexdigest()
+            key = f"{self.backend.name}:{digest}"
 
-            # Generate secure URL
-            url, _ = cloudinary_url(
-                result["public_id"], secure=True, format=result.get("format", "jpg")
-            )
+            uploaded = await uploaded_file_repo.lookup(key)
+            if uploaded is None:
+                async with self._semaphore:
+                    encoded_format = None
+                    if file.content_type in RESIZABLE_TYPES:
+                        try:
+                            content, encoded_format = await asyncio.to_thread(
+                                prepare_image, content, self.max_dimension
+                            )
+                        except Exception as e:
+                            logger.warning(f"Image preprocessing skipped: {e}")
+                    stored = await asyncio.to_thread(
+                        self.backend.store,
+                        content,
+                        file.filename,
+                        digest,
+                        encoded_format,
+                    )
+                await uploaded_file_repo.remember(key, stored)
+                uploaded = stored.model_dump()
 
             return {
-                "url": url,
+                "url": uploaded["url"],
                 "filename": file.filename,
-                "public_id": result["public_id"],
-                "format": result["format"],
-                "width": result.get("width"),
-                "height": result.get("height"),
+                "public_id": uploaded["public_id"],
+                "format": uploaded["format"],
+                "width": uploaded.get("width"),
+                "height": uploaded.get("height"),
             }
 
         except Exception as e:
             raise HTTPException(
-                status_code=500, detail=f"Cloudinary upload failed: {str(e)}"
+                status_code=500,
+                detail=f"Upload to {self.backend.name} failed: {str(e)}",
             )
 
+
+if ENV_PROJECT.UPLOAD_BACKEND == "local":
+    upload_backend = LocalBackend(
+        ENV_PROJECT.UPLOAD_LOCAL_DIR
+        or os.path.join(tempfile.gettempdir(), "vyapar-uploads")
+    )
+else:
+    upload_backend = CloudinaryBackend(
+        cloud_name=ENV_PROJECT.CLOUDINARY_CLOUD_NAME,
+        api_key=ENV_PROJECT.CLOUDINARY_API_KEY,
+        api_secret=ENV_PROJECT.CLOUDINARY_API_SECRET,
+    )
+
 cloudinary_client = CloudinaryClient(
-    cloud_name=ENV_PROJECT.CLOUDINARY_CLOUD_NAME,
-    api_key=ENV_PROJECT.CLOUDINARY_API_KEY,
-    api_secret=ENV_PROJECT.CLOUDINARY_API_SECRET,
+    upload_backend,
+    concurrency=ENV_PROJECT.UPLOAD_CONCURRENCY,
+    max_dimension=ENV_PROJECT.UPLOAD_MAX_IMAGE_DIMENSION,
 )
@@ -1,10 +1,80 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 from passlib.hash import bcrypt
 
+from app.Config import ENV_PROJECT
+
+# bcrypt spends its time in C with the GIL released, so threads hash in
+# parallel; the pool size caps how many hashes run at once per process.
+hasher = bcrypt.using(rounds=ENV_PROJECT.BCRYPT_ROUNDS)
+executor = ThreadPoolExecutor(
+    max_workers=ENV_PROJECT.HASH_WORKERS, thread_name_prefix="bcrypt"
+)
+
 
 def hash_password(password: str):
-    # bcrypt.genconfig()
-    return bcrypt.hash(password)
+    return hasher.hash(password)
 
 
 def verify_hash(password, hash):
-    return bcrypt.verify(password, hash)
+    return hasher.verify(password, hash)
+
+
+def needs_rehash(hash) -> bool:
+    """True when `hash` was made with a different cost than BCRYPT_ROUNDS."""
+    return hasher.needs_update(hash)
+
+
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, hash_password, password)
+
+
+async def verify_hash_async(password, hash) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, verify_hash, password, hash)
+
+
+if __name__ == "__main__":
+    # Login throughput benchmark: python -m app.utils.hashing
+    import time
+
+    stored = hash_password("benchmark-password")
+    logins = 4 * ENV_PROJECT.HASH_WORKERS
+
+    async def ticker(stop: asyncio.Event, gaps: list):
+        """Measures how long the event loop stays blocked between 10 ms ticks."""
+        last = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            gaps.append(now - last - 0.01)
+            last = now
+
+    async def run(label, verify):
+        stop, gaps = asyncio.Event(), []
+        tick = asyncio.create_task(ticker(stop, gaps))
+        started = time.perf_counter()
+        await asyncio.gather(*(verify() for _ in range(logins)))
+        seconds = time.perf_counter() - started
+        stop.set()
+        await tick
+        print(
+            f"{label:<22} {logins / seconds:8.1f} logins/s"
+            f"   worst loop stall {max(gaps, default=0) * 1000:7.1f} ms"
+        )
+
+    async def inline():
+        verify_hash("benchmark-password", stored)
+
+    async def pooled():
+        await verify_hash_async("benchmark-password", stored)
+
+    async def main():
+        rounds, workers = ENV_PROJECT.BCRYPT_ROUNDS, ENV_PROJECT.HASH_WORKERS
+        print(f"bcrypt rounds={rounds}, pool={workers}")
+        await run("on the event loop", inline)
+        await run("on the hash pool", pooled)
+
+    asyncio.run(main())
@@ -1,13 +1,18 @@
-import json
+import atexit
+import os
+import queue
+import random
 import sys
+import threading
+
+import orjson
 
 from app.Config import ENV_PROJECT
 
-LOG_FILE_PATH = "log.txt"
+LOG_FILE_PATH = ENV_PROJECT.LOG_FILE_PATH
 
 
-def loguru_sink_serializer(message):
-    record = message.record
+def simplify_record(record) -> dict:
     simplified = {
         "@timestamp": f"{record['time'].strftime('%Y-%m-%dT%H:%M:%S.%fZ')[:-4]}Z",
         "level": record["level"].name,
@@ -28,7 +33,169 @@ def loguru_sink_serializer(message):
             simplified["spanId"] = record["extra"]["extra"]["spanId"]
         if "query" in record["extra"]["extra"]:
             simplified["query"] = record["extra"]["extra"]["query"]
-    serialized = json.dumps(simplified)
-    print(serialized, file=sys.stderr, end="\n")
-    with open(LOG_FILE_PATH, "a") as log_file:
-        log_file.write(json.dumps(serialized) + "\n")
+    return simplified
+
+
+class BatchedLogSink:
+    """
+    Loguru sink that only hands records to a queue; a background thread
+    serializes them once with orjson and writes them in batches to stderr and
+    to a log file it keeps open, rotating the file by size.
+
+    Records bound with `access=True` (the per-request log) are kept with
+    probability `access_sample_rate`; everything else is always written.
+
+    At most `max_queued` records wait for the writer; past that new records are
+    dropped and counted, rather than growing memory while the disk is stuck.
+    A record that cannot be serialized, or a failed write / rotation, is
+    reported on the real stderr and the writer keeps draining.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int,
+        backups: int,
+        access_sample_rate: float = 1.0,
+        flush_interval: float = 0.5,
+        batch_size: int = 512,
+        max_queued: int = 100_000,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.access_sample_rate = access_sample_rate
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._dropped = 0
+        self._file = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def __call__(self, message):
+        record = message.record
+        if record["extra"].get("access") and record["level"].no < 30:
+            if random.random() >= self.access_sample_rate:
+                return
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(simplify_record(record))
+        except queue.Full:
+            self._dropped += 1
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="log-writer", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            try:
+                self._queue.put(None, timeout=5)
+            except queue.Full:
+                pass
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    def _run(self):
+        self._open()
+        running = True
+        while running:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in batch:
+                running = False
+                batch = [record for record in batch if record is not None]
+            if self._dropped:
+                dropped, self._dropped = self._dropped, 0
+                self._report(f"log queue full, dropped {dropped} records")
+            payload = b"".join(self._serialize(record) for record in batch)
+            if payload:
+                self._write(payload)
+        if self._file is not None:
+            self._file.close()
+
+    def _serialize(self, record: dict) -> bytes:
+        try:
+            return orjson.dumps(record, default=str) + b"\n"
+        except Exception as e:
+            self._report(f"unserializable log record dropped: {e!r}")
+            return b""
+
+    def _write(self, payload: bytes):
+        try:
+            sys.stderr.buffer.write(payload)
+            sys.stderr.flush()
+        except (AttributeError, ValueError):
+            sys.stderr.write(payload.decode())
+        except OSError:
+            pass
+
+        try:
+            if self._file is None or self._file.closed:
+                self._open()
+            self._file.write(payload)
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except Exception as e:
+            self._report(f"log file write failed: {e!r}")
+
+    @staticmethod
+    def _report(message: str):
+        """Problems of the writer itself, straight to the process' stderr."""
+        try:
+            sys.__stderr__.write(f"log-writer: {message}\n")
+            sys.__stderr__.flush()
+        except Exception:
+            pass
+
+    def _open(self):
+        try:
+            self._file = open(self.path, "ab", buffering=1024 * 1024)
+        except OSError as e:
+            self._file = None
+            self._report(f"cannot open {self.path}: {e!r}")
+
+    def _rotate(self):
+        """log.txt -> log.txt.1 -> ... -> log.txt.<backups>, oldest dropped."""
+        self._file.close()
+        try:
+            for index in range(self.backups - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            if self.backups > 0:
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.remove(self.path)
+        finally:
+            # Keep writing (to the unrotated file if the renames failed)
+            self._open()
+
+
+log_sink = BatchedLogSink(
+    LOG_FILE_PATH,
+    max_bytes=ENV_PROJECT.LOG_MAX_MB * 1024 * 1024,
+    backups=ENV_PROJECT.LOG_BACKUPS,
+    access_sample_rate=ENV_PROJECT.ACCESS_LOG_SAMPLE_RATE,
+    max_queued=ENV_PROJECT.LOG_QUEUE_SIZE,
+)
+atexit.register(log_sink.stop)
@@ -2,14 +2,19 @@
                                                   EMAILER MODULE
 ------------------------------------------------------------------------------------------------------------------------"""
 
+import asyncio
 import smtplib
 import ssl
+import time
+
+from loguru import logger
 
 # Email Dependencies
 from email.message import EmailMessage
 
 # Environment Variables Dependencies
 from app.Config import ENV_PROJECT
+from app.database.repositories.mailOutboxRepo import mail_outbox_repo
 from app.utils.templates.parser import Template
 
 
@@ -41,28 +46,20 @@ class Emailer:
 
     # ------------------------------------------------------------------------------------------------------------
 
-    def send(
+    def compose(
         self,
         subject,
         email,
         content,
-    ) -> None:
+    ) -> EmailMessage:
         """
-        send
+        compose
         ------
 
-        Sends Email to Clients.
-
-        ATTRIBUTES
-        ----------
-        - subject
-        - email
-        - content
+        Builds the html Email Message.
 
         """
 
-        # Initialise Message & SSL Context
-        ssl_context = ssl.create_default_context()
         msg = EmailMessage()
 
         # Email Constructor
@@ -73,19 +70,195 @@ class Emailer:
             content,
             subtype="html",
         )
+        return msg
 
-        # Send Mail
-        with smtplib.SMTP_SSL(
+    # ------------------------------------------------------------------------------------------------------------
+
+    def connect(self) -> smtplib.SMTP_SSL:
+        """
+        connect
+        ------
+
+        Opens and authenticates an SMTP session that can send many messages.
+
+        """
+
+        # Initialise SSL Context
+        ssl_context = ssl.create_default_context()
+
+        smtp = smtplib.SMTP_SSL(
             self.MAIL_SERVER,
             self.PORT,
             context=ssl_context,
-        ) as smtp:
-            smtp.login(
-                self.EMAIL_ADDRESS,
-                self.EMAIL_PASSWORD,
-            )
-            smtp.send_message(msg)
+        )
+        smtp.login(
+            self.EMAIL_ADDRESS,
+            self.EMAIL_PASSWORD,
+        )
+        return smtp
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    def send(
+        self,
+        subject,
+        email,
+        content,
+    ) -> None:
+        """
+        send
+        ------
+
+        Sends Email to Clients on a one-off connection. Request handlers should
+        use `mail_queue.enqueue` instead, which does not block the event loop.
+
+        ATTRIBUTES
+        ----------
+        - subject
+        - email
+        - content
+
+        """
+
+        # Send Mail
+        with self.connect() as smtp:
+            smtp.send_message(self.compose(subject, email, content))
+
+
+class MailQueue:
+    """
+    MAIL QUEUE
+    ----------
+    Durable outbound mail queue (MailOutbox collection) drained by background
+    workers. Each worker keeps its SMTP session open between batches, retries
+    failed messages with exponential backoff and drops duplicates still queued.
+
+    METHODS
+    -------
+    - enqueue( subject, email, content, dedup_key )
+    - start()
+    - stop()
+
+    """
+
+    IDLE_TIMEOUT = 60  # seconds an unused SMTP session is kept open
+    POLL_INTERVAL = 5  # seconds between checks for retries that became due
+    MAX_BACKOFF = 60  # seconds, longest wait after a worker error
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    def __init__(
+        self, emailer: Emailer, workers: int, batch_size: int, max_attempts: int
+    ):
+        self.emailer = emailer
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    async def enqueue(self, subject, email, content, dedup_key=None) -> None:
+        """Store the message and return; a worker sends it in the background."""
+        await mail_outbox_repo.enqueue(subject, email, content, dedup_key)
+        self._wakeup.set()
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    async def _work(self) -> None:
+        smtp = None
+        idle_since = time.monotonic()
+        backoff = 1
+        try:
+            while True:
+                try:
+                    batch = await mail_outbox_repo.claim(self.batch_size)
+                    if not batch:
+                        idle = time.monotonic() - idle_since
+                        if smtp is not None and idle > self.IDLE_TIMEOUT:
+                            await asyncio.to_thread(self._close, smtp)
+                            smtp = None
+                        self._wakeup.clear()
+                        try:
+                            await asyncio.wait_for(
+                                self._wakeup.wait(), self.POLL_INTERVAL
+                            )
+                        except asyncio.TimeoutError:
+                            pass
+                        backoff = 1
+                        continue
+
+                    for mail in batch:
+                        try:
+                            smtp = await asyncio.to_thread(self._deliver, smtp, mail)
+                            await mail_outbox_repo.mark_sent(mail["_id"])
+                        except Exception as e:
+                            logger.warning(f"Mail to {mail['email']} failed: {e}")
+                            if smtp is not None:
+                                await asyncio.to_thread(self._close, smtp)
+                                smtp = None
+                            await mail_outbox_repo.mark_failed(
+                                mail, str(e), self.max_attempts
+                            )
+                    idle_since = time.monotonic()
+                    backoff = 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # e.g. the database is unreachable; claimed rows that were
+                    # not marked are picked up again once their lock is stale
+                    logger.error(f"Mail worker error, retrying in {backoff}s: {e}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.MAX_BACKOFF)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if smtp is not None:
+                await asyncio.to_thread(self._close, smtp)
+
+    def _deliver(self, smtp, mail: dict):
+        """Send one message, (re)connecting when the session is missing or dropped."""
+        message = self.emailer.compose(mail["subject"], mail["email"], mail["content"])
+        if smtp is not None:
+            try:
+                smtp.send_message(message)
+                return smtp
+            except smtplib.SMTPServerDisconnected:
+                pass
+
+        smtp = self.emailer.connect()
+        try:
+            smtp.send_message(message)
+        except Exception:
+            # Not returned to the caller, so close it here
+            self._close(smtp)
+            raise
+        return smtp
 
+    @staticmethod
+    def _close(smtp) -> None:
+        try:
+            smtp.quit()
+        except Exception:
+            pass
 
 template = Template(ENV_PROJECT.FRONTEND_DOMAIN, ENV_PROJECT.ENV)
 mail = Emailer()
+mail_queue = MailQueue(
+    mail,
+    workers=ENV_PROJECT.MAIL_WORKERS,
+    batch_size=ENV_PROJECT.MAIL_BATCH_SIZE,
+    max_attempts=ENV_PROJECT.MAIL_MAX_ATTEMPTS,
+)
@@ -0,0 +1,33 @@
+"""------------------------------------------------------------------------------------------------------------------------
+                                                    OCR WORKER MODULE
+------------------------------------------------------------------------------------------------------------------------
+Functions executed inside the extraction process pool. They take a file path and
+return plain strings, and this module imports nothing from the app beyond the
+OCR libraries, so worker processes start fast and never touch Mongo or Gemini.
+"""
+
+from typing import List
+
+import cv2
+import fitz
+import numpy as np
+import pytesseract
+from pdf2image import convert_from_path
+
+pytesseract.pytesseract.tesseract_cmd = r"C:/Program Files/Tesseract-OCR/tesseract.exe"
+
+
+def page_texts(path: str) -> List[str]:
+    """Selectable text of every page, empty strings for scanned pages."""
+    with fitz.open(path) as docs:
+        return [page.get_text("text") for page in docs]
+
+
+def ocr_page(path: str, page_number: int) -> str:
+    """Rasterise and OCR a single (1-based) page."""
+    images = convert_from_path(path, first_page=page_number, last_page=page_number)
+    text = ""
+    for image in images:
+        grey = cv2.cvtColor(np.array(image), cv2.COLOR_BGR2GRAY)
+        text += pytesseract.image_to_string(grey)
+    return text
@@ -0,0 +1,157 @@
+"""------------------------------------------------------------------------------------------------------------------------
+                                                    PDF CACHE MODULE
+------------------------------------------------------------------------------------------------------------------------
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+import aiofiles
+from loguru import logger
+
+from app.Config import ENV_PROJECT
+
+
+class PdfCache:
+    """
+    PDF CACHE
+    ---------
+    Content addressed store of rendered voucher PDFs on local disk.
+
+    Files live at <directory>/<company_id>/<voucher_id>/<digest>.pdf, where the
+    digest hashes everything the PDF is rendered from (template variables and
+    template version), so a changed voucher / party / company can never be
+    served a stale file. Least recently used files are evicted once the store
+    grows past `max_bytes`.
+
+    Filesystem calls other than the aiofiles reads / writes (directory scans,
+    makedirs, renames, removals) run in a worker thread, off the event loop.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index: Optional["OrderedDict[str, int]"] = None
+        self._index_lock = asyncio.Lock()
+        self._size = 0
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def digest(*parts) -> str:
+        payload = json.dumps(parts, sort_keys=True, default=str).encode()
+        return hashlib.sha256(payload).hexdigest()
+
+    def _path(self, company_id: str, voucher_id: str, digest: str) -> str:
+        return os.path.join(self.directory, company_id, voucher_id, f"{digest}.pdf")
+
+    def _scan(self) -> "OrderedDict[str, int]":
+        """Every cached file with its size, oldest access first."""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_atime, path, stat.st_size))
+        return OrderedDict((path, size) for _, path, size in sorted(entries))
+
+    async def _load_index(self) -> "OrderedDict[str, int]":
+        """Scan the directory once per process."""
+        if self._index is None:
+            async with self._index_lock:
+                if self._index is None:
+                    index = await asyncio.to_thread(self._scan)
+                    self._size = sum(index.values())
+                    self._index = index
+        return self._index
+
+    async def _forget(self, prefix: str):
+        index = await self._load_index()
+        for path in [path for path in index if path.startswith(prefix)]:
+            self._size -= index.pop(path)
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    async def _evict(self):
+        index = await self._load_index()
+        evicted = []
+        while self._size > self.max_bytes and index:
+            path, size = index.popitem(last=False)
+            self._size -= size
+            evicted.append(path)
+        if evicted:
+            await asyncio.to_thread(self._remove, evicted)
+
+    # ------------------------------------------------------------------------------------------------------------
+
+    async def get(self, company_id: str, voucher_id: str, digest: str) -> Optional[bytes]:
+        path = self._path(company_id, voucher_id, digest)
+        index = await self._load_index()
+        try:
+            async with aiofiles.open(path, "rb") as f:
+                content = await f.read()
+        except OSError:
+            return None
+
+        if path in index:
+            index.move_to_end(path)
+        else:
+            index[path] = len(content)
+            self._size += len(content)
+        return content
+
+    async def put(self, company_id: str, voucher_id: str, digest: str, content: bytes):
+        path = self._path(company_id, voucher_id, digest)
+        index = await self._load_index()
+        try:
+            await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+            # Write aside and rename so readers never see a partial file; the
+            # name is unique per write, concurrent renders of one digest included
+            temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            async with aiofiles.open(temp_path, "wb") as f:
+                await f.write(content)
+            await asyncio.to_thread(os.replace, temp_path, path)
+        except OSError as e:
+            logger.warning(f"PDF cache write failed: {e}")
+            return
+
+        self._size += len(content) - index.pop(path, 0)
+        index[path] = len(content)
+        await self._evict()
+
+    async def invalidate_voucher(self, company_id: str, voucher_id: str):
+        path = os.path.join(self.directory, company_id, voucher_id)
+        await self._forget(path + os.sep)
+        await asyncio.to_thread(shutil.rmtree, path, ignore_errors=True)
+
+    async def invalidate_company(self, company_id: str):
+        path = os.path.join(self.directory, company_id)
+        await self._forget(path + os.sep)
+        await asyncio.to_thread(shutil.rmtree, path, ignore_errors=True)
+
+    async def metrics(self) -> dict:
+        index = await self._load_index()
+        return {"files": len(index), "bytes": self._size, "max_bytes": self.max_bytes}
+
+
+pdf_cache = PdfCache(
+    directory=ENV_PROJECT.PDF_CACHE_DIR
+    or os.path.join(tempfile.gettempdir(), "vyapar-pdf-cache"),
+    max_bytes=ENV_PROJECT.PDF_CACHE_MAX_MB * 1024 * 1024,
+)
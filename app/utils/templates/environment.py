@@ -0,0 +1,85 @@
+"""------------------------------------------------------------------------------------------------------------------------
+                                                  PDF TEMPLATE ENVIRONMENT
+------------------------------------------------------------------------------------------------------------------------
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+
+from app.Config import ENV_PROJECT
+
+TEMPLATE_DIRECTORY = "app/utils/templates"
+
+# A company can override any of these with companies/<company_id>/<name>
+PDF_TEMPLATES = [
+    "template.html",
+    "tax_sale_template.html",
+    "tax_purchase_template.html",
+    "reciept.html",
+    "payment.html",
+]
+
+environment = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIRECTORY),
+    bytecode_cache=FileSystemBytecodeCache(),
+    # Templates are only re-checked on disk while developing
+    auto_reload=ENV_PROJECT.ENV == "dev",
+    cache_size=-1,
+)
+
+# (company_id, name) -> (expires at, template); least recently used first
+_resolved: "OrderedDict[Tuple[Optional[str], str], Tuple[float, Template]]"
+_resolved = OrderedDict()
+RESOLVED_MAX_ENTRIES = 4096
+
+
+def get_template(name: str, company_id: Optional[str] = None) -> Template:
+    """
+    Compiled template `name`, preferring the company's own copy when it has one.
+    Outside of dev the lookup is memoised per (company_id, name) for
+    PDF_TEMPLATE_TTL_SECONDS, so an override added or edited on disk is used
+    once the entry expires, without a restart.
+    """
+    key = (company_id, name)
+    if not environment.auto_reload:
+        entry = _resolved.get(key)
+        if entry is not None and entry[0] >= time.monotonic():
+            _resolved.move_to_end(key)
+            return entry[1]
+
+    names = [f"companies/{company_id}/{name}", name] if company_id else [name]
+    template = environment.select_template(names)
+    if not template.is_up_to_date:
+        # Compiled copy of a file changed on disk since (auto_reload is off)
+        environment.cache.clear()
+        template = environment.select_template(names)
+
+    _resolved[key] = (time.monotonic() + ENV_PROJECT.PDF_TEMPLATE_TTL_SECONDS, template)
+    _resolved.move_to_end(key)
+    while len(_resolved) > RESOLVED_MAX_ENTRIES:
+        _resolved.popitem(last=False)
+    return template
+
+
+def forget_company(company_id: str):
+    """Drop the memoised templates of a company, e.g. after writing an override."""
+    for key in [key for key in _resolved if key[0] == company_id]:
+        del _resolved[key]
+
+
+def template_version(template: Template) -> str:
+    """Identifies the template source a render used (file and modification time)."""
+    try:
+        return f"{template.name}:{os.path.getmtime(template.filename)}"
+    except (OSError, TypeError):
+        return template.name
+
+
+def precompile():
+    """Compile every PDF template once so the first print does not pay for it."""
+    for name in PDF_TEMPLATES:
+        environment.get_template(name)
@@ -3,9 +3,14 @@
 ------------------------------------------------------------------------------------------------------------------------
 """
 
+import os
+import re
 from datetime import datetime
 from app.Config import ENV_PROJECT
 
+# "{name}" placeholders; the capture group keeps the name in re.split output
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
 
 class Template:
     """
@@ -25,6 +30,8 @@ class Template:
 
     METHODS
     -------
+    - load( path )
+    - precompile()
     - render_template( path, parser )
     - Challenge( link, agenda )
     - Credentials( Merchant_ID, Merchant_PIN, API_KEY, agenda )
@@ -46,6 +53,44 @@ class Template:
         self.transaction_created = self.directory + "transaction_created.html"
         self.forgot_password = self.directory + "forgot_password.html"
         self.subdomain = "dev" if env == "dev" else ""
+        # compiled templates, keyed by path
+        self.compiled = {}
+
+    # --------------------------------------------------------------------------------------------------------------------------
+
+    def load(self, path):
+        """
+        LOAD
+        ----
+        Reads the html file at *path* once and compiles it into segments:
+        even indexes hold literal html, odd indexes placeholder names.
+        ...
+        """
+
+        segments = self.compiled.get(path)
+        if segments is None:
+            with open(
+                path,
+                "r",
+                encoding="utf8",
+            ) as html:
+                segments = PLACEHOLDER.split(html.read())
+            self.compiled[path] = segments
+        return segments
+
+    # --------------------------------------------------------------------------------------------------------------------------
+
+    def precompile(self):
+        """
+        PRECOMPILE
+        ----------
+        Loads every mail template up front, called once at startup.
+        ...
+        """
+
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".html"):
+                self.load(self.directory + name)
 
     # --------------------------------------------------------------------------------------------------------------------------
 
@@ -54,30 +99,17 @@ class Template:
         RENDER_TEMPLATE
         ---------------
         Renders the html file from *path* by replacing *parser* arguments,
-        and returns the rendered string.
+        and returns the rendered string. Placeholders without an argument are
+        left as they are.
         ...
         """
 
-        # Open html file
-        with open(
-            path,
-            "r",
-            encoding="utf8",
-        ) as html:
-            # Extract content
-            content = html.read()
-            # Replace parser arguments
-            for key in parser:
-                content = content.replace(
-                    "{" + key + "}",
-                    str(parser[key]),
-                )
-            # content = content.replace(
-            #     "{domain}",
-            #     self.domain,
-            # )
-            # Return content
-            return content
+        segments = self.load(path)
+        rendered = segments[:]
+        for index in range(1, len(segments), 2):
+            key = segments[index]
+            rendered[index] = str(parser[key]) if key in parser else "{" + key + "}"
+        return "".join(rendered)
 
     # --------------------------------------------------------------------------------------------------------------------------
 
@@ -256,3 +288,34 @@ class Template:
 """------------------------------------------------------------------------------------------------------------------------
                                                     TEMPLATE MODULE
 ------------------------------------------------------------------------------------------------------------------------"""
+
+
+if __name__ == "__main__":
+    # Render benchmark: python -m app.utils.templates.parser
+    import timeit
+
+    template = Template(ENV_PROJECT.FRONTEND_DOMAIN, ENV_PROJECT.ENV)
+    arguments = dict(
+        invoice_number="INV-0001",
+        invoice_date="2025-04-01",
+        customer_name="Customer",
+        total_amount=1000,
+        due_date="2025-04-30",
+        payment_status="Unpaid",
+    )
+
+    def file_read_and_replace():
+        with open(template.invoice_created, "r", encoding="utf8") as html:
+            content = html.read()
+        for key, value in {**arguments, "domain": template.domain}.items():
+            content = content.replace("{" + key + "}", str(value))
+        return content
+
+    template.precompile()
+    runs = 10000
+    for label, render in [
+        ("file read + str.replace", file_read_and_replace),
+        ("precompiled segments", lambda: template.InvoiceCreated(**arguments)),
+    ]:
+        seconds = timeit.timeit(render, number=runs)
+        print(f"{label:<24} {seconds / runs * 1e6:8.1f} us/render")
@@ -0,0 +1,24 @@
+"""
+Copy each voucher's date / type / number / party (and its user and company) onto
+its Accounting and Inventory rows, for rows written before these fields existed.
+
+Run from the project root:
+    python -m migration.backfill_entry_fields               # every company
+    python -m migration.backfill_entry_fields <company_id>  # a single company
+"""
+
+import asyncio
+import sys
+
+from app.database.repositories.voucharRepo import vouchar_repo
+
+
+async def run_migration(company_id: str = None):
+    copied = await vouchar_repo.backfill_entry_fields(company_id=company_id)
+    for collection, count in copied.items():
+        print(f"{collection}: {count} rows carry their voucher's fields")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_migration(sys.argv[1] if len(sys.argv) > 1 else None))
+    print("Entry field backfill finished.")
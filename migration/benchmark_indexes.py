@@ -0,0 +1,159 @@
+"""
+Measure what the declared repository indexes do for the voucher listing lookups.
+
+Seeds a scratch database (<MONGO_DATABASE>_index_benchmark) with synthetic
+Voucher / Accounting / Inventory rows, runs the Voucher -> Accounting / Inventory
+$lookup pipeline with no secondary indexes, applies the indexes the repositories
+declare and runs it again. The scratch database is dropped afterwards.
+
+Run from the project root:
+    python -m migration.benchmark_indexes                 # 20000 vouchers
+    python -m migration.benchmark_indexes <voucher_count>
+"""
+
+import asyncio
+import datetime
+import random
+import sys
+import time
+import uuid
+
+from app.Config import ENV_PROJECT
+from app.database import mongodb
+from app.database.repositories.accountingRepo import accounting_repo
+from app.database.repositories.InventoryRepo import inventory_repo
+from app.database.repositories.voucharRepo import vouchar_repo
+
+COMPANIES = 20
+RUNS = 5
+VOUCHER_TYPES = ["Sales", "Purchase", "Payment", "Receipt"]
+
+
+def seed_rows(voucher_count: int):
+    vouchers, accounting, inventory = [], [], []
+    start = datetime.date(2024, 4, 1)
+    for _ in range(voucher_count):
+        voucher_id = str(uuid.uuid4())
+        company = random.randrange(COMPANIES)
+        vouchers.append(
+            {
+                "_id": voucher_id,
+                "user_id": f"user-{company}",
+                "company_id": f"company-{company}",
+                "voucher_type": random.choice(VOUCHER_TYPES),
+                "voucher_number": str(len(vouchers) + 1),
+                "party_name": f"party-{random.randrange(200)}",
+                "date": str(start + datetime.timedelta(days=random.randrange(365))),
+            }
+        )
+        for index in range(2):
+            accounting.append(
+                {
+                    "_id": str(uuid.uuid4()),
+                    "vouchar_id": voucher_id,
+                    "ledger": f"ledger-{index}",
+                    "ledger_id": f"ledger-{company}-{index}",
+                    "amount": random.uniform(-1000, 1000),
+                    "order_index": index,
+                }
+            )
+        for index in range(3):
+            inventory.append(
+                {
+                    "_id": str(uuid.uuid4()),
+                    "vouchar_id": voucher_id,
+                    "item": f"item-{index}",
+                    "item_id": f"item-{company}-{random.randrange(50)}",
+                    "quantity": random.randint(1, 10),
+                    "rate": random.uniform(1, 100),
+                    "order_index": index,
+                }
+            )
+    return vouchers, accounting, inventory
+
+
+def listing_pipeline() -> list:
+    """The shape of VoucherRepo's listing: one company, newest first, entries joined."""
+    return [
+        {"$match": {"user_id": "user-0", "company_id": "company-0"}},
+        {"$sort": {"date": -1}},
+        {"$limit": 50},
+        {
+            "$lookup": {
+                "from": "Accounting",
+                "localField": "_id",
+                "foreignField": "vouchar_id",
+                "as": "accounting",
+            }
+        },
+        {
+            "$lookup": {
+                "from": "Inventory",
+                "localField": "_id",
+                "foreignField": "vouchar_id",
+                "as": "inventory",
+            }
+        },
+    ]
+
+
+def docs_examined(explain) -> int:
+    """Sum every totalDocsExamined in the explain output, $lookup stages included."""
+    if isinstance(explain, dict):
+        nested = sum(docs_examined(value) for value in explain.values())
+        return explain.get("totalDocsExamined", 0) + nested
+    if isinstance(explain, list):
+        return sum(docs_examined(value) for value in explain)
+    return 0
+
+
+async def measure(database) -> dict:
+    pipeline = listing_pipeline()
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        await database["Voucher"].aggregate(pipeline).to_list(None)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    explain = await database.command(
+        {
+            "explain": {"aggregate": "Voucher", "pipeline": pipeline, "cursor": {}},
+            "verbosity": "executionStats",
+        }
+    )
+    return {"best_ms": min(timings), "docs_examined": docs_examined(explain)}
+
+
+async def run_benchmark(voucher_count: int):
+    name = f"{ENV_PROJECT.MONGO_DATABASE}_index_benchmark"
+    database = mongodb.client[name]
+    await mongodb.client.drop_database(name)
+    try:
+        vouchers, accounting, inventory = seed_rows(voucher_count)
+        await database["Voucher"].insert_many(vouchers)
+        await database["Accounting"].insert_many(accounting)
+        await database["Inventory"].insert_many(inventory)
+        print(
+            f"Seeded {len(vouchers)} vouchers, {len(accounting)} accounting and "
+            f"{len(inventory)} inventory rows"
+        )
+
+        before = await measure(database)
+
+        for repository in (vouchar_repo, accounting_repo, inventory_repo):
+            await database[repository.collection_name].create_indexes(
+                repository.declared_indexes()
+            )
+
+        after = await measure(database)
+
+        print(f"{'':<14}{'best of ' + str(RUNS) + ' (ms)':>20}{'docs examined':>16}")
+        for label, result in (("no indexes", before), ("declared", after)):
+            print(f"{label:<14}{result['best_ms']:>20.1f}{result['docs_examined']:>16}")
+    finally:
+        await mongodb.client.drop_database(name)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
+    print("Index benchmark finished.")
@@ -0,0 +1,26 @@
+"""
+Rebuild the month-end BalanceSnapshot rows (stock items and ledgers) of every
+closed month. Reports build missing months on first use; this does it up front.
+Run it after migration.backfill_entry_fields, the snapshots read the dates the
+backfill copies onto Accounting / Inventory rows.
+
+Run from the project root:
+    python -m migration.build_balance_snapshots               # every company
+    python -m migration.build_balance_snapshots <company_id>  # a single company
+"""
+
+import asyncio
+import sys
+
+from app.database.repositories.balanceSnapshotRepo import balance_snapshot_repo
+
+
+async def run_migration(company_id: str = None):
+    built = await balance_snapshot_repo.rebuild(company_id=company_id)
+    for company, month in built.items():
+        print(f"{company}: snapshots valid through {month or '-'}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_migration(sys.argv[1] if len(sys.argv) > 1 else None))
+    print("Balance snapshot build finished.")
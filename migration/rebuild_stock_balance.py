@@ -0,0 +1,25 @@
+"""
+Rebuild the materialized StockBalance collection from Inventory and Voucher.
+
+Run from the project root:
+    python -m migration.rebuild_stock_balance               # every company
+    python -m migration.rebuild_stock_balance <company_id>  # a single company
+"""
+
+import asyncio
+import sys
+
+from app.database.repositories.stockBalanceRepo import stock_balance_repo
+
+
+async def run_migration(company_id: str = None):
+    result = await stock_balance_repo.rebuild(company_id=company_id)
+    print(
+        f"Rebuilt {result['rebuilt']} stock balances, "
+        f"removed {result['removed']} stale rows"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(run_migration(sys.argv[1] if len(sys.argv) > 1 else None))
+    print("Stock balance rebuild finished.")
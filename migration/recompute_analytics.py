@@ -0,0 +1,29 @@
+"""
+Recompute the AnalyticsDaily rollup buckets from Voucher and Inventory.
+
+Buckets keep sold quantities per item, priced from StockBalance when the
+dashboards read them (run `migration.rebuild_stock_balance` if that is out of
+date). Recomputing also drops the COGS / gross profit older buckets stored.
+
+Run from the project root:
+    python -m migration.recompute_analytics               # every company
+    python -m migration.recompute_analytics <company_id>  # a single company
+"""
+
+import asyncio
+import sys
+
+from app.database.repositories.analyticsRollupRepo import analytics_rollup_repo
+
+
+async def run_migration(company_id: str = None):
+    result = await analytics_rollup_repo.recompute(company_id=company_id)
+    print(
+        f"Recomputed {result['buckets']} daily buckets, "
+        f"removed {result['removed']} stale buckets"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(run_migration(sys.argv[1] if len(sys.argv) > 1 else None))
+    print("Analytics recompute finished.")